@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alias_game.settings")
 
 application = get_asgi_application()
+
+# Периодические задачи (сборщик отключившихся игроков, архив) без отдельного воркера run_tasks
+from game.background import start_periodic_scheduler
+start_periodic_scheduler()
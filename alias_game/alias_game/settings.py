@@ -1,9 +1,7 @@
 import os
-import environ
 import dj_database_url
 from pathlib import Path
 from dotenv import load_dotenv
-import whitenoise
 
 load_dotenv()
 
@@ -32,9 +30,16 @@ if DEBUG:
     # Объединяем уникальными элементами
     CSRF_TRUSTED_ORIGINS = list(dict.fromkeys((CSRF_TRUSTED_ORIGINS or []) + dev_origins))
 
+# Админка нужна не каждому воркеру: без нее быстрее холодный старт
+ADMIN_ENABLED = os.getenv('ADMIN_ENABLED', 'True').lower() in ('true', '1', 't', 'yes', 'y')
+# Списки админки: таблицы больше порога считаются по статистике БД, а не COUNT(*);
+# отфильтрованные списки считаются не дальше лимита
+ADMIN_EXACT_COUNT_THRESHOLD = int(os.getenv('ADMIN_EXACT_COUNT_THRESHOLD', 10000))
+ADMIN_FILTERED_COUNT_LIMIT = int(os.getenv('ADMIN_FILTERED_COUNT_LIMIT', 10000))
+
 # Приложения
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    *(['django.contrib.admin'] if ADMIN_ENABLED else []),
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -46,12 +51,18 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'game.responses.JsonCompressionMiddleware',
+    'game.traffic.TrafficCaptureMiddleware',  # Видит несжатые ответы; выключена - удаляется из цепочки
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
+    # После CSRF: повтор сохраненного ответа и лимиты не обходят проверку токена
+    'game.middleware.IdempotencyMiddleware',
+    'game.middleware.RateLimitMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'game.profiling.ProfilingMiddleware',  # Последней: профилирует в основном view; выключена - удаляется из цепочки
 ]
 
 ROOT_URLCONF = 'alias_game.urls'
@@ -83,14 +94,71 @@ DATABASES = {
     )
 }
 
-# Кэш Redis
+# SQLite: транзакция сразу берет блокировку записи. С режимом по умолчанию (DEFERRED) две
+# транзакции, прочитавшие комнату, не могут обе перейти к записи, и одна сразу падает
+# с "database is locked"; с IMMEDIATE вторая ждет первую (до timeout секунд)
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {}).setdefault('transaction_mode', 'IMMEDIATE')
+
+# Пул соединений вместо постоянного соединения на каждый поток (ASGI, многопоточный сервер).
+# PostgreSQL - встроенный пул Django (нужен psycopg[pool]), MySQL и SQLite - game.dbpool.
+DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'False').lower() in ('true', '1', 't', 'yes', 'y')
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 2))  # Только PostgreSQL
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))  # На процесс; примерно число потоков, одновременно идущих в БД
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))  # Сколько ждать свободное соединение, с
+DB_POOL_MAX_LIFETIME = int(os.getenv('DB_POOL_MAX_LIFETIME', 600))  # Меньше wait_timeout сервера MySQL
+DB_POOL_SLOW_CHECKOUT_MS = int(os.getenv('DB_POOL_SLOW_CHECKOUT_MS', 200))  # Ожидание дольше - в лог
+
+if DB_POOL_ENABLED:
+    _db = DATABASES['default']
+    _db['CONN_MAX_AGE'] = 0  # Соединение возвращается в пул в конце каждого запроса
+    if _db['ENGINE'] == 'django.db.backends.postgresql':
+        _db.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_lifetime': DB_POOL_MAX_LIFETIME,
+        }
+    elif _db['ENGINE'] in ('django.db.backends.mysql', 'django.db.backends.sqlite3'):
+        _db['ENGINE'] = 'game.backends.' + _db['ENGINE'].rsplit('.', 1)[1]
+        _db.setdefault('OPTIONS', {})['pool'] = {
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_lifetime': DB_POOL_MAX_LIFETIME,
+            'slow_checkout_ms': DB_POOL_SLOW_CHECKOUT_MS,
+        }
+
+# Кэш. С REDIS_URL (redis://host:6379/0) - Redis, общий для всех воркеров: лимиты запросов,
+# single-flight снимков и состояние хода действуют на весь сервер. Без него - LocMem для
+# разработки и тестов: у каждого процесса свой кэш, и лимиты считаются в пределах процесса
+REDIS_URL = os.getenv('REDIS_URL', '')
 CACHES = {
     'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    # Ответы на запросы с ключом идемпотентности. С REDIS_URL - общий для всех воркеров,
+    # иначе в памяти процесса: повтор ловится только тем же воркером
+    'idempotency': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'idempotency',
+        'TIMEOUT': 120,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'idempotency',
+        'TIMEOUT': 120,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
 
+IDEMPOTENCY_CACHE = 'idempotency'
+IDEMPOTENCY_TTL_SECONDS = 120  # Сколько помнить ответ на ключ
+IDEMPOTENCY_LOCK_SECONDS = 30  # Сколько ключ занят выполняющимся запросом
+
 # Валидация паролей
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -140,8 +208,115 @@ WHITENOISE_MAX_AGE = 31536000
 
 ROUND_DURATION_SECONDS = 60 # 60 секунд на раунд
 
+# Интервалы опроса состояния (мс), которые сервер подсказывает клиенту в next_poll_ms
+POLL_INTERVALS_MS = {
+    'round_ending': 1000,     # последние секунды раунда
+    'round_active': 2000,     # идет раунд
+    'turn_waiting': 3000,     # ждем, пока объясняющий нажмет "СТАРТ"
+    'lobby_active': 3000,     # в лобби недавно что-то происходило
+    'lobby_idle': 10000,      # в лобби давно тихо
+    'finished': 30000,        # игра завершена
+}
+POLL_ROUND_ENDING_SECONDS = 5  # За сколько секунд до конца раунда опрашивать чаще
+POLL_IDLE_AFTER_SECONDS = 60   # Через сколько секунд без активности комната считается простаивающей
+
+# Лимиты комнат. Большие комнаты (режим мероприятий) получают сокращенные составы команд в состоянии
+MAX_PLAYERS_PER_ROOM = 20
+MAX_TEAMS_PER_ROOM = 4
+LARGE_ROOM_MAX_PLAYERS = int(os.getenv('LARGE_ROOM_MAX_PLAYERS', 300))
+LARGE_ROOM_MAX_TEAMS = int(os.getenv('LARGE_ROOM_MAX_TEAMS', 20))
+ROSTER_PREVIEW_SIZE = 8   # Сколько игроков каждой команды отдавать в состоянии большой комнаты
+ROSTER_PAGE_SIZE = 50     # Размер страницы полного состава команды
+
+# Фоновая очистка присутствия (команда reap_players)
+PRESENCE_TIMEOUT_MINUTES = 5          # Игрок без запросов дольше этого считается отключившимся
+PRESENCE_REAP_INTERVAL_SECONDS = 30   # Как часто запускать очистку
+PLAYER_TOUCH_INTERVAL_SECONDS = 30    # Как часто запросы с токеном обновляют last_seen игрока
+INACTIVE_ROOM_PLAYERS_HOURS = 2       # Игроки комнат без активности дольше этого удаляются
+
+# Сколько нажатий объясняющего можно прислать одним пакетом
+MAX_BATCH_ACTIONS = 20
+
+# Пользовательские наборы слов
+WORD_PACK_MIN_WORDS = 10
+WORD_PACK_MAX_WORDS = 50000
+WORD_PACK_MAX_BYTES = 2 * 1024 * 1024
+WORD_PACK_CACHE_SIZE = 64  # Сколько скомпилированных наборов держать в памяти процесса (LRU)
+
+# Бюджет холодного старта в мс (manage.py profile_startup --check)
+STARTUP_BUDGET_MS = {
+    'web': int(os.getenv('STARTUP_BUDGET_WEB_MS', 1500)),
+    'bot': int(os.getenv('STARTUP_BUDGET_BOT_MS', 1000)),
+}
+
+# Фоновые задачи (game.background): 'thread' - пул потоков в процессе, 'database' - очередь в БД
+# для нескольких воркеров (нужен запущенный manage.py run_tasks), 'immediate' - синхронно
+BACKGROUND_TASKS_BACKEND = os.getenv('BACKGROUND_TASKS_BACKEND', 'thread')
+BACKGROUND_TASKS_THREADS = int(os.getenv('BACKGROUND_TASKS_THREADS', 4))
+BACKGROUND_TASK_MODULES = ['game.tasks']
+# Аренда задачи из очереди в БД: 'running' дольше этого срока считается брошенной и забирается снова
+BACKGROUND_TASK_LEASE_SECONDS = int(os.getenv('BACKGROUND_TASK_LEASE_SECONDS', 600))
+# Ставить периодические задачи из веб-процесса (wsgi/asgi). По умолчанию - для бэкенда 'thread'
+BACKGROUND_PERIODIC_IN_PROCESS = os.getenv(
+    'BACKGROUND_PERIODIC_IN_PROCESS', str(BACKGROUND_TASKS_BACKEND == 'thread')).lower() in ('true', '1', 't', 'yes', 'y')
+# Периодические задачи: имя задачи -> интервал в секундах (сроки хранятся в БД). Их ставит воркер
+# run_tasks, а без него (бэкенд 'thread') - поток веб-процесса, см. BACKGROUND_PERIODIC_IN_PROCESS
+BACKGROUND_PERIODIC_TASKS = {
+    'game.sweep_presence': PRESENCE_REAP_INTERVAL_SECONDS,
+    'game.archive_finished_rooms': 600,
+}
+
+# Сколько секунд зрители получают один и тот же сериализованный снимок комнаты
+SPECTATOR_SNAPSHOT_TTL = 1
+
+# Сжатие JSON-ответов API (brotli, если установлен пакет brotli, иначе gzip)
+JSON_COMPRESS_MIN_BYTES = 1024
+JSON_BROTLI_QUALITY = 4  # Быстрые уровни: ответ сжимается на каждый опрос
+
+# Подписанный токен игрока (выдается при входе в комнату) и кэш состояния хода
+PLAYER_TOKEN_MAX_AGE = 12 * 60 * 60
+TURN_STATE_TTL = 60
+
+# Снимок состояния комнаты для игроков, ключ - комната и ее версия (single-flight)
+ROOM_SNAPSHOT_TTL = 1  # Составы меняются без сохранения Room, поэтому снимок живет недолго
+SINGLE_FLIGHT_WAIT_SECONDS = 2  # Сколько ждать чужого вычисления, прежде чем считать самим
+SINGLE_FLIGHT_POLL_SECONDS = 0.02
+
+# Ограничение частоты запросов к API (token bucket на пользователя и комнату).
+# capacity - размер всплеска, refill_per_second - устойчивая скорость.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() in ('true', '1', 't', 'yes', 'y')
+RATE_LIMITS = {
+    'get_game_state': {'capacity': 10, 'refill_per_second': 2},
+    'guess_word': {'capacity': 10, 'refill_per_second': 3},
+    'skip_word': {'capacity': 10, 'refill_per_second': 3},
+    'word_actions': {'capacity': 10, 'refill_per_second': 3},
+    'end_round_timer': {'capacity': 3, 'refill_per_second': 0.2},
+    'start_round': {'capacity': 3, 'refill_per_second': 0.5},
+    'start_game': {'capacity': 3, 'refill_per_second': 0.5},
+    'reset_game': {'capacity': 3, 'refill_per_second': 0.2},
+    'select_team': {'capacity': 5, 'refill_per_second': 1},
+    'update_team_name': {'capacity': 5, 'refill_per_second': 1},
+}
+
 # settings.py - добавьте в конец
 
+# Профилирование выборки запросов (game.profiling, отчет - manage.py profile_report)
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() in ('true', '1', 't', 'yes', 'y')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0.01))  # Доля случайных запросов
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')  # Заголовок X-Profile-Token с этим значением профилирует запрос
+PROFILING_MODE = os.getenv('PROFILING_MODE', 'sampler')  # 'sampler' (свернутые стеки) или 'cprofile' (pstats)
+PROFILING_SAMPLER_INTERVAL_MS = 5
+PROFILING_DIR = Path(os.getenv('PROFILING_DIR', BASE_DIR / 'logs' / 'profiles'))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', 500))
+
+# Запись трафика для воспроизведения нагрузки (game.traffic, воспроизведение - manage.py replay_traffic)
+TRAFFIC_CAPTURE_ENABLED = os.getenv('TRAFFIC_CAPTURE_ENABLED', 'False').lower() in ('true', '1', 't', 'yes', 'y')
+TRAFFIC_CAPTURE_ROOM_RATE = float(os.getenv('TRAFFIC_CAPTURE_ROOM_RATE', 1.0))  # Доля комнат, записываемых целиком
+TRAFFIC_CAPTURE_SALT = os.getenv('TRAFFIC_CAPTURE_SALT', '')  # Ключ псевдонимов; по умолчанию SECRET_KEY
+TRAFFIC_CAPTURE_DIR = Path(os.getenv('TRAFFIC_CAPTURE_DIR', BASE_DIR / 'logs' / 'traffic'))
+TRAFFIC_CAPTURE_MAX_BYTES = 50 * 1024 * 1024
+TRAFFIC_CAPTURE_BACKUP_COUNT = 10
+
 LOGGING = {
         'version': 1,
         'disable_existing_loggers': False,
@@ -150,21 +325,18 @@ LOGGING = {
                 'class': 'logging.StreamHandler',
             },
             'file': {
-                'class': 'logging.handlers.RotatingFileHandler',
+                # Запись в файл и ротация идут в отдельном потоке, строки в формате JSON
+                'class': 'game.log_queue.AsyncRotatingFileHandler',
                 'filename': 'logs/alias_game.log',
                 'maxBytes': 1024 * 1024 * 5,  # 5 MB
                 'backupCount': 5,
-                'formatter': 'detailed',
-            },
-        },
-        'formatters': {
-            'detailed': {
-                'format': '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+                'queue_size': 10000,
+                'console': True,  # Консоль (ее собирают systemd и контейнеры) тоже через поток-слушатель
             },
         },
         'loggers': {
             'game': {
-                'handlers': ['console', 'file'],
+                'handlers': ['file'],
                 'level': 'INFO' if DEBUG else 'WARNING',
                 'propagate': True,
             },
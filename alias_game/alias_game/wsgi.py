@@ -19,4 +19,8 @@ os.environ['DJANGO_SETTINGS_MODULE'] = 'alias_game.settings'
 
 # Загрузите Django приложение
 from django.core.wsgi import get_wsgi_application
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Периодические задачи (сборщик отключившихся игроков, архив) без отдельного воркера run_tasks
+from game.background import start_periodic_scheduler
+start_periodic_scheduler()
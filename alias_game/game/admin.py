@@ -1 +1,204 @@
-from django.contrib import admin
\ No newline at end of file
+# game/admin.py
+"""Админка живых комнат, рассчитанная на сотни тысяч строк.
+
+- список не делает запросов на строку: связанные объекты через list_select_related,
+  число игроков - из денормализованных счетчиков player_count;
+- EstimatedCountPaginator не считает COUNT(*) по всей таблице (см. ниже);
+- фильтры и сортировка только по индексированным полям (статус, активность);
+- действия над выбранными комнатами - несколько UPDATE/DELETE на весь набор, без
+  загрузки объектов; стандартное удаление с перечислением всех связанных объектов убрано.
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import Room, Team, Player, adjust_player_counts
+from .snapshots import invalidate_turn_state
+
+PURGE_CHUNK_SIZE = 1000  # Комнат на одну порцию удаления
+
+
+def _sqlite_stat_rows(cursor, table):
+    """Число строк из статистики ANALYZE (sqlite_stat1) или None, если таблицу не анализировали."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+    row = cursor.fetchone()
+    # stat - "<строк в таблице> <строк на значение индекса> ..."
+    return int(row[0].split()[0]) if row and row[0] else None
+
+
+def estimate_table_rows(model, using='default'):
+    """Примерное число строк таблицы по статистике БД или None, если оценки нет."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+                [table],
+            )
+        elif connection.vendor == 'sqlite':
+            # MAX(rowid) не годится: игроков и комнаты постоянно удаляют, а он считает все когда-либо
+            # созданные строки. Без статистики ANALYZE (PRAGMA optimize) - None и точный COUNT
+            return _sqlite_stat_rows(cursor, table)
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:  # reltuples = -1: таблицу еще не анализировали
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор без полного COUNT(*).
+
+    Без фильтров число строк берется из статистики БД, если таблица больше
+    ADMIN_EXACT_COUNT_THRESHOLD (на маленьких таблицах точный COUNT дешев). С фильтром
+    или поиском строки считаются не дальше ADMIN_FILTERED_COUNT_LIMIT: страницы за этой
+    границей недоступны, надо уточнить фильтр.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_table_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate >= settings.ADMIN_EXACT_COUNT_THRESHOLD:
+                return estimate
+            return queryset.count()
+        return queryset[:settings.ADMIN_FILTERED_COUNT_LIMIT].count()
+
+
+class ActivityFilter(admin.SimpleListFilter):
+    """Диапазоны по индексированному полю времени активности."""
+    title = 'активность'
+    parameter_name = 'activity'
+    field_name = 'last_activity'
+    RANGES = {  # значение: (название, с какой давности, до какой давности)
+        'live': ('за 5 минут', None, timedelta(minutes=5)),
+        'idle': ('5 минут - 2 часа', timedelta(minutes=5), timedelta(hours=2)),
+        'stale': ('больше 2 часов', timedelta(hours=2), None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, (label, _, _) in self.RANGES.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.RANGES:
+            return queryset
+        _, min_age, max_age = self.RANGES[self.value()]
+        now = timezone.now()
+        if min_age is not None:
+            queryset = queryset.filter(**{f'{self.field_name}__lte': now - min_age})
+        if max_age is not None:
+            queryset = queryset.filter(**{f'{self.field_name}__gt': now - max_age})
+        return queryset
+
+
+class PlayerActivityFilter(ActivityFilter):
+    field_name = 'last_seen'
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Иначе на каждый фильтр - еще один COUNT(*) по всей таблице
+    list_per_page = 50
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Стандартное удаление грузит и показывает все связанные объекты, а Player.delete не вызывает
+        actions.pop('delete_selected', None)
+        return actions
+
+
+@admin.register(Room)
+class RoomAdmin(LargeTableAdmin):
+    # Без word_pack: его str потянул бы в список сжатые слова набора
+    list_display = ('id', 'status', 'creator_telegram_username', 'player_count', 'num_teams',
+                    'current_round', 'is_large_room', 'last_activity', 'created_at')
+    list_filter = ('status', ActivityFilter)  # Индексы [status, last_activity] и [last_activity]
+    search_fields = ('=id', '=creator_telegram_id')
+    ordering = ('-last_activity',)
+    raw_id_fields = ('word_pack',)
+    readonly_fields = ('player_count', 'words_guessed_count', 'words_skipped_count', 'last_action_seq')
+    actions = ('finish_rooms', 'reset_rooms', 'purge_rooms')
+
+    @admin.action(description='Завершить выбранные игры')
+    def finish_rooms(self, request, queryset):
+        count = queryset.exclude(status='finished').update(
+            status='finished', current_word=None, round_start_time=None, is_ending_round=False,
+            last_activity=timezone.now(),
+        )
+        self.message_user(request, f'Завершено комнат: {count}', messages.SUCCESS)
+
+    @admin.action(description='Сбросить выбранные игры')
+    def reset_rooms(self, request, queryset):
+        # Те же поля, что Room.reset_game, одним UPDATE на все комнаты и одним на все команды
+        with transaction.atomic():
+            count = queryset.update(
+                status='waiting', current_round=0, current_team_index=0, current_explainer_index_in_team=0,
+                current_word=None, round_start_time=None, words_used=b'', words_guessed_count=0,
+                words_skipped_count=0, is_ending_round=False, last_activity=timezone.now(),
+            )
+            Team.objects.filter(room__in=queryset.values('pk')).exclude(score=0).update(score=0)
+        self.message_user(request, f'Сброшено комнат: {count}', messages.SUCCESS)
+
+    @admin.action(description='Удалить выбранные комнаты с командами и игроками')
+    def purge_rooms(self, request, queryset):
+        room_ids = list(queryset.values_list('pk', flat=True))
+        for start in range(0, len(room_ids), PURGE_CHUNK_SIZE):
+            chunk = room_ids[start:start + PURGE_CHUNK_SIZE]
+            with transaction.atomic():
+                # Сначала игроки и команды: тогда удалению комнат нечего каскадно собирать
+                Player.objects.filter(room_id__in=chunk).delete()
+                Team.objects.filter(room_id__in=chunk).delete()
+                Room.objects.filter(pk__in=chunk).delete()
+        self.message_user(request, f'Удалено комнат: {len(room_ids)}', messages.SUCCESS)
+
+
+@admin.register(Team)
+class TeamAdmin(LargeTableAdmin):
+    list_display = ('name', 'room', 'index', 'score', 'player_count')
+    list_select_related = ('room',)
+    search_fields = ('=room__id',)
+    ordering = ('-id',)
+    raw_id_fields = ('room',)
+    readonly_fields = ('player_count',)
+
+
+@admin.register(Player)
+class PlayerAdmin(LargeTableAdmin):
+    list_display = ('telegram_username', 'telegram_id', 'room', 'team', 'joined_at', 'last_seen')
+    list_filter = (PlayerActivityFilter,)
+    list_select_related = ('room', 'team')
+    search_fields = ('=room__id',)
+    ordering = ('-id',)
+    raw_id_fields = ('room', 'team')
+    actions = ('remove_players',)
+
+    def save_model(self, request, obj, form, change):
+        # Счетчики при переносе в другую комнату или команду правит Player.save
+        super().save_model(request, obj, form, change)
+        invalidate_turn_state({form.initial.get('room'), obj.room_id} - {None})
+
+    @admin.action(description='Удалить выбранных игроков из комнат')
+    def remove_players(self, request, queryset):
+        with transaction.atomic():
+            room_deltas, team_deltas = {}, {}
+            for row in queryset.order_by().values('room_id', 'team_id').annotate(n=Count('id')):
+                room_deltas[row['room_id']] = room_deltas.get(row['room_id'], 0) - row['n']
+                team_deltas[row['team_id']] = team_deltas.get(row['team_id'], 0) - row['n']
+            count, _ = queryset.delete()
+            adjust_player_counts(room_deltas, team_deltas)
+        invalidate_turn_state(room_deltas)  # Составы изменились - объясняющего надо найти заново
+        self.message_user(request, f'Удалено игроков: {count}', messages.SUCCESS)
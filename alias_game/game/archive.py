@@ -0,0 +1,111 @@
+# game/archive.py
+
+import logging
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Room, ArchivedGame
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_room(room):
+    """Денормализованный снимок комнаты для архива.
+
+    Архив отдается без входа, поэтому telegram_id (он же удостоверяет игрока в запросах)
+    в снимок не попадает - только имена и счет, как в снимке для зрителей.
+    Ожидает, что `team_set__player_set` и `player_set` уже загружены через prefetch_related.
+    """
+    teams = sorted(room.team_set.all(), key=lambda t: t.index)
+    winner = max(teams, key=lambda t: t.score, default=None)
+    return {
+        'room_id': room.id,
+        'creator_telegram_username': room.creator_telegram_username,
+        'difficulty': room.difficulty,
+        'num_teams': room.num_teams,
+        'winning_score': room.winning_score,
+        'penalty_for_skip': room.penalty_for_skip,
+        'rounds_played': room.current_round,
+        'created_at': room.created_at.isoformat(),
+        'finished_at': room.last_activity.isoformat(),
+        'winning_team_name': winner.name if winner and winner.score >= room.winning_score else None,
+        'teams': [
+            {
+                'name': team.name,
+                'index': team.index,
+                'score': team.score,
+                'players': [
+                    {'telegram_username': p.telegram_username}
+                    for p in sorted(team.player_set.all(), key=lambda p: p.id)
+                ],
+            }
+            for team in teams
+        ],
+        'players_without_team': [
+            {'telegram_username': p.telegram_username}
+            for p in room.player_set.all() if p.team_id is None
+        ],
+    }
+
+
+def archive_room(room):
+    """Перенести одну комнату в архив и удалить ее из горячих таблиц.
+
+    Возвращает снимок или None, если комнату после чтения сбросили или изменили:
+    тогда она остается на месте (игру, возможно, начали заново).
+    """
+    payload = serialize_room(room)
+    with transaction.atomic():
+        # Блокируем строку и проверяем, что комната все еще та завершенная игра, которую прочитали
+        unchanged = Room.objects.select_for_update().filter(
+            id=room.id, status='finished', last_activity=room.last_activity,
+        ).values_list('id', flat=True)
+        if not list(unchanged):
+            return None
+        ArchivedGame.objects.update_or_create(
+            room_id=room.id,
+            defaults={
+                'created_at': room.created_at,
+                'finished_at': room.last_activity,
+                'archived_at': timezone.now(),
+                'data': ArchivedGame.pack(payload),
+            },
+        )
+        room.delete()
+    return payload
+
+
+def archive_finished_rooms(older_than=None, batch_size=100):
+    """Архивировать завершенные комнаты, неактивные с момента `older_than`. Возвращает количество."""
+    rooms = Room.objects.filter(status='finished')
+    if older_than is not None:
+        rooms = rooms.filter(last_activity__lt=older_than)
+
+    archived = 0
+    skipped = []  # Изменились после чтения - в этот проход больше не берем
+    while True:
+        batch = list(
+            rooms.exclude(pk__in=skipped).order_by('last_activity')
+            .prefetch_related('team_set__player_set', 'player_set')[:batch_size]
+        )
+        if not batch:
+            break
+        for room in batch:
+            if archive_room(room) is None:
+                skipped.append(room.id)
+            else:
+                archived += 1
+        if len(batch) < batch_size:
+            break
+
+    if archived:
+        logger.info("Archived %d finished rooms", archived)
+    return archived
+
+
+def get_archived_game(room_id):
+    """Получить архив игры по ID комнаты или None."""
+    archived = ArchivedGame.objects.filter(room_id=str(room_id).strip()).first()
+    if archived is None:
+        return None
+    return archived.payload
@@ -0,0 +1,10 @@
+# game/backends/mysql/base.py
+"""MySQL с пулом соединений процесса: ENGINE = 'game.backends.mysql'."""
+
+from django.db.backends.mysql import base
+
+from game.dbpool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
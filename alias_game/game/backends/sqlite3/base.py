@@ -0,0 +1,13 @@
+# game/backends/sqlite3/base.py
+"""SQLite с тем же пулом, что и у MySQL: ENGINE = 'game.backends.sqlite3' (тесты и локальный запуск).
+
+Соединения с БД в памяти Django не закрывает, поэтому пул работает только с файловой БД.
+"""
+
+from django.db.backends.sqlite3 import base
+
+from game.dbpool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
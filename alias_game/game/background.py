@@ -0,0 +1,239 @@
+# game/background.py
+"""Легковесные фоновые задачи.
+
+Задача - обычная функция, зарегистрированная декоратором @task. Выполнять ее можно:
+  * 'thread'    - в пуле потоков текущего процесса; периодические задачи ставит поток
+                  веб-процесса (start_periodic_scheduler);
+  * 'database'  - через таблицу BackgroundTask, которую разбирает команда run_tasks
+                  (несколько воркеров, задачи переживают перезапуск);
+  * 'immediate' - сразу в вызывающем потоке (тесты).
+"""
+
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+from django.conf import settings
+from django.db import connection, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class Task:
+    def __init__(self, func, name, max_retries, retry_delay):
+        self.func = func
+        self.name = name
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """Поставить задачу в очередь прямо сейчас."""
+        get_backend().enqueue(self, args, kwargs)
+
+    def defer(self, *args, **kwargs):
+        """Поставить задачу в очередь после коммита текущей транзакции."""
+        transaction.on_commit(lambda: self.delay(*args, **kwargs))
+
+
+def task(func=None, *, name=None, max_retries=3, retry_delay=5):
+    """Зарегистрировать функцию как фоновую задачу. Аргументы должны сериализоваться в JSON."""
+    def decorator(f):
+        registered = Task(f, name or f"{f.__module__}.{f.__name__}", max_retries, retry_delay)
+        _registry[registered.name] = registered
+        return registered
+    return decorator(func) if func else decorator
+
+
+def get_task(name):
+    if name not in _registry:
+        for module in settings.BACKGROUND_TASK_MODULES:
+            import_module(module)
+    return _registry[name]
+
+
+def _retry_delay(registered, attempt):
+    return registered.retry_delay * (2 ** (attempt - 1))
+
+
+class ImmediateBackend:
+    def enqueue(self, registered, args, kwargs):
+        registered(*args, **kwargs)
+
+
+class ThreadBackend:
+    """Пул потоков в процессе. Задачи теряются при остановке процесса."""
+
+    def __init__(self, max_workers):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='game-task')
+
+    def enqueue(self, registered, args, kwargs):
+        self.executor.submit(self._run, registered, args, kwargs)
+
+    def _run(self, registered, args, kwargs):
+        for attempt in range(1, registered.max_retries + 2):
+            try:
+                registered(*args, **kwargs)
+                return
+            except Exception:
+                if attempt > registered.max_retries:
+                    logger.exception("Background task %s failed after %d attempts", registered.name, attempt)
+                    return
+                logger.warning("Background task %s failed, retry %d", registered.name, attempt)
+                time.sleep(_retry_delay(registered, attempt))
+            finally:
+                # Потоки пула живут долго: не держим соединения с БД между задачами
+                close_old_connections()
+
+
+class DatabaseBackend:
+    """Надежная очередь в БД, выполняется командой run_tasks."""
+
+    def enqueue(self, registered, args, kwargs):
+        from .models import BackgroundTask
+        BackgroundTask.objects.create(
+            name=registered.name,
+            args=list(args),
+            kwargs=kwargs,
+            max_attempts=registered.max_retries + 1,
+        )
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    name = settings.BACKGROUND_TASKS_BACKEND
+    if _backend is None or _backend[0] != name:
+        with _backend_lock:
+            if _backend is None or _backend[0] != name:
+                if name == 'database':
+                    backend = DatabaseBackend()
+                elif name == 'immediate':
+                    backend = ImmediateBackend()
+                else:
+                    backend = ThreadBackend(settings.BACKGROUND_TASKS_THREADS)
+                _backend = (name, backend)
+    return _backend[1]
+
+
+def _claim(batch_size):
+    """Забрать пачку готовых задач и пометить их выполняемыми.
+
+    Задача берется в аренду на BACKGROUND_TASK_LEASE_SECONDS: если воркер умер посреди
+    выполнения, после истечения аренды ее заберет другой. Попытка засчитывается при захвате,
+    поэтому задача, которая каждый раз роняет воркер, не крутится бесконечно.
+    """
+    from .models import BackgroundTask
+    now = timezone.now()
+    expired = Q(status='running', claimed_at__lt=now - timedelta(seconds=settings.BACKGROUND_TASK_LEASE_SECONDS))
+    with transaction.atomic():
+        BackgroundTask.objects.filter(expired, attempts__gte=F('max_attempts')).update(
+            status='failed', last_error='Аренда истекла: воркер не завершил задачу')
+        ready = BackgroundTask.objects.filter(Q(status='pending', run_after__lte=now) | expired).order_by('run_after')
+        if connection.features.has_select_for_update_skip_locked:
+            ready = ready.select_for_update(skip_locked=True)
+        claimed = list(ready[:batch_size])
+        BackgroundTask.objects.filter(id__in=[t.id for t in claimed]).update(
+            status='running', claimed_at=now, attempts=F('attempts') + 1)
+    for queued in claimed:
+        queued.attempts += 1
+    return claimed
+
+
+def ensure_periodic(periodic):
+    """Завести строки сроков для периодических задач {имя: интервал}; существующие не трогаются."""
+    from .models import PeriodicTask
+    PeriodicTask.objects.bulk_create(
+        [PeriodicTask(name=name) for name in periodic], ignore_conflicts=True)
+
+
+def schedule_periodic(periodic):
+    """Поставить в очередь периодические задачи, срок которых наступил. Возвращает их имена.
+
+    Срок сдвигается условным UPDATE: из нескольких воркеров run_tasks задачу ставит
+    только тот, чей UPDATE изменил строку.
+    """
+    from .models import PeriodicTask
+    scheduled = []
+    for name, every in periodic.items():
+        now = timezone.now()
+        with transaction.atomic():
+            if PeriodicTask.objects.filter(name=name, next_run_at__lte=now).update(
+                    next_run_at=now + timedelta(seconds=every)):
+                get_task(name).delay()
+                scheduled.append(name)
+    return scheduled
+
+
+_scheduler_started = False
+
+
+def start_periodic_scheduler():
+    """Запустить в веб-процессе поток, ставящий BACKGROUND_PERIODIC_TASKS (BACKGROUND_PERIODIC_IN_PROCESS).
+
+    Нужен бэкенду 'thread', у которого нет отдельного воркера run_tasks. Сроки общие в БД
+    (schedule_periodic), поэтому при нескольких процессах каждую задачу ставит только один.
+    Возвращает True, если поток запущен этим вызовом.
+    """
+    global _scheduler_started
+    if not settings.BACKGROUND_PERIODIC_IN_PROCESS or not settings.BACKGROUND_PERIODIC_TASKS:
+        return False
+    with _backend_lock:
+        if _scheduler_started:
+            return False
+        _scheduler_started = True
+    threading.Thread(target=_scheduler_loop, args=(dict(settings.BACKGROUND_PERIODIC_TASKS),),
+                     name='game-scheduler', daemon=True).start()
+    return True
+
+
+def _scheduler_loop(periodic, tick=5):
+    ensured = False
+    while True:
+        try:
+            if not ensured:
+                ensure_periodic(periodic)
+                ensured = True
+            schedule_periodic(periodic)
+        except Exception:
+            logger.exception("Periodic task scheduling failed")
+        finally:
+            close_old_connections()
+        time.sleep(tick)
+
+
+def run_pending(batch_size=20):
+    """Выполнить готовые задачи из БД. Возвращает количество обработанных."""
+    from .models import BackgroundTask
+    claimed = _claim(batch_size)
+    for queued in claimed:
+        try:
+            get_task(queued.name)(*queued.args, **queued.kwargs)
+        except Exception:
+            queued.last_error = traceback.format_exc()[-2000:]
+            if queued.attempts >= queued.max_attempts:
+                queued.status = 'failed'
+                logger.error("Background task %s (%s) failed permanently", queued.name, queued.id)
+            else:
+                queued.status = 'pending'
+                try:
+                    delay = _retry_delay(get_task(queued.name), queued.attempts)
+                except KeyError:
+                    delay = 60
+                queued.run_after = timezone.now() + timedelta(seconds=delay)
+            queued.save(update_fields=['status', 'attempts', 'last_error', 'run_after'])
+        else:
+            BackgroundTask.objects.filter(id=queued.id).delete()
+    return len(claimed)
@@ -0,0 +1,23 @@
+# game/counters.py
+"""Сверка денормализованных счетчиков игроков (Room.player_count, Team.player_count) с таблицей игроков."""
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Room, Team, Player
+
+
+def recount_players(room_ids=None):
+    """Исправить расхождения счетчиков. Возвращает {'rooms': n, 'teams': n} - сколько строк исправлено."""
+    fixed = {}
+    for key, model, fk in (('rooms', Room, 'room'), ('teams', Team, 'team')):
+        actual = Coalesce(Subquery(
+            Player.objects.filter(**{fk: OuterRef('pk')}).order_by()
+            .values(fk).annotate(n=Count('id')).values('n')
+        ), 0)
+        rows = model.objects.all()
+        if room_ids is not None:
+            rows = rows.filter(pk__in=room_ids) if model is Room else rows.filter(room_id__in=room_ids)
+        drifted = rows.annotate(actual=actual).exclude(player_count=F('actual')).values_list('pk', flat=True)
+        fixed[key] = model.objects.filter(pk__in=list(drifted)).update(player_count=actual)
+    return fixed
@@ -0,0 +1,214 @@
+# game/dbpool.py
+"""Пул соединений с БД на процесс для MySQL (и SQLite в тестах).
+
+Постоянные соединения Django (CONN_MAX_AGE) живут по одному на поток: под ASGI
+и в многопоточном сервере их число растет вместе с потоками, а всплеск опросов
+открывает десятки новых соединений разом. С пулом (DB_POOL_ENABLED) соединение
+берется из пула на время запроса и возвращается при закрытии, так что открытых
+соединений не больше DB_POOL_MAX_SIZE на процесс. Для PostgreSQL используется
+встроенный пул Django (OPTIONS['pool'], psycopg_pool) - см. settings.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений, потокобезопасный. connect() открывает новое соединение."""
+
+    def __init__(self, max_size, timeout, max_lifetime, slow_checkout_ms=None, timeout_error=TimeoutError):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.slow_checkout_ms = slow_checkout_ms
+        self.timeout_error = timeout_error
+        self._idle = deque()  # (соединение, время открытия); берем с конца - самые "теплые"
+        self._opened_at = {}  # id(соединения) -> время открытия, для выданных
+        self._size = 0  # Открытые соединения: свободные и выданные
+        self._cond = threading.Condition()
+        self._stats = dict.fromkeys(
+            ('checkouts', 'waits', 'wait_ms_total', 'wait_ms_max', 'timeouts', 'opened', 'closed'), 0
+        )
+
+    def checkout(self, connect):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                conn = self._take_idle()
+                if conn is not None:
+                    break
+                if self._size < self.max_size:
+                    self._size += 1  # Место занято, само соединение откроем вне блокировки
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise self.timeout_error(
+                        f'Нет свободного соединения в пуле за {self.timeout} с (размер {self.max_size})'
+                    )
+                waited = True
+                self._cond.wait(remaining)
+            self._record_wait(started, waited)
+
+        if conn is None:
+            try:
+                conn = connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['opened'] += 1
+                self._opened_at[id(conn)] = time.monotonic()
+        return conn
+
+    def checkin(self, conn, discard=False):
+        """Вернуть соединение; discard=True - закрыть (сломано или брошено посреди транзакции)."""
+        with self._cond:
+            opened_at = self._opened_at.pop(id(conn), None)
+            expired = opened_at is None or time.monotonic() - opened_at > self.max_lifetime
+            if not discard and not expired:
+                self._idle.append((conn, opened_at))
+                self._cond.notify()
+                return
+            self._size -= 1
+            self._stats['closed'] += 1
+            self._cond.notify()
+        _close_quietly(conn)
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._stats['closed'] += len(idle)
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                **self._stats,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            }
+
+    def _take_idle(self):
+        while self._idle:
+            conn, opened_at = self._idle.pop()
+            if time.monotonic() - opened_at <= self.max_lifetime:
+                self._opened_at[id(conn)] = opened_at
+                return conn
+            # Соединение отжило свое - закрываем и смотрим следующее
+            self._size -= 1
+            self._stats['closed'] += 1
+            _close_quietly(conn)
+        return None
+
+    def _record_wait(self, started, waited):
+        self._stats['checkouts'] += 1
+        if not waited:
+            return
+        wait_ms = (time.monotonic() - started) * 1000
+        self._stats['waits'] += 1
+        self._stats['wait_ms_total'] += wait_ms
+        self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], wait_ms)
+        if self.slow_checkout_ms is not None and wait_ms >= self.slow_checkout_ms:
+            logger.warning("DB pool checkout waited %.0f ms (max_size=%d)", wait_ms, self.max_size)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, options, timeout_error):
+    """Пул процесса для алиаса БД; options - DATABASES[alias]['OPTIONS']['pool']."""
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(
+                max_size=options.get('max_size', 10),
+                timeout=options.get('timeout', 5),
+                max_lifetime=options.get('max_lifetime', 600),
+                slow_checkout_ms=options.get('slow_checkout_ms'),
+                timeout_error=timeout_error,
+            )
+        return pool
+
+
+def close_pool(alias=DEFAULT_DB_ALIAS):
+    with _pools_lock:
+        pool = _pools.pop(alias, None)
+    if pool is not None:
+        pool.close_all()
+
+
+class PooledDatabaseWrapperMixin:
+    """Примесь к DatabaseWrapper бэкенда: соединения берутся из пула и возвращаются в него."""
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict['OPTIONS'].get('pool') or {}, self.Database.OperationalError)
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)  # Настройки пула драйверу не передаем
+        return params
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        return self.pool.checkout(lambda: connect(conn_params))
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Соединение посреди транзакции или после ошибки в пул не возвращаем
+        discard = self.in_atomic_block or (self.errors_occurred and not self.is_usable())
+        if not discard and not self.autocommit:
+            try:
+                self.connection.rollback()
+            except Exception:
+                discard = True
+        self.pool.checkin(self.connection, discard=discard)
+
+
+def pool_stats(alias=DEFAULT_DB_ALIAS):
+    """Статистика пула текущего процесса или None, если пул не включен."""
+    return describe_pool(getattr(connections[alias], 'pool', None))
+
+
+def describe_pool(pool):
+    """Статистика в одном формате для ConnectionPool и встроенного пула PostgreSQL."""
+    if pool is None:
+        return None
+    if isinstance(pool, ConnectionPool):
+        return pool.stats()
+    # Встроенный пул Django для PostgreSQL (psycopg_pool)
+    stats = pool.get_stats()
+    return {
+        'checkouts': stats.get('requests_num', 0),
+        'waits': stats.get('requests_queued', 0),
+        'wait_ms_total': stats.get('requests_wait_ms', 0),
+        'wait_ms_max': None,
+        'timeouts': stats.get('requests_errors', 0),
+        'opened': stats.get('connections_num', 0),
+        'max_size': stats.get('pool_max'),
+        'size': stats.get('pool_size'),
+        'idle': stats.get('pool_available'),
+    }
@@ -0,0 +1,111 @@
+# game/log_queue.py
+"""Неблокирующее логирование: поток запроса только кладет запись в очередь,
+форматирование в JSON (вместе с traceback), запись на диск и в консоль и ротация
+выполняются отдельным потоком."""
+
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        dropped = getattr(record, 'dropped', None)
+        if dropped:
+            entry['dropped'] = dropped
+        return json.dumps(entry, ensure_ascii=False)
+
+
+CONSOLE_FORMAT = '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+
+
+class AsyncRotatingFileHandler(QueueHandler):
+    """QueueHandler с собственным потоком-слушателем и RotatingFileHandler на выходе.
+
+    С `console=True` слушатель пишет записи еще и в stderr - поток запроса не ждет и консоль.
+
+    Очередь ограничена `queue_size`. Когда она заполнена больше чем на `pressure_ratio`,
+    записи ниже WARNING прореживаются (проходит каждая `sample_every`-я), а при полной
+    очереди новые записи отбрасываются. Число потерянных записей попадает в поле
+    `dropped` следующей записанной строки.
+    """
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, queue_size=10000,
+                 pressure_ratio=0.8, sample_every=10, encoding='utf-8', console=False):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        target = RotatingFileHandler(filename, maxBytes=maxBytes, backupCount=backupCount,
+                                     encoding=encoding, delay=True)
+        target.setFormatter(JsonLinesFormatter())
+        targets = [target]
+        if console:
+            console_target = logging.StreamHandler()
+            console_target.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            targets.append(console_target)
+
+        self.pressure_threshold = int(queue_size * pressure_ratio)
+        self.sample_every = max(1, sample_every)
+        self._sampled = 0
+        self._dropped = 0
+        self._counter_lock = threading.Lock()
+
+        self.listener = QueueListener(self.queue, *targets, respect_handler_level=False)
+        self.listener.start()
+
+    def close(self):
+        # logging.shutdown() при выходе закрывает обработчики: дописываем очередь на диск
+        if self.listener._thread is not None:
+            self.listener.stop()
+        for target in self.listener.handlers:
+            target.close()
+        super().close()
+
+    def prepare(self, record):
+        # QueueHandler.prepare форматирует запись и traceback в потоке запроса и стирает exc_info.
+        # Здесь подставляются только аргументы сообщения (они могут измениться после возврата),
+        # а exc_info уходит в очередь: traceback форматирует слушатель (поле exc в JSON)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        with self._counter_lock:
+            if self._dropped:
+                record.dropped, self._dropped = self._dropped, 0
+        return record
+
+    def _drop(self, count=1):
+        with self._counter_lock:
+            self._dropped += count
+
+    def emit(self, record):
+        # Под нагрузкой прореживаем подробные записи еще до форматирования
+        if record.levelno < logging.WARNING and self.queue.qsize() >= self.pressure_threshold:
+            self._sampled += 1
+            if self._sampled % self.sample_every:
+                self._drop()
+                return
+        try:
+            prepared = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            self.queue.put_nowait(prepared)
+        except queue.Full:
+            self._drop(1 + getattr(prepared, 'dropped', 0))
@@ -0,0 +1,21 @@
+# game/management/commands/archive_rooms.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from game.archive import archive_finished_rooms
+
+class Command(BaseCommand):
+    help = 'Переносит завершенные комнаты в архив и удаляет их из рабочих таблиц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-minutes', type=int, default=30,
+                            help='Архивировать комнаты, неактивные дольше этого времени')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        cutoff_time = timezone.now() - timedelta(minutes=options['older_than_minutes'])
+        count = archive_finished_rooms(older_than=cutoff_time, batch_size=options['batch_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Архивировано {count} завершенных комнат')
+        )
@@ -0,0 +1,120 @@
+# game/management/commands/bench_db_pool.py
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.utils import ConnectionHandler
+from game.dbpool import close_pool, describe_pool
+
+BENCH_ALIAS = 'bench_pool'
+POOLED_ENGINES = {
+    'django.db.backends.mysql': 'game.backends.mysql',
+    'django.db.backends.sqlite3': 'game.backends.sqlite3',
+}
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает открытие соединений с БД под нагрузкой: без сохранения соединений, '
+            'постоянные соединения на поток и пул')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32, help='Одновременных "запросов" (потоков)')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на поток')
+        parser.add_argument('--pool-size', type=int, default=8)
+        parser.add_argument('--pool-timeout', type=float, default=10)
+        parser.add_argument('--modes', default='unpooled,persistent,pooled')
+
+    def handle(self, *args, **options):
+        base = connections['default'].settings_dict
+        if base['ENGINE'] == 'django.db.backends.sqlite3' and connections['default'].is_in_memory_db():
+            raise CommandError('Для замера нужна файловая БД: соединения с БД в памяти Django не закрывает.')
+
+        self.stdout.write(f"БД: {base['ENGINE']}, потоков {options['threads']}, запросов на поток {options['requests']}")
+        self.stdout.write(
+            f"{'mode':>10} {'req/s':>8} {'opened':>7} {'checkouts':>9} {'waits':>6} {'wait ms avg':>11} {'wait ms max':>11}"
+        )
+        for mode in options['modes'].split(','):
+            settings_dict = self._settings_for(mode, base, options)
+            if settings_dict is None:
+                self.stdout.write(f'{mode:>10}  пропущено: пул для {base["ENGINE"]} не поддерживается')
+                continue
+            elapsed, opened, checkouts, stats = self._run(settings_dict, options)
+            total = options['threads'] * options['requests']
+            if stats:
+                opened = stats.get('opened', opened)
+                waits = stats.get('waits', 0)
+                wait_avg = stats.get('wait_ms_total', 0) / waits if waits else 0
+                wait_max = stats.get('wait_ms_max') or 0
+            else:
+                waits, wait_avg, wait_max = '-', 0, 0
+            self.stdout.write(
+                f'{mode:>10} {total / elapsed:>8.0f} {opened:>7} {checkouts:>9} {waits:>6} {wait_avg:>11.1f} {wait_max:>11.1f}'
+            )
+
+    def _settings_for(self, mode, base, options):
+        settings_dict = {**base, 'OPTIONS': {k: v for k, v in base.get('OPTIONS', {}).items() if k != 'pool'}}
+        engine = next((e for e in POOLED_ENGINES if base['ENGINE'] in (e, POOLED_ENGINES[e])), base['ENGINE'])
+        settings_dict['ENGINE'] = engine
+        if mode == 'unpooled':
+            settings_dict['CONN_MAX_AGE'] = 0
+        elif mode == 'persistent':
+            settings_dict['CONN_MAX_AGE'] = 600
+        elif mode == 'pooled':
+            settings_dict['CONN_MAX_AGE'] = 0
+            pool = {'max_size': options['pool_size'], 'timeout': options['pool_timeout'], 'max_lifetime': 600}
+            if engine in POOLED_ENGINES:
+                settings_dict['ENGINE'] = POOLED_ENGINES[engine]
+            elif engine == 'django.db.backends.postgresql':
+                pool['min_size'] = min(2, options['pool_size'])
+            else:
+                return None
+            settings_dict['OPTIONS']['pool'] = pool
+        else:
+            raise CommandError(f'Неизвестный режим {mode}')
+        return settings_dict
+
+    def _run(self, settings_dict, options):
+        # Отдельный набор соединений: ConnectionHandler требует 'default', замеряем только BENCH_ALIAS
+        handler = ConnectionHandler({'default': connections['default'].settings_dict, BENCH_ALIAS: settings_dict})
+        counter = {'checkouts': 0}
+        lock = threading.Lock()
+
+        def on_connect(sender, connection, **kwargs):
+            if connection.alias == BENCH_ALIAS:
+                with lock:
+                    counter['checkouts'] += 1
+
+        def worker():
+            conn = handler[BENCH_ALIAS]
+            for _ in range(options['requests']):
+                # Как запрос Django: начало и конец запроса закрывают устаревшие соединения
+                conn.close_if_unusable_or_obsolete()
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                conn.close_if_unusable_or_obsolete()
+            conn.close()
+
+        connection_created.connect(on_connect)
+        try:
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            stats = self._pool_stats(handler)
+        finally:
+            connection_created.disconnect(on_connect)
+            close_pool(BENCH_ALIAS)
+            handler.close_all()
+        # Без пула каждое подключение - новое физическое соединение
+        return elapsed, counter['checkouts'], counter['checkouts'], stats
+
+    def _pool_stats(self, handler):
+        conn = handler[BENCH_ALIAS]
+        if 'pool' not in conn.settings_dict['OPTIONS']:
+            return None
+        return describe_pool(conn.pool)
@@ -0,0 +1,67 @@
+# game/management/commands/bench_room_size.py
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from game.counters import recount_players
+from game.models import Room, Team, Player
+from game.snapshots import invalidate_turn_state
+from game.views import get_game_state
+
+
+def build_bench_room(size, num_teams, is_large_room=True):
+    """Комната с игроками для замеров; вызывать внутри транзакции, которая потом откатывается."""
+    room = Room.objects.create(
+        creator_telegram_id='bench-0', num_teams=num_teams, is_large_room=is_large_room, status='playing',
+    )
+    teams = Team.objects.bulk_create([Team(room=room, name=f'Команда {i + 1}', index=i) for i in range(num_teams)])
+    Player.objects.bulk_create([
+        Player(room=room, team=teams[i % num_teams], telegram_id=f'bench-{i}', telegram_username=f'Игрок {i}')
+        for i in range(size)
+    ])
+    recount_players([room.id])
+    return room
+
+
+class Command(BaseCommand):
+    help = ('Замеряет стоимость get_game_state без кэша снимков в зависимости от размера комнаты '
+            '(данные откатываются)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='20,50,100,200,300', help='Размеры комнат через запятую')
+        parser.add_argument('--teams', type=int, default=10)
+        parser.add_argument('--requests', type=int, default=50, help='Запросов на каждый размер')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        factory = RequestFactory()
+
+        self.stdout.write(f"{'players':>8} {'q min':>6} {'q mean':>6} {'q max':>6} {'ms/req':>8} {'bytes':>8}")
+        for size in sizes:
+            with transaction.atomic():
+                room = build_bench_room(size, options['teams'])
+                request_user = Player.objects.filter(room=room).first().telegram_id
+
+                timings, query_counts = [], []
+                for i in range(options['requests']):
+                    # Каждый замер - холодный путь: новая версия комнаты мимо кэша снимков и сброс
+                    # кэша хода. Сам кэш не чистим - с Redis он общий для всего сервера
+                    Room.objects.filter(id=room.id).update(last_activity=timezone.now() + timedelta(microseconds=i))
+                    invalidate_turn_state([room.id])
+                    request = factory.get(f'/room/{room.id}/state/', {'tg_user_id': request_user})
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        response = get_game_state(request, room.id)
+                        timings.append(time.perf_counter() - started)
+                    query_counts.append(len(queries))
+
+                mean_ms = sum(timings) / len(timings) * 1000
+                mean_queries = sum(query_counts) / len(query_counts)
+                self.stdout.write(
+                    f'{size:>8} {min(query_counts):>6} {mean_queries:>6.1f} {max(query_counts):>6} '
+                    f'{mean_ms:>8.2f} {len(response.content):>8}'
+                )
+                transaction.set_rollback(True)
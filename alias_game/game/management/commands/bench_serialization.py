@@ -0,0 +1,52 @@
+# game/management/commands/bench_serialization.py
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.text import compress_string
+from game import responses
+from game.snapshots import build_room_snapshot
+from game.management.commands.bench_room_size import build_bench_room
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает сериализацию состояния комнаты: время stdlib json и быстрого сериализатора, байты до и после сжатия'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='20,200', help='Размеры комнат через запятую')
+        parser.add_argument('--teams', type=int, default=4)
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--full-rosters', action='store_true',
+                            help='Полные составы вместо сокращенных (как в обычной комнате)')
+
+    def handle(self, *args, **options):
+        serializer = 'orjson' if responses.orjson is not None else 'json (orjson не установлен)'
+        self.stdout.write(f'быстрый сериализатор: {serializer}; brotli: {"да" if responses.brotli else "нет"}')
+        self.stdout.write(
+            f"{'players':>8} {'stdlib us':>10} {'fast us':>8} {'stdlib B':>9} {'fast B':>8} {'gzip B':>7} {'br B':>6}"
+        )
+        for size in [int(size) for size in options['sizes'].split(',')]:
+            with transaction.atomic():
+                room = build_bench_room(size, options['teams'], is_large_room=not options['full_rosters'])
+                payload = build_room_snapshot(room)
+                payload.update({'is_current_explainer': False, 'current_word': None, 'next_poll_ms': 2000})
+                transaction.set_rollback(True)
+
+            # Так сериализует JsonResponse по умолчанию
+            stdlib = lambda: json.dumps(payload, cls=DjangoJSONEncoder).encode('utf-8')
+            stdlib_us = self._time(stdlib, options['iterations'])
+            fast_us = self._time(lambda: responses.dumps(payload), options['iterations'])
+
+            body = responses.dumps(payload)
+            gzip_size = len(compress_string(body))
+            br_size = len(responses.brotli.compress(body, quality=4)) if responses.brotli else '-'
+            self.stdout.write(
+                f'{size:>8} {stdlib_us:>10.1f} {fast_us:>8.1f} {len(stdlib()):>9} {len(body):>8} {gzip_size:>7} {br_size:>6}'
+            )
+
+    def _time(self, func, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - started) / iterations * 1_000_000
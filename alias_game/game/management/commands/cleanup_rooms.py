@@ -3,16 +3,24 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
 from game.models import Room
+from game.archive import archive_finished_rooms
 
 class Command(BaseCommand):
     help = 'Удаляет старые неактивные комнаты'
     
     def handle(self, *args, **options):
-        # Удаляем комнаты, созданные более 24 часов назад, которые не активны (не в статусе 'playing')
+        # Удаляем комнаты, созданные более 24 часов назад, которые не идут ('playing') и не завершены:
+        # завершенные уходят только в архив, когда станут неактивными, - иначе игра пропадет без следа
         cutoff_time = timezone.now() - timedelta(hours=24)
+
+        # Завершенные игры не теряем, а переносим в архив
+        archived = archive_finished_rooms(older_than=cutoff_time)
+        if archived:
+            self.stdout.write(f'Архивировано {archived} завершенных комнат')
+
         old_rooms = Room.objects.filter(
             created_at__lt=cutoff_time
-        ).exclude(status='playing')
+        ).exclude(status__in=['playing', 'finished'])
         
         count = old_rooms.count()
         old_rooms.delete()
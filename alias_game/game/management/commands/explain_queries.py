@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from game.queryplans import check_hot_queries
+
+
+class Command(BaseCommand):
+    help = 'Показывает EXPLAIN горячих запросов (очистка, сборщик игроков, состояние комнаты) и ищет полные сканирования таблиц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Печатать планы целиком')
+        parser.add_argument('--strict', action='store_true',
+                            help='Завершиться с ошибкой, если найдено полное сканирование (для CI)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'БД: {connection.vendor}')
+        flagged = []
+        for name, plan, scans in check_hot_queries():
+            if scans:
+                flagged.append(name)
+                self.stdout.write(self.style.ERROR(f'{name:32} полное сканирование: {", ".join(scans)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name:32} OK'))
+            if options['verbose_plans'] or scans:
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+
+        if flagged and options['strict']:
+            raise CommandError(f'Полное сканирование таблиц в запросах: {", ".join(flagged)}')
@@ -0,0 +1,91 @@
+# game/management/commands/profile_report.py
+import io
+import pstats
+import statistics
+from collections import Counter, defaultdict
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from game.profiling import PROFILE_EXTENSIONS
+
+
+class Command(BaseCommand):
+    help = ('Сводит профили запросов (ProfilingMiddleware) по эндпоинтам: свернутые стеки для flame graph '
+            'и объединенные pstats')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=str(settings.PROFILING_DIR), help='Каталог с профилями')
+        parser.add_argument('--out', help='Куда писать сводные файлы (по умолчанию <dir>/report)')
+        parser.add_argument('--endpoint', help='Только этот эндпоинт (имя URL)')
+        parser.add_argument('--top', type=int, default=10, help='Сколько самых тяжелых функций показать')
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir'])
+        if not directory.is_dir():
+            raise CommandError(f'Каталог {directory} не найден')
+        out = Path(options['out']) if options['out'] else directory / 'report'
+        out.mkdir(parents=True, exist_ok=True)
+
+        groups = defaultdict(list)
+        for path in directory.iterdir():
+            if path.suffix not in PROFILE_EXTENSIONS.values():
+                continue
+            endpoint = path.name.split('.', 1)[0]
+            if options['endpoint'] and endpoint != options['endpoint']:
+                continue
+            groups[(endpoint, path.suffix)].append(path)
+        if not groups:
+            self.stdout.write('Профилей нет')
+            return
+
+        for (endpoint, suffix), paths in sorted(groups.items()):
+            durations = [self._duration_ms(path) for path in paths]
+            durations = [d for d in durations if d is not None]
+            timing = (f', медиана {statistics.median(durations):.0f} мс, максимум {max(durations)} мс'
+                      if durations else '')
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{endpoint}: профилей {len(paths)}{timing}'))
+            if suffix == '.folded':
+                self._report_folded(endpoint, paths, out, options['top'])
+            else:
+                self._report_pstats(endpoint, paths, out, options['top'])
+
+    def _duration_ms(self, path):
+        # <эндпоинт>.<время>.<pid>-<номер>.<длительность>ms.<расширение>
+        parts = path.name.split('.')
+        if len(parts) >= 5 and parts[3].endswith('ms') and parts[3][:-2].isdigit():
+            return int(parts[3][:-2])
+        return None
+
+    def _report_folded(self, endpoint, paths, out, top):
+        stacks = Counter()
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack and count.isdigit():
+                        stacks[stack] += int(count)
+        target = out / f'{endpoint}.folded'
+        with open(target, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+        total = sum(stacks.values())
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        self.stdout.write(f'  сэмплов {total}, свернутые стеки: {target}')
+        if not total:
+            return  # Запросы короче интервала сэмплирования
+        for frame, count in leaves.most_common(top):
+            self.stdout.write(f'  {count / total:6.1%}  {frame}')
+
+    def _report_pstats(self, endpoint, paths, out, top):
+        stream = io.StringIO()
+        stats = pstats.Stats(*[str(path) for path in paths], stream=stream)
+        target = out / f'{endpoint}.prof'
+        stats.dump_stats(target)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(top)
+        self.stdout.write(f'  объединенный pstats: {target}')
+        for line in stream.getvalue().splitlines():
+            if line.strip():
+                self.stdout.write(f'  {line}')
@@ -0,0 +1,88 @@
+# game/management/commands/profile_startup.py
+import os
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Что должен загрузить процесс, чтобы быть готовым к работе
+TARGETS = {
+    'web': (
+        "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alias_game.settings'); "
+        "import django; django.setup(); "
+        "from django.urls import get_resolver; get_resolver().url_patterns"
+    ),
+    'bot': "import bot; bot.load_client()",
+}
+
+
+def parse_importtime(stderr):
+    """Разобрать вывод `python -X importtime`: [(module, self_us, cumulative_us, depth), ...]."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+class Command(BaseCommand):
+    help = 'Профилирует холодный старт веб-воркера и бота: время импорта по модулям и бюджет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*', default=None, help='Цели: ' + ', '.join(TARGETS) + ' (по умолчанию все)')
+        parser.add_argument('--top', type=int, default=15, help='Сколько самых дорогих импортов показать')
+        parser.add_argument('--repeat', type=int, default=3, help='Запусков на цель, берется лучший')
+        parser.add_argument('--check', action='store_true', help='Завершиться с ошибкой при превышении бюджета')
+
+    def handle(self, *args, **options):
+        targets = options['targets'] or list(TARGETS)
+        unknown = [target for target in targets if target not in TARGETS]
+        if unknown:
+            raise CommandError(f'Неизвестные цели: {", ".join(unknown)}')
+
+        over_budget = []
+        for target in targets:
+            wall_ms, entries = min(
+                (self._run(TARGETS[target]) for _ in range(options['repeat'])),
+                key=lambda result: result[0],
+            )
+            budget_ms = settings.STARTUP_BUDGET_MS.get(target)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{target}: {wall_ms:.0f} ms (бюджет {budget_ms} ms)'
+            ))
+
+            # Самые дорогие импорты верхнего уровня и самые дорогие модули сами по себе
+            top_level = sorted((e for e in entries if e[3] == 0), key=lambda e: -e[2])
+            self.stdout.write('  по пакетам (cumulative ms):')
+            for name, _, cumulative_us, _ in top_level[:options['top']]:
+                self.stdout.write(f'    {cumulative_us / 1000:8.1f}  {name}')
+            self.stdout.write('  по модулям (self ms):')
+            for name, self_us, _, _ in sorted(entries, key=lambda e: -e[1])[:options['top']]:
+                self.stdout.write(f'    {self_us / 1000:8.1f}  {name}')
+
+            if budget_ms is not None and wall_ms > budget_ms:
+                over_budget.append(f'{target}: {wall_ms:.0f} ms > {budget_ms} ms')
+
+        if over_budget:
+            message = 'Превышен бюджет старта: ' + '; '.join(over_budget)
+            if options['check']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+
+    def _run(self, code):
+        env = dict(os.environ, PYTHONPATH=str(settings.BASE_DIR))
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        wall_ms = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            # Строки -X importtime перемешаны с трассировкой - оставляем только ее
+            errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+            raise CommandError('\n'.join(errors[-10:]).strip() or 'startup failed')
+        return wall_ms, parse_importtime(result.stderr)
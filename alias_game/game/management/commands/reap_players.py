@@ -0,0 +1,27 @@
+# game/management/commands/reap_players.py
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from game.presence import sweep
+
+class Command(BaseCommand):
+    help = 'Удаляет отключившихся игроков во всех комнатах (однократно или в цикле)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно с интервалом --interval')
+        parser.add_argument('--interval', type=int, default=settings.PRESENCE_REAP_INTERVAL_SECONDS)
+        parser.add_argument('--timeout-minutes', type=int, default=settings.PRESENCE_TIMEOUT_MINUTES)
+
+    def handle(self, *args, **options):
+        while True:
+            result = sweep(
+                timeout_minutes=options['timeout_minutes'],
+                inactive_room_hours=settings.INACTIVE_ROOM_PLAYERS_HOURS,
+            )
+            self.stdout.write(
+                f"Удалено отключившихся игроков: {result['disconnected']}, "
+                f"из неактивных комнат: {result['inactive_rooms']}"
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
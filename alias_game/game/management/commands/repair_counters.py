@@ -0,0 +1,16 @@
+# game/management/commands/repair_counters.py
+from django.core.management.base import BaseCommand
+from game.counters import recount_players
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счетчики игроков в комнатах и командах с таблицей игроков и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('room_ids', nargs='*', help='Только эти комнаты (по умолчанию все)')
+
+    def handle(self, *args, **options):
+        fixed = recount_players(options['room_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Исправлено счетчиков: комнат {fixed['rooms']}, команд {fixed['teams']}"
+        ))
@@ -0,0 +1,227 @@
+# game/management/commands/replay_traffic.py
+import glob
+import json
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import urlencode
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.urls import NoReverseMatch, reverse
+from game.traffic import read_capture
+
+MAPPING_WAIT_SECONDS = 2  # Сколько ждать, пока другая полоса создаст комнату
+
+
+class ReplayState:
+    """Соответствие псевдонимов захвата объектам новой БД, общее для всех полос."""
+
+    def __init__(self):
+        self.rooms = {}  # псевдоним комнаты -> id новой комнаты
+        self.packs = {}  # псевдоним набора слов -> id нового набора
+        self.teams = {}  # (id комнаты, номер команды) -> id команды
+        self.tokens = {}  # (id комнаты, пользователь) -> токен игрока
+        self.changed = threading.Condition()
+
+    def room(self, captured):
+        deadline = time.monotonic() + MAPPING_WAIT_SECONDS
+        with self.changed:
+            while captured not in self.rooms:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.changed.wait(remaining)
+            return self.rooms[captured]
+
+    def remember(self, mapping, captured, actual):
+        with self.changed:
+            mapping[captured] = actual
+            self.changed.notify_all()
+
+
+class Command(BaseCommand):
+    help = ('Воспроизводит захват трафика (TrafficCaptureMiddleware) на новой тестовой БД в реальном '
+            'или ускоренном темпе и печатает задержки по эндпоинтам')
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Файлы захвата (можно шаблоны: logs/traffic/capture-*.jsonl*)')
+        parser.add_argument('--speed', type=float, default=1.0, help='Во сколько раз быстрее оригинала')
+        parser.add_argument('--lanes', type=int, default=8,
+                            help='Параллельных полос; запросы одного пользователя идут по порядку в одной полосе')
+        parser.add_argument('--limit', type=int, help='Не больше стольких запросов')
+        parser.add_argument('--keep-rate-limit', action='store_true', help='Не отключать лимиты запросов')
+
+    def handle(self, *args, **options):
+        paths = sorted({path for pattern in options['files'] for path in glob.glob(pattern)})
+        if not paths:
+            raise CommandError('Файлы захвата не найдены')
+        entries = read_capture(paths)[:options['limit']]
+        if not entries:
+            raise CommandError('Захват пуст')
+        if options['speed'] <= 0:
+            raise CommandError('--speed должен быть больше нуля')
+
+        lanes = options['lanes']
+        if connection.vendor == 'sqlite' and lanes > 1:
+            # Тестовая SQLite в памяти не переносит параллельной записи из нескольких потоков
+            self.stdout.write('SQLite: воспроизведение в одну полосу')
+            lanes = 1
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            overrides = {'TRAFFIC_CAPTURE_ENABLED': False, 'PROFILING_ENABLED': False}
+            if not options['keep_rate_limit']:
+                overrides['RATE_LIMIT_ENABLED'] = False
+            with override_settings(**overrides):
+                results, elapsed = self._replay(entries, lanes, options['speed'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        self._report(entries, results, elapsed)
+
+    def _replay(self, entries, lanes, speed):
+        by_lane = defaultdict(list)
+        for entry in entries:
+            by_lane[hash(entry['u']) % lanes].append(entry)
+        state = ReplayState()
+        results = []
+        results_lock = threading.Lock()
+        first_ts = entries[0]['ts']
+        started = time.monotonic()
+
+        def run_lane(lane_entries):
+            client = Client()
+            for entry in lane_entries:
+                due = started + (entry['ts'] - first_ts) / 1000 / speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                lag_ms = max(0.0, (time.monotonic() - due) * 1000)
+                result = self._send(client, state, entry)
+                result['lag_ms'] = lag_ms
+                with results_lock:
+                    results.append(result)
+
+        def run_thread(lane_entries):
+            try:
+                run_lane(lane_entries)
+            finally:
+                connection.close()  # Соединение этого потока
+
+        if len(by_lane) == 1:
+            run_lane(entries)  # Одна полоса - в текущем потоке, с уже открытым соединением
+        else:
+            threads = [threading.Thread(target=run_thread, args=(lane_entries,)) for lane_entries in by_lane.values()]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return results, time.monotonic() - started
+
+    def _send(self, client, state, entry):
+        endpoint = entry['e']
+        user = entry['u']
+        kwargs = {}
+        params = dict(entry.get('p') or {})
+        query = dict(entry.get('q') or {})
+
+        captured_room = (entry.get('kw') or {}).get('room_id') or params.get('room_id')
+        room_id = None
+        if captured_room:
+            room_id = state.room(captured_room)
+            if room_id is None:
+                return {'e': endpoint, 'status': 'unmapped'}
+            params.pop('room_id', None)
+            if 'room_id' in (entry.get('kw') or {}):
+                kwargs['room_id'] = room_id
+            else:
+                params['room_id'] = room_id
+
+        team_index = (entry.get('kw') or {}).get('team_index', params.pop('team_index', None))
+        if team_index is not None:
+            team_id = self._team_id(client, state, room_id, team_index)
+            if team_id is None:
+                return {'e': endpoint, 'status': 'unmapped'}
+            if 'team_index' in (entry.get('kw') or {}):
+                kwargs['team_id'] = team_id
+            else:
+                params['team_id'] = team_id
+        if params.get('word_pack_id'):
+            params['word_pack_id'] = state.packs.get(params['word_pack_id'], '')
+        if 'words' in params:
+            params['words'] = '\n'.join(f'слово{i}' for i in range(params['words']))
+        if 'actions' in params:
+            params['actions'] = json.dumps(params['actions'])
+
+        try:
+            path = reverse(endpoint, kwargs=kwargs)
+        except NoReverseMatch:
+            return {'e': endpoint, 'status': 'unmapped'}
+
+        headers = {'HTTP_X_TELEGRAM_USER_ID': user}
+        token = state.tokens.get((room_id, user))
+        if token:
+            headers['HTTP_X_PLAYER_TOKEN'] = token
+        if entry.get('k'):
+            headers['HTTP_IDEMPOTENCY_KEY'] = uuid.uuid4().hex
+
+        clock = time.perf_counter()
+        if entry['m'] == 'POST':
+            response = client.post(f'{path}?{urlencode(query)}' if query else path, params, **headers)
+        else:
+            response = client.get(path, query, **headers)
+        duration_ms = (time.perf_counter() - clock) * 1000
+
+        if response.get('Content-Type', '').startswith('application/json'):
+            self._learn(state, entry, room_id, user, response)
+        return {'e': endpoint, 'status': response.status_code, 'ms': duration_ms}
+
+    def _learn(self, state, entry, room_id, user, response):
+        try:
+            data = response.json()
+        except ValueError:
+            return
+        created = entry.get('o') or {}
+        if created.get('room_id') and data.get('room_id'):
+            state.remember(state.rooms, created['room_id'], data['room_id'])
+            room_id = data['room_id']
+        if created.get('word_pack_id') and data.get('word_pack_id'):
+            state.remember(state.packs, created['word_pack_id'], data['word_pack_id'])
+        if data.get('player_token') and room_id:
+            state.tokens[(room_id, user)] = data['player_token']
+
+    def _team_id(self, client, state, room_id, index):
+        key = (room_id, index)
+        if key not in state.teams and room_id:
+            response = client.get(reverse('spectate_state', kwargs={'room_id': room_id}))
+            if response.status_code == 200:
+                for i, team in enumerate(response.json().get('teams', [])):
+                    state.teams[(room_id, i)] = team['id']
+        return state.teams.get(key)
+
+    def _report(self, entries, results, elapsed):
+        span = (entries[-1]['ts'] - entries[0]['ts']) / 1000
+        self.stdout.write(f'Запросов {len(results)} за {elapsed:.1f} с (в захвате {span:.1f} с)')
+        self.stdout.write(f"{'endpoint':24} {'count':>6} {'2xx':>5} {'4xx':>5} {'5xx':>5} {'skip':>5} {'p50 ms':>7} {'p95 ms':>7}")
+        by_endpoint = defaultdict(list)
+        for result in results:
+            by_endpoint[result['e']].append(result)
+        for endpoint, items in sorted(by_endpoint.items()):
+            classes = Counter(
+                'skip' if item['status'] == 'unmapped' else f"{item['status'] // 100}xx" for item in items
+            )
+            timings = sorted(item['ms'] for item in items if 'ms' in item)
+            p50 = statistics.median(timings) if timings else 0
+            p95 = timings[int(len(timings) * 0.95)] if timings else 0
+            self.stdout.write(
+                f"{endpoint:24} {len(items):>6} {classes['2xx']:>5} {classes['4xx']:>5} {classes['5xx']:>5} "
+                f"{classes['skip']:>5} {p50:>7.1f} {p95:>7.1f}"
+            )
+        lags = sorted(result['lag_ms'] for result in results)
+        self.stdout.write(f'Отставание от графика: p95 {lags[int(len(lags) * 0.95)]:.0f} мс, максимум {lags[-1]:.0f} мс')
+
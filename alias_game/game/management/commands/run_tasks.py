@@ -0,0 +1,29 @@
+# game/management/commands/run_tasks.py
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from game.background import ensure_periodic, run_pending, schedule_periodic
+
+class Command(BaseCommand):
+    help = 'Воркер фоновых задач: разбирает очередь BackgroundTask и запускает периодические задачи'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Обработать готовые задачи и выйти')
+        parser.add_argument('--interval', type=float, default=1.0, help='Пауза между опросами очереди, сек')
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--no-periodic', action='store_true', help='Не запускать BACKGROUND_PERIODIC_TASKS')
+
+    def handle(self, *args, **options):
+        periodic = {} if options['no_periodic'] else settings.BACKGROUND_PERIODIC_TASKS
+        # Сроки периодических задач общие в БД: при нескольких воркерах каждую ставит только один
+        ensure_periodic(periodic)
+        while True:
+            schedule_periodic(periodic)
+
+            processed = run_pending(batch_size=options['batch_size'])
+            if processed:
+                self.stdout.write(f'Выполнено задач: {processed}')
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
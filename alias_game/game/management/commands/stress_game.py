@@ -0,0 +1,66 @@
+# game/management/commands/stress_game.py
+import os
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from game.stress import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = ('Многопоточный стресс-тест гонок хода и счета на новой тестовой БД: проверяет инварианты '
+            'и печатает пропускную способность')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Через запятую: ' + ', '.join(SCENARIOS))
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--rooms', type=int, default=8)
+        parser.add_argument('--rounds', type=int, default=5, help='Истечений таймера / сбросов на комнату')
+        parser.add_argument('--actions', type=int, default=100, help='Угадываний и пропусков на комнату (scoring); больше, чем слов, - проверяет и передачу хода')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'].split(',')
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(unknown)}')
+
+        test_file = None
+        if connection.vendor == 'sqlite':
+            # Тестовая SQLite в памяти (shared cache) не ждет блокировок, а сразу падает - нужен файл
+            fd, test_file = tempfile.mkstemp(suffix='.sqlite3', prefix='stress-')
+            os.close(fd)
+            connection.settings_dict['TEST']['NAME'] = test_file
+        else:
+            # Свое имя, чтобы не пересоздать БД идущего рядом manage.py test
+            connection.settings_dict['TEST']['NAME'] = f"test_stress_{connection.settings_dict['NAME']}"
+        self.stdout.write(f'БД: {connection.vendor}, потоков {options["threads"]}, комнат {options["rooms"]}')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        failed = False
+        try:
+            with override_settings(RATE_LIMIT_ENABLED=False, TRAFFIC_CAPTURE_ENABLED=False, PROFILING_ENABLED=False):
+                self.stdout.write(f"{'scenario':12} {'requests':>8} {'req/s':>8}  статусы")
+                for name in names:
+                    result = self._run(name, options)
+                    statuses = ', '.join(f'{key}: {count}' for key, count in sorted(result.statuses.items(), key=str))
+                    self.stdout.write(f'{name:12} {result.requests:>8} {result.throughput:>8.0f}  {statuses}')
+                    for violation in result.violations:
+                        self.stderr.write(f'  нарушение: {violation}')
+                    failed = failed or bool(result.violations)
+        finally:
+            connection.close()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            if test_file and os.path.exists(test_file):
+                os.remove(test_file)
+        if failed:
+            raise CommandError('Инварианты нарушены')
+        self.stdout.write(self.style.SUCCESS('Инварианты соблюдены'))
+
+    def _run(self, name, options):
+        scenario = SCENARIOS[name]
+        if name == 'scoring':
+            return scenario(rooms=options['rooms'], actions=options['actions'], threads=options['threads'])
+        return scenario(rooms=options['rooms'], rounds=options['rounds'], threads=options['threads'])
@@ -0,0 +1,178 @@
+# game/middleware.py
+
+import hashlib
+import math
+import time
+import logging
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.http import HttpResponse, JsonResponse
+from django.urls import resolve, Resolver404
+
+logger = logging.getLogger(__name__)
+
+
+def get_client_key(request):
+    """Идентификатор клиента для лимитов без обращения к БД: пользователь Telegram/веба или IP."""
+    user_id = (
+        request.GET.get('tg_user_id')
+        or request.headers.get('X-Telegram-User-Id')
+        or request.COOKIES.get('alias_web_user_id')
+    )
+    if not user_id and request.method == 'POST':
+        user_id = request.POST.get('tg_user_id')
+    if user_id:
+        return f"u:{user_id}"
+    return f"ip:{request.META.get('REMOTE_ADDR', 'unknown')}"
+
+
+def take_token(key, capacity, refill_per_second, now=None):
+    """Забрать один токен из корзины `key`.
+
+    Возвращает (allowed, retry_after_seconds). Состояние корзины хранится в кэше default:
+    с Redis (REDIS_URL) лимит общий для всех воркеров, с LocMem - свой у каждого процесса.
+    Чтение и запись не атомарны: при гонке корзина может пропустить пару лишних запросов,
+    что для защиты от зацикленной вкладки допустимо.
+    """
+    now = time.time() if now is None else now
+    tokens, updated_at = cache.get(key) or (capacity, now)
+
+    tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+    # Корзина нужна только пока не наполнилась заново
+    ttl = max(1, math.ceil(capacity / refill_per_second))
+
+    if tokens >= 1:
+        cache.set(key, (tokens - 1, now), timeout=ttl)
+        return True, 0
+    cache.set(key, (tokens, now), timeout=ttl)
+    return False, (1 - tokens) / refill_per_second
+
+
+class RateLimitMiddleware:
+    """Token bucket на пользователя и комнату для AJAX API игры.
+
+    Бюджеты задаются по имени URL в settings.RATE_LIMITS. Проверка выполняется
+    до вызова view, то есть до любых запросов к БД.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.RATE_LIMIT_ENABLED:
+            return self.get_response(request)
+
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return self.get_response(request)
+
+        budget = settings.RATE_LIMITS.get(match.url_name)
+        if budget is None:
+            return self.get_response(request)
+
+        client_key = get_client_key(request)
+        room_id = match.kwargs.get('room_id', '')
+        key = f"ratelimit:{match.url_name}:{room_id}:{client_key}"
+        allowed, retry_after = take_token(key, budget['capacity'], budget['refill_per_second'])
+        if allowed:
+            return self.get_response(request)
+
+        retry_after = max(1, math.ceil(retry_after))
+        logger.warning("Rate limit exceeded: %s %s (%s)", match.url_name, room_id, client_key)
+        response = JsonResponse({
+            'status': 'error',
+            'message': 'Слишком много запросов. Попробуйте позже.',
+            'retry_after': retry_after,
+        }, status=429)
+        response['Retry-After'] = str(retry_after)
+        return response
+
+
+IDEMPOTENCY_IN_PROGRESS = 'in-progress'
+
+
+def get_idempotency_key(request):
+    """Ключ идемпотентности из заголовка Idempotency-Key или поля idempotency_key."""
+    key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+    if key and len(key) <= 200:
+        return key
+    return None
+
+
+class IdempotencyMiddleware:
+    """Повтор POST игры с тем же ключом идемпотентности возвращает сохраненный ответ.
+
+    Ключ ограничен клиентом и URL; клиент выдает один ключ на действие пользователя и
+    повторяет его для повторного нажатия и повторной отправки, пока не получит ответ. Первый запрос занимает ключ на время
+    выполнения, его ответ хранится settings.IDEMPOTENCY_TTL_SECONDS в отдельном ограниченном
+    кэше settings.IDEMPOTENCY_CACHE. Повтор не доходит до view и не обращается к БД; повтор
+    во время выполнения первого запроса получает 409. Сохраняются только успешные (2xx)
+    ответы: после ошибки тот же запрос можно повторить с тем же ключом.
+
+    Ключ проверяется в process_view, а middleware стоит после CsrfViewMiddleware: сохраненный
+    ответ отдается только запросу, прошедшему проверку CSRF.
+
+    С REDIS_URL кэш общий для всех воркеров; без него - память процесса, и повтор, попавший
+    в другой воркер, выполнится заново (от двойного применения там защищают проверки хода
+    и номеров действий во view).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.idempotency_store_key = None
+        try:
+            response = self.get_response(request)
+        except Exception:
+            if request.idempotency_store_key:
+                caches[settings.IDEMPOTENCY_CACHE].delete(request.idempotency_store_key)
+            raise
+
+        key = request.idempotency_store_key
+        if key is None:
+            return response  # Ключа нет, повтор или запрос отклонен до view
+        store = caches[settings.IDEMPOTENCY_CACHE]
+        content_type = response.get('Content-Type', '')
+        if (200 <= response.status_code < 300
+                and not response.streaming and content_type.startswith('application/json')):
+            store.set(key, (response.status_code, content_type, response.content),
+                      timeout=settings.IDEMPOTENCY_TTL_SECONDS)
+        else:
+            store.delete(key)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method != 'POST' or not view_func.__module__.startswith('game.'):
+            return None
+        idempotency_key = get_idempotency_key(request)
+        if not idempotency_key:
+            return None
+
+        store = caches[settings.IDEMPOTENCY_CACHE]
+        match = request.resolver_match
+        digest = hashlib.sha256(
+            f"{match.url_name}:{view_kwargs.get('room_id', '')}:{get_client_key(request)}:{idempotency_key}".encode()
+        ).hexdigest()
+        key = f"idempotency:{digest}"
+
+        if not store.add(key, IDEMPOTENCY_IN_PROGRESS, timeout=settings.IDEMPOTENCY_LOCK_SECONDS):
+            stored = store.get(key)
+            if stored == IDEMPOTENCY_IN_PROGRESS:
+                response = JsonResponse({
+                    'status': 'error',
+                    'message': 'Запрос уже обрабатывается.',
+                }, status=409)
+                response['Retry-After'] = '1'
+                return response
+            if stored is not None:
+                status, content_type, content = stored
+                response = HttpResponse(content, status=status, content_type=content_type)
+                response['Idempotent-Replayed'] = 'true'
+                return response
+            # Запись успела истечь между add и get - выполняем как новый запрос
+            store.set(key, IDEMPOTENCY_IN_PROGRESS, timeout=settings.IDEMPOTENCY_LOCK_SECONDS)
+
+        request.idempotency_store_key = key  # Ответ view сохранит __call__
+        return None
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0002_archivedgame'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='is_large_room',
+            field=models.BooleanField(default=False),
+        ),
+    ]
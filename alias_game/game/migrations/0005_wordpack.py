@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-19 03:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0004_backgroundtask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WordPack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('creator_telegram_id', models.CharField(max_length=100)),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('word_count', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='word_pack',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='game.wordpack'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0005_wordpack'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='last_action_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.9 on 2026-10-19 04:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Room = apps.get_model('game', 'Room')
+    Team = apps.get_model('game', 'Team')
+    Player = apps.get_model('game', 'Player')
+    for model, fk in ((Room, 'room'), (Team, 'team')):
+        counts = (
+            Player.objects.filter(**{fk: OuterRef('pk')}).order_by()
+            .values(fk).annotate(n=Count('id')).values('n')
+        )
+        model.objects.update(player_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0006_room_last_action_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='player_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='player_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.9 on 2026-10-19 04:05
+
+import zlib
+
+from django.db import migrations, models
+
+# Встроенные слова на момент миграции: индексы битов должны совпадать с ними, а не с
+# текущим game/words.json, который может измениться позже
+BUILTIN_WORDS = {
+    'easy': (
+        'apple', 'house', 'cat', 'sun', 'tree', 'book', 'car', 'ball', 'cup', 'shoe', 'dog', 'milk',
+        'bed', 'chair', 'moon', 'star', 'door', 'fish', 'hand', 'nose', 'ear', 'mouth', 'eye',
+        'leg', 'arm', 'foot', 'water', 'fire', 'sky', 'grass', 'hat', 'coat', 'sock', 'glove',
+        'key', 'clock', 'table', 'lamp', 'phone', 'bag',
+    ),
+    'medium': (
+        'computer', 'elephant', 'bicycle', 'guitar', 'flower', 'mountain', 'rainbow', 'umbrella',
+        'sandwich', 'window', 'glasses', 'pencil', 'camera', 'keyboard', 'telephone', 'sweater',
+        'diamond', 'octopus', 'pyramid', 'rocket', 'island', 'desert', 'forest', 'ocean', 'river',
+        'bridge', 'castle', 'robot', 'dragon', 'unicorn', 'butterfly', 'spider', 'penguin',
+        'giraffe', 'zebra', 'dolphin', 'whale', 'parrot', 'ostrich', 'kangaroo',
+    ),
+    'hard': (
+        'ephemeral', 'ubiquitous', 'serendipity', 'cacophony', 'eloquence', 'paradox', 'melancholy',
+        'quixotic', 'luminous', 'nebulous', 'plethora', 'benevolent', 'malevolent', 'chrysanthemum',
+        'onomatopoeia', 'photosynthesis', 'metamorphosis', 'extravaganza', 'philanthropy',
+        'chameleon', 'labyrinth', 'renaissance', 'silhouette', 'constellation', 'magnanimous',
+        'egregious', 'idiosyncrasy', 'juxtaposition', 'sophisticated', 'vicarious', 'xenophobia',
+        'zeitgeist', 'esoteric', 'capricious', 'facetious', 'gregarious', 'harbinger', 'impeccable',
+        'jovial', 'kudos',
+    ),
+}
+
+
+def lists_to_mask(apps, schema_editor):
+    Room = apps.get_model('game', 'Room')
+    pack_words = {}
+    for room in Room.objects.filter(status='playing').select_related('word_pack').iterator():
+        guessed, skipped = room.words_in_round_guessed or [], room.words_in_round_skipped or []
+        if not guessed and not skipped:
+            continue
+        if room.word_pack_id:
+            if room.word_pack_id not in pack_words:
+                pack_words[room.word_pack_id] = zlib.decompress(bytes(room.word_pack.data)).decode('utf-8').split('\n')
+            words = pack_words[room.word_pack_id]
+        else:
+            words = BUILTIN_WORDS[room.difficulty]
+        index = {word: i for i, word in enumerate(words)}
+        mask = bytearray()
+        for word in guessed + skipped:
+            i = index.get(word)
+            if i is None:
+                continue
+            if (i >> 3) >= len(mask):
+                mask.extend(bytes((i >> 3) + 1 - len(mask)))
+            mask[i >> 3] |= 1 << (i & 7)
+        room.words_used = bytes(mask)
+        room.words_guessed_count = len(guessed)
+        room.words_skipped_count = len(skipped)
+        room.save(update_fields=['words_used', 'words_guessed_count', 'words_skipped_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0007_player_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='words_guessed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='words_skipped_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='words_used',
+            field=models.BinaryField(blank=True, default=bytes),
+        ),
+        migrations.RunPython(lists_to_mask, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='room',
+            name='words_in_round_guessed',
+        ),
+        migrations.RemoveField(
+            model_name='room',
+            name='words_in_round_skipped',
+        ),
+    ]
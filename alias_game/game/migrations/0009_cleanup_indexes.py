@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-19 04:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0008_room_word_usage_bitset'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['last_seen', 'room'], name='game_player_last_se_5bab27_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['created_at', 'status'], name='game_room_created_d71f0b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['status', 'last_activity'], name='game_room_status_47a51d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['last_activity'], name='game_room_last_ac_a4e3bd_idx'),
+        ),
+    ]
@@ -1,14 +1,99 @@
 # game/models.py
 
+from django.conf import settings
 from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
 from django.utils import timezone
+import copy
+import json
+import zlib
 import random
 import string
 import secrets
 from django.db import connection
 from contextlib import contextmanager
 
-class Room(models.Model):
+class DirtyFieldsMixin:
+    """Сохранение только измененных полей.
+
+    При загрузке из БД и после каждого сохранения запоминаются значения полей. save() без
+    update_fields пишет только поля, отличающиеся от запомненных, а если изменений нет -
+    не делает UPDATE вообще. Поля из untracked_fields (счетчики, меняющиеся через F())
+    при таком сохранении не пишутся никогда.
+    """
+
+    untracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_fields()
+        return instance
+
+    def _tracked_fields(self):
+        return [
+            field for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in self.untracked_fields
+        ]
+
+    def _remember_fields(self, names=None):
+        """Запомнить текущие значения полей (names - имена полей; None - все загруженные)."""
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for field in self._tracked_fields():
+            if names is not None and field.name not in names and field.attname not in names:
+                continue
+            if field.attname in self.__dict__:  # Отложенные (defer/only) поля не загружены
+                value = self.__dict__[field.attname]
+                if isinstance(value, memoryview):  # BinaryField на PostgreSQL
+                    value = bytes(value)
+                loaded[field.attname] = copy.deepcopy(value)
+
+    def get_dirty_fields(self):
+        """Имена полей, измененных с момента загрузки или последнего сохранения."""
+        loaded = self.__dict__.get('_loaded_values', {})
+        return [
+            field.name for field in self._tracked_fields()
+            if field.attname in self.__dict__
+            and (field.attname not in loaded or loaded[field.attname] != self.__dict__[field.attname])
+        ]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and update_fields is None:
+            update_fields = self.get_dirty_fields()
+            if not update_fields:
+                return
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        self._remember_fields(None if update_fields is None else set(update_fields))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._remember_fields(None if fields is None else set(fields))
+
+
+class WordPack(models.Model):
+    """Пользовательский набор слов. Хранится сжатым, одинаковые наборы не дублируются."""
+    name = models.CharField(max_length=100)
+    creator_telegram_id = models.CharField(max_length=100)
+    content_hash = models.CharField(max_length=64, unique=True)  # sha256 нормализованного списка
+    word_count = models.IntegerField()
+    data = models.BinaryField()  # zlib('\n'.join(words))
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Word pack {self.name} ({self.word_count} words)"
+
+    @staticmethod
+    def pack(words):
+        return zlib.compress('\n'.join(words).encode('utf-8'), 9)
+
+    def unpack(self):
+        return zlib.decompress(bytes(self.data)).decode('utf-8').split('\n')
+
+
+class Room(DirtyFieldsMixin, models.Model):
     ROOM_STATUS_CHOICES = [
         ('waiting', 'Waiting for players'),
         ('playing', 'Playing'),
@@ -28,6 +113,8 @@ class Room(models.Model):
     num_teams = models.IntegerField(default=2)
     winning_score = models.IntegerField(default=50)
     penalty_for_skip = models.BooleanField(default=True)
+    is_large_room = models.BooleanField(default=False)  # Режим мероприятий: сотни игроков, сокращенные составы
+    word_pack = models.ForeignKey(WordPack, on_delete=models.SET_NULL, null=True, blank=True)  # Свои слова вместо встроенных
 
     status = models.CharField(max_length=10, choices=ROOM_STATUS_CHOICES, default='waiting')
     current_round = models.IntegerField(default=0)
@@ -38,15 +125,32 @@ class Room(models.Model):
     round_start_time = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     last_activity = models.DateTimeField(default=timezone.now)
-    words_in_round_guessed = models.JSONField(default=list)
-    words_in_round_skipped = models.JSONField(default=list)
+    # Слова, показанные в текущем ходе: бит i - слово с номером i в наборе комнаты (см. wordpacks)
+    words_used = models.BinaryField(default=bytes, blank=True)
+    words_guessed_count = models.PositiveIntegerField(default=0)
+    words_skipped_count = models.PositiveIntegerField(default=0)
     
     is_ending_round = models.BooleanField(default=False)  # Флаг что раунд завершается
     last_timer_end = models.DateTimeField(null=True, blank=True)  # Время последнего завершения
+    last_action_seq = models.PositiveIntegerField(default=0)  # Последний примененный номер действия клиента (пакеты действий)
+    player_count = models.PositiveIntegerField(default=0)  # Денормализованный счетчик, меняется только через F()
+
+    untracked_fields = ('player_count',)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'status']),  # cleanup_rooms
+            models.Index(fields=['status', 'last_activity']),  # archive_finished_rooms
+            models.Index(fields=['last_activity']),  # reap_inactive_room_players
+        ]
 
     def __str__(self):
         return f"Room {self.id} (Status: {self.status})"
 
+    @property
+    def max_players(self):
+        return settings.LARGE_ROOM_MAX_PLAYERS if self.is_large_room else settings.MAX_PLAYERS_PER_ROOM
+
     def _generate_candidate_id(self):
         """Генерация ID комнаты с минимумом коллизий"""
         # Используем 8 символов для уменьшения вероятности коллизий
@@ -64,18 +168,20 @@ class Room(models.Model):
                 import time
                 self.id = f"R{int(time.time()) % 1000000:06d}"
         
-        self.last_activity = timezone.now()
+        # Активность отмечаем только если комнату действительно меняют
+        if self._state.adding or kwargs.get('update_fields') is not None or self.get_dirty_fields():
+            self.last_activity = timezone.now()
         super().save(*args, **kwargs)
 
-    def get_current_team(self):
-        """Безопасное получение текущей команды"""
-        try:
-            teams = list(self.team_set.all().order_by('index'))
-            if teams and 0 <= self.current_team_index < len(teams):
-                return teams[self.current_team_index]
-        except (IndexError, Team.DoesNotExist):
-            pass
-        return None
+    def get_current_team(self, lock=False):
+        """Безопасное получение текущей команды (lock=True - с блокировкой строки, внутри транзакции)"""
+        if self.current_team_index < 0:
+            return None
+        # Берем одну команду по позиции, не загружая весь список
+        teams = self.team_set.order_by('index')
+        if lock:
+            teams = teams.select_for_update()
+        return teams[self.current_team_index:self.current_team_index + 1].first()
 
     def get_current_explainer(self):
         """Безопасное получение текущего объясняющего"""
@@ -84,40 +190,51 @@ class Room(models.Model):
             if not current_team:
                 return None
             
-            players_in_team = list(current_team.player_set.all().order_by('id'))
-            if not players_in_team:
-                return None
-            
+            # Берем одного игрока по позиции (LIMIT 1 OFFSET n), не перечисляя всю команду
+            players_in_team = current_team.player_set.order_by('id')
+            index = self.current_explainer_index_in_team
+            explainer = players_in_team[index:index + 1].first() if index >= 0 else None
+            if explainer:
+                return explainer
+
             # Корректируем индекс если вышел за пределы
-            if self.current_explainer_index_in_team >= len(players_in_team):
+            explainer = players_in_team.first()
+            if explainer:
                 self.current_explainer_index_in_team = 0
                 self.save(update_fields=['current_explainer_index_in_team'])
-            
-            return players_in_team[self.current_explainer_index_in_team % len(players_in_team)]
+            return explainer
         except Exception:
             return None
     
-    def advance_turn(self):
-        """Атомарное изменение хода с транзакцией"""
+    @property
+    def turn(self):
+        """Текущий ход: (раунд, команда, объясняющий в команде)."""
+        return (self.current_round, self.current_team_index, self.current_explainer_index_in_team)
+
+    def advance_turn(self, expected_turn=None):
+        """Атомарное изменение хода с транзакцией.
+
+        С expected_turn ход меняется, только если он все еще тот, что видел вызывающий:
+        два завершения одного и того же хода (две вкладки, таймер и последнее слово)
+        продвинут его один раз. Возвращает True, если ход сменился.
+        """
         with transaction.atomic():
             # Блокируем запись комнаты для предотвращения race conditions
             room = Room.objects.select_for_update().get(id=self.id)
+            if expected_turn is not None and room.turn != expected_turn:
+                return False  # Ход уже сменил другой запрос
             teams = list(room.team_set.all().order_by('index'))
             
-            if room.is_ending_round:
-                return  # Уже завершается
-            
-            room.is_ending_round = True
-            room.save(update_fields=['is_ending_round'])
-            
-            if not teams:
-                return
+            # Флаг is_ending_round не пишем отдельно: комната заблокирована до конца транзакции,
+            # и другие запросы увидят только итоговое состояние
+            if room.is_ending_round or not teams:
+                return False  # Уже завершается или некому ходить
             
             current_team = teams[room.current_team_index] if 0 <= room.current_team_index < len(teams) else teams[0]
-            players_in_team = list(current_team.player_set.all().order_by('id'))
+            team_size = current_team.player_count
             
-            if players_in_team:
-                room.current_explainer_index_in_team = (room.current_explainer_index_in_team + 1) % len(players_in_team)
+            if team_size:
+                room.current_explainer_index_in_team = (room.current_explainer_index_in_team + 1) % team_size
             else:
                 room.current_explainer_index_in_team = 0
             
@@ -127,8 +244,7 @@ class Room(models.Model):
                 room.current_round += 1
             
             # Сброс состояния раунда
-            room.words_in_round_guessed = []
-            room.words_in_round_skipped = []
+            room.reset_word_usage()
             room.current_word = None
             room.round_start_time = None
             room.last_activity = timezone.now()
@@ -136,60 +252,75 @@ class Room(models.Model):
             room.last_timer_end = timezone.now()
             room.save()
             
-            # Обновляем self
-            for field in ['current_team_index', 'current_explainer_index_in_team', 
-                         'current_round', 'current_word', 'round_start_time',
-                         'words_in_round_guessed', 'words_in_round_skipped']:
+            # Обновляем self; эти поля уже сохранены, повторный save() их не запишет
+            fields = ['current_team_index', 'current_explainer_index_in_team',
+                      'current_round', 'current_word', 'round_start_time',
+                      'words_used', 'words_guessed_count', 'words_skipped_count',
+                      'last_activity', 'is_ending_round', 'last_timer_end']
+            for field in fields:
                 setattr(self, field, getattr(room, field))
+            self._remember_fields(fields)
+        return True
+
+    def is_word_used(self, index):
+        mask = self.words_used
+        return (index >> 3) < len(mask) and bool(mask[index >> 3] & (1 << (index & 7)))
+
+    def mark_word_used(self, index):
+        mask = bytearray(self.words_used)
+        if (index >> 3) >= len(mask):
+            mask.extend(bytes((index >> 3) + 1 - len(mask)))
+        mask[index >> 3] |= 1 << (index & 7)
+        self.words_used = bytes(mask)
+
+    def reset_word_usage(self):
+        """Новый ход: пустая маска и нулевые счетчики, запись не зависит от числа сыгранных слов."""
+        self.words_used = b''
+        self.words_guessed_count = 0
+        self.words_skipped_count = 0
+
+    def reset_game(self):
+        """Вернуть комнату в ожидание: UPDATE измененных полей комнаты и один UPDATE счета всех команд."""
+        self.status = 'waiting'
+        self.current_round = 0
+        self.current_team_index = 0
+        self.current_explainer_index_in_team = 0
+        self.current_word = None
+        self.round_start_time = None
+        self.reset_word_usage()
+        self.is_ending_round = False
+        self.save()
+        Team.objects.filter(room_id=self.id).exclude(score=0).update(score=0)
 
     def cleanup_inactive_players(self, hours=1):
         """Удаление неактивных игроков"""
-        from datetime import timedelta
-        cutoff = timezone.now() - timedelta(hours=hours)
-        
-        inactive_players = self.player_set.filter(
-            room__last_activity__lt=cutoff
-        )
-        count = inactive_players.count()
-        inactive_players.delete()
-        return count
+        from .presence import reap_inactive_room_players
+        return reap_inactive_room_players(hours=hours, room_ids=[self.id])
     
     def remove_disconnected_players(self, timeout_minutes=5):
         """Удаление игроков, которые не активны более timeout_minutes минут"""
-        from datetime import timedelta
-        cutoff = timezone.now() - timedelta(minutes=timeout_minutes)
-    
-        inactive_players = self.player_set.filter(last_seen__lt=cutoff)
-        count = inactive_players.count()
-    
-        if count > 0:
-            # Перераспределяем игроков если нужно
-            for player in inactive_players:
-                if player.team:
-                    # Если игрок был объясняющим, переходим к следующему
-                    if (self.current_explainer_index_in_team is not None and 
-                        player == self.get_current_explainer()):
-                        self.current_explainer_index_in_team = (
-                            self.current_explainer_index_in_team - 1) % max(1, player.team.player_set.count() - 1)
-        
-            inactive_players.delete()
-            self.save(update_fields=['current_explainer_index_in_team'])
-    
+        from .presence import reap_disconnected_players
+        count = reap_disconnected_players(timeout_minutes=timeout_minutes, room_ids=[self.id])
+        if count:
+            self.refresh_from_db(fields=['current_explainer_index_in_team'])
         return count
 
 
-class Team(models.Model):
+class Team(DirtyFieldsMixin, models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
     score = models.IntegerField(default=0)
     index = models.IntegerField()
+    player_count = models.PositiveIntegerField(default=0)  # Денормализованный счетчик, меняется только через F()
+
+    untracked_fields = ('player_count',)
 
     class Meta:
         unique_together = ('room', 'index')
         ordering = ['index']
 
     def __str__(self):
-        return f"{self.room.id} - Team {self.name} (Score: {self.score})"
+        return f"{self.room_id} - Team {self.name} (Score: {self.score})"
 
     def update_score(self, delta):
         """Атомарное обновление счета команды"""
@@ -201,7 +332,7 @@ class Team(models.Model):
         return self.score
 
 
-class Player(models.Model):
+class Player(DirtyFieldsMixin, models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
     team = models.ForeignKey(Team, on_delete=models.SET_NULL, null=True, blank=True)
     telegram_id = models.CharField(max_length=100)
@@ -212,15 +343,120 @@ class Player(models.Model):
     class Meta:
         unique_together = ('room', 'telegram_id')
         ordering = ['joined_at']
+        indexes = [models.Index(fields=['last_seen', 'room'])]  # reap_disconnected_players
 
     def __str__(self):
-        return f"{self.telegram_username} ({self.telegram_id}) in Room {self.room.id}"
+        return f"{self.telegram_username} ({self.telegram_id}) in Room {self.room_id}"
 
     def save(self, *args, **kwargs):
         self.last_seen = timezone.now()
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        # Комната и команда на момент загрузки - чтобы при переносе игрока поправить счетчики
+        loaded = self.__dict__.get('_loaded_values', {})
+        old_room_id = loaded.get('room_id', self.room_id)
+        old_team_id = loaded.get('team_id', self.team_id)
+
+        def changed(name, old_value):
+            return (not adding and getattr(self, f'{name}_id') != old_value
+                    and (update_fields is None or name in update_fields or f'{name}_id' in update_fields))
+
+        room_changed, team_changed = changed('room', old_room_id), changed('team', old_team_id)
+        if not adding and not room_changed and not team_changed:
+            super().save(*args, **kwargs)
+            return
+
+        # savepoint=False: внутри транзакции вьюхи лишний SAVEPOINT не нужен, ошибка откатит ее целиком
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if adding:
+                adjust_player_counts({self.room_id: 1}, {self.team_id: 1})
+            else:
+                # Перенос в другую комнату (админка)
+                adjust_player_counts(
+                    {old_room_id: -1, self.room_id: 1} if room_changed else {},
+                    {old_team_id: -1, self.team_id: 1} if team_changed else {},
+                )
+
+    def delete(self, *args, **kwargs):
+        room_id, team_id = self.room_id, self.team_id
+        with transaction.atomic(savepoint=False):
+            result = super().delete(*args, **kwargs)
+            adjust_player_counts({room_id: -1}, {team_id: -1})
+        return result
 
     def touch(self):
         """Обновить время последней активности"""
         self.last_seen = timezone.now()
-        self.save(update_fields=['last_seen'])
\ No newline at end of file
+        self.save(update_fields=['last_seen'])
+
+
+def adjust_player_counts(room_deltas, team_deltas):
+    """Сдвинуть счетчики игроков: {room_id: delta}, {team_id: delta}, по одному UPDATE на модель."""
+    for model, deltas in ((Room, room_deltas), (Team, team_deltas)):
+        deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and delta}
+        if not deltas:
+            continue
+        counter = models.IntegerField()
+        model.objects.filter(pk__in=deltas).update(player_count=Greatest(
+            Case(*[When(pk=pk, then=F('player_count') + Value(delta, output_field=counter))
+                   for pk, delta in deltas.items()],
+                 default=F('player_count'), output_field=counter),
+            Value(0, output_field=counter),
+            output_field=counter,
+        ))
+
+
+class ArchivedGame(models.Model):
+    """Завершенная игра, вынесенная из горячих таблиц в один сжатый JSON."""
+    room_id = models.CharField(primary_key=True, max_length=10)
+    created_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    data = models.BinaryField()  # zlib(JSON) с командами, игроками и счетом
+
+    def __str__(self):
+        return f"Archived game {self.room_id}"
+
+    @staticmethod
+    def pack(payload):
+        return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    @property
+    def payload(self):
+        return json.loads(zlib.decompress(bytes(self.data)).decode('utf-8'))
+
+
+class BackgroundTask(models.Model):
+    """Задача в надежной очереди (бэкенд 'database' в game.background)."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=4)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)  # Когда воркер забрал задачу (аренда)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.status}, attempt {self.attempts})"
+
+
+class PeriodicTask(models.Model):
+    """Срок следующего запуска периодической задачи, общий для всех воркеров run_tasks."""
+    name = models.CharField(max_length=200, primary_key=True)
+    next_run_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} (next {self.next_run_at})"
@@ -0,0 +1,164 @@
+# game/presence.py
+
+import logging
+from collections import Counter
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Room, Team, Player, adjust_player_counts
+from .snapshots import invalidate_turn_state
+
+logger = logging.getLogger(__name__)
+
+DELETE_CHUNK_SIZE = 500
+
+
+def _shift_explainer_index(roster_ids, removed_ids, index):
+    """Новый индекс объясняющего после удаления `removed_ids` из упорядоченного состава.
+
+    Если ушел сам объясняющий, ход переходит к следующему за ним игроку.
+    """
+    if not 0 <= index < len(roster_ids):
+        index = 0  # Так же ведет себя Room.get_current_explainer при выходе за пределы
+    remaining = len(roster_ids) - len(removed_ids)
+    if remaining <= 0:
+        return 0
+    removed_before = sum(1 for player_id in roster_ids[:index] if player_id in removed_ids)
+    return (index - removed_before) % remaining
+
+
+def _lock_rooms(rooms):
+    """Заблокировать комнаты по возрастанию id.
+
+    Вьюхи сначала блокируют комнату, потом пишут игроков; сборщик берет блокировки в том же
+    порядке (комнаты, затем игроки), иначе на MySQL/PostgreSQL возможна взаимная блокировка.
+    """
+    return list(rooms.select_for_update().order_by('id').only('id', 'current_team_index', 'current_explainer_index_in_team'))
+
+
+def _fix_explainer_indexes(rooms, stale_by_room):
+    """Поправить индексы объясняющих в заблокированных комнатах `rooms` за фиксированное число запросов."""
+    rooms = [room for room in rooms if room.id in stale_by_room]
+    teams = Team.objects.filter(room_id__in=stale_by_room).order_by('room_id', 'index').values_list('id', 'room_id')
+    teams_by_room = {}
+    for team_id, room_id in teams:
+        teams_by_room.setdefault(room_id, []).append(team_id)
+
+    current_team_by_room = {}
+    for room in rooms:
+        room_teams = teams_by_room.get(room.id, [])
+        if 0 <= room.current_team_index < len(room_teams):
+            current_team_by_room[room.id] = room_teams[room.current_team_index]
+
+    rosters = {}
+    for player_id, team_id in (
+        Player.objects.filter(team_id__in=current_team_by_room.values())
+        .order_by('team_id', 'id').values_list('id', 'team_id')
+    ):
+        rosters.setdefault(team_id, []).append(player_id)
+
+    # Комнаты с одинаковым новым индексом обновляем одним UPDATE
+    rooms_by_new_index = {}
+    for room in rooms:
+        team_id = current_team_by_room.get(room.id)
+        if team_id is None:
+            continue
+        roster_ids = rosters.get(team_id, [])
+        removed_ids = stale_by_room[room.id] & set(roster_ids)
+        if not removed_ids:
+            continue
+        new_index = _shift_explainer_index(roster_ids, removed_ids, room.current_explainer_index_in_team)
+        if new_index != room.current_explainer_index_in_team:
+            rooms_by_new_index.setdefault(new_index, []).append(room.id)
+
+    for new_index, room_ids in rooms_by_new_index.items():
+        Room.objects.filter(id__in=room_ids).update(current_explainer_index_in_team=new_index)
+
+
+def _discount(rows):
+    """Уменьшить счетчики комнат и команд на удаленных игроков [(id, room_id, team_id), ...]."""
+    by_room = Counter(room_id for _, room_id, _ in rows)
+    by_team = Counter(team_id for _, _, team_id in rows if team_id is not None)
+    adjust_player_counts({k: -v for k, v in by_room.items()}, {k: -v for k, v in by_team.items()})
+
+
+def reap_disconnected_players(timeout_minutes=5, room_ids=None):
+    """Удалить игроков, не активных более `timeout_minutes` минут, во всех (или указанных) комнатах.
+
+    Работает множествами: поиск затронутых комнат, их блокировка и блокировка игроков,
+    фиксированное число запросов на правку индексов объясняющих во всех затронутых комнатах
+    и удаление пачками.
+    """
+    cutoff = timezone.now() - timedelta(minutes=timeout_minutes)
+    # Составы завершенных игр нужны архиву (archive_finished_rooms), их не трогаем
+    stale = (Player.objects.filter(last_seen__lt=cutoff).exclude(room__status='finished')
+             .order_by())  # Сортировка по joined_at тут не нужна
+    if room_ids is not None:
+        stale = stale.filter(room_id__in=room_ids)
+
+    with transaction.atomic():
+        candidate_room_ids = set(stale.values_list('room_id', flat=True))
+        if not candidate_room_ids:
+            return 0
+        rooms = _lock_rooms(Room.objects.filter(id__in=candidate_room_ids))
+        # Строки игроков блокируются до конца транзакции: вернувшийся игрок (touch last_seen) ждет
+        # удаления, поэтому счетчики уменьшаются ровно на удаленных
+        stale_rows = list(
+            stale.filter(room_id__in=[room.id for room in rooms])
+            .select_for_update().values_list('id', 'room_id', 'team_id')
+        )
+        if not stale_rows:
+            return 0
+
+        stale_by_room = {}
+        for player_id, room_id, _ in stale_rows:
+            stale_by_room.setdefault(room_id, set()).add(player_id)
+
+        _fix_explainer_indexes(rooms, stale_by_room)
+
+        stale_ids = [player_id for player_id, _, _ in stale_rows]
+        for start in range(0, len(stale_ids), DELETE_CHUNK_SIZE):
+            # Условие неактивности повторяется и в удалении: удаляются только те, кто все еще не вернулся
+            stale.filter(id__in=stale_ids[start:start + DELETE_CHUNK_SIZE]).delete()
+        _discount(stale_rows)
+
+    invalidate_turn_state(stale_by_room)
+
+    logger.info("Reaped %d disconnected players in %d rooms", len(stale_rows), len(stale_by_room))
+    return len(stale_rows)
+
+
+def reap_inactive_room_players(hours=2, room_ids=None):
+    """Удалить игроков из комнат, в которых не было активности более `hours` часов."""
+    cutoff = timezone.now() - timedelta(hours=hours)
+    players = Player.objects.filter(room__last_activity__lt=cutoff).exclude(room__status='finished').order_by()
+    if room_ids is not None:
+        players = players.filter(room_id__in=room_ids)
+    with transaction.atomic():
+        candidate_room_ids = set(players.values_list('room_id', flat=True))
+        if not candidate_room_ids:
+            return 0
+        # Неактивность перепроверяется под блокировкой комнат, игроки блокируются после них (см. _lock_rooms)
+        locked_ids = [room.id for room in _lock_rooms(Room.objects.filter(id__in=candidate_room_ids,
+                                                                          last_activity__lt=cutoff)
+                                                      .exclude(status='finished'))]
+        if not locked_ids:
+            return 0
+        rows = list(
+            Player.objects.filter(room_id__in=locked_ids).order_by()
+            .select_for_update().values_list('id', 'room_id', 'team_id')
+        )
+        if not rows:
+            return 0
+        Player.objects.filter(id__in=[player_id for player_id, _, _ in rows]).delete()
+        _discount(rows)
+    return len(rows)
+
+
+def sweep(timeout_minutes, inactive_room_hours):
+    """Один проход фонового сборщика по всем комнатам."""
+    return {
+        'disconnected': reap_disconnected_players(timeout_minutes=timeout_minutes),
+        'inactive_rooms': reap_inactive_room_players(hours=inactive_room_hours),
+    }
@@ -0,0 +1,147 @@
+# game/profiling.py
+"""Профилирование отдельных запросов в продакшене.
+
+ProfilingMiddleware включается настройкой PROFILING_ENABLED; без нее Django убирает
+ее из цепочки (MiddlewareNotUsed), и запросы не платят ничего. Профилируется доля
+PROFILING_SAMPLE_RATE запросов и запросы с заголовком X-Profile-Token, равным
+PROFILING_TOKEN. Результат - файл в PROFILING_DIR на каждый запрос:
+
+- 'sampler': поток раз в PROFILING_SAMPLER_INTERVAL_MS снимает стек потока запроса,
+  файл *.folded - свернутые стеки ("a;b;c 12"), готовые для flamegraph.pl и speedscope;
+- 'cprofile': cProfile, файл *.prof для pstats/snakeviz.
+
+Отчет по эндпоинтам строит manage.py profile_report.
+"""
+
+import cProfile
+import hmac
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+PROFILE_EXTENSIONS = {'sampler': '.folded', 'cprofile': '.prof'}
+
+
+def frame_label(code):
+    """Имя кадра для свернутого стека: функция (пакет/файл:строка), без ';' и пробелов."""
+    path = Path(code.co_filename)
+    where = '/'.join(path.parts[-2:])
+    return f'{code.co_name}({where}:{code.co_firstlineno})'.replace(';', ':').replace(' ', '_')
+
+
+class StackSampler:
+    """Периодически снимает стек одного потока и считает одинаковые стеки."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+_profile_seq = itertools.count()
+
+
+def profile_filename(endpoint, mode, duration_ms):
+    """<эндпоинт>.<время мс>.<pid>-<номер>.<длительность мс>ms<расширение> - эндпоинт читает profile_report.
+
+    Номер в процессе не дает двум запросам одной миллисекунды и длительности перезаписать профиль.
+    """
+    return (f'{endpoint}.{int(time.time() * 1000)}.{os.getpid()}-{next(_profile_seq)}.'
+            f'{int(duration_ms)}ms{PROFILE_EXTENSIONS[mode]}')
+
+
+def rotate_profiles(directory, max_files):
+    """Оставить в каталоге не больше max_files последних профилей."""
+    files = sorted(
+        (entry for entry in os.scandir(directory)
+         if entry.is_file() and entry.name.endswith(tuple(PROFILE_EXTENSIONS.values()))),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in files[:max(0, len(files) - max_files)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass  # Другой воркер удалил раньше
+
+
+class ProfilingMiddleware:
+    """Профилирует выборку запросов. Стоит последней в MIDDLEWARE, чтобы мерить в основном view."""
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        if settings.PROFILING_MODE not in PROFILE_EXTENSIONS:
+            raise ValueError(f'PROFILING_MODE должен быть одним из {", ".join(PROFILE_EXTENSIONS)}')
+        self.get_response = get_response
+        self.directory = Path(settings.PROFILING_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        if settings.PROFILING_MODE == 'cprofile':
+            profiler = cProfile.Profile()
+            response = profiler.runcall(self.get_response, request)
+        else:
+            profiler = StackSampler(threading.get_ident(), settings.PROFILING_SAMPLER_INTERVAL_MS / 1000)
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        endpoint = (match.url_name if match else None) or 'unresolved'
+        try:
+            path = self.directory / profile_filename(endpoint, settings.PROFILING_MODE, duration_ms)
+            if settings.PROFILING_MODE == 'cprofile':
+                profiler.dump_stats(path)
+            else:
+                profiler.dump(path)
+            rotate_profiles(self.directory, settings.PROFILING_MAX_FILES)
+        except OSError as e:
+            logger.warning("Could not write profile for %s: %s", endpoint, e)
+        return response
+
+    def should_profile(self, request):
+        token = request.headers.get('X-Profile-Token')
+        if token and settings.PROFILING_TOKEN:
+            return hmac.compare_digest(token, settings.PROFILING_TOKEN)
+        return random.random() < settings.PROFILING_SAMPLE_RATE
@@ -0,0 +1,79 @@
+# game/queryplans.py
+"""Планы горячих запросов: EXPLAIN и поиск полного сканирования таблиц (SQLite, MySQL, PostgreSQL)."""
+
+import json
+import re
+from datetime import timedelta
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Room, Team, Player, BackgroundTask
+
+# SQLite: "SCAN game_room" без индекса; "SCAN t USING INDEX ..." - обход индекса, не таблицы
+_SQLITE_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)(?! USING (?:COVERING )?INDEX)(?:\s|$)')
+_POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def hot_queries():
+    """[(имя, queryset), ...] - запросы фоновых задач и частых эндпоинтов с типичными параметрами."""
+    now = timezone.now()
+    room_id = 'EXPLAIN1'
+    return [
+        ('cleanup_rooms', Room.objects.filter(created_at__lt=now - timedelta(hours=24)).exclude(status__in=['playing', 'finished'])),
+        ('archive_finished_rooms', Room.objects.filter(status='finished', last_activity__lt=now - timedelta(hours=24))),
+        ('reap_disconnected_players', Player.objects.filter(last_seen__lt=now - timedelta(minutes=5))
+            .exclude(room__status='finished').order_by().values_list('room_id', flat=True)),
+        ('reap_room_disconnected_players', Player.objects.filter(last_seen__lt=now - timedelta(minutes=5),
+                                                                 room_id__in=[room_id])
+            .exclude(room__status='finished').order_by().values_list('id', 'room_id', 'team_id')),
+        ('reap_inactive_room_players', Player.objects.filter(room__last_activity__lt=now - timedelta(hours=2))
+            .exclude(room__status='finished').order_by().values_list('room_id', flat=True)),
+        ('room_teams', Team.objects.filter(room_id=room_id).order_by('index')),
+        ('room_player', Player.objects.filter(room_id=room_id, telegram_id='1')),
+        ('team_roster', Player.objects.filter(team_id=1).order_by('id')),
+        ('pending_tasks', BackgroundTask.objects.filter(
+            Q(status='pending', run_after__lte=now) | Q(status='running', claimed_at__lt=now - timedelta(minutes=10))
+        ).order_by('run_after')),
+    ]
+
+
+def explain(queryset):
+    """Текст плана запроса для текущей БД."""
+    if connection.vendor == 'mysql':
+        return queryset.explain(format='json')
+    return queryset.explain()
+
+
+def full_scans(plan, vendor=None):
+    """Таблицы, которые план читает целиком."""
+    vendor = vendor or connection.vendor
+    if vendor == 'sqlite':
+        return sorted(set(_SQLITE_SCAN.findall(plan)))
+    if vendor == 'postgresql':
+        return sorted(set(_POSTGRES_SCAN.findall(plan)))
+    if vendor == 'mysql':
+        tables = set()
+        _collect_mysql_scans(json.loads(plan), tables)
+        return sorted(tables)
+    return []
+
+
+def _collect_mysql_scans(node, tables):
+    if isinstance(node, dict):
+        if node.get('access_type') == 'ALL' and 'table_name' in node:
+            tables.add(node['table_name'])
+        for value in node.values():
+            _collect_mysql_scans(value, tables)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_mysql_scans(value, tables)
+
+
+def check_hot_queries():
+    """[(имя, план, таблицы с полным сканированием), ...] для всех горячих запросов."""
+    results = []
+    for name, queryset in hot_queries():
+        plan = explain(queryset)
+        results.append((name, plan, full_scans(plan)))
+    return results
@@ -0,0 +1,84 @@
+# game/responses.py
+"""JSON-ответы проекта: быстрый сериализатор (orjson, если установлен) и сжатие больших ответов."""
+
+import json
+import re
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - без orjson работает stdlib json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_django_default = DjangoJSONEncoder().default
+_accepts_gzip = re.compile(r'\bgzip\b')
+_accepts_br = re.compile(r'\bbr\b')
+
+
+def dumps(data, sort_keys=False):
+    """Сериализовать в UTF-8 байты. Типы, неизвестные orjson, обрабатывает DjangoJSONEncoder."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(data, default=_django_default, option=option)
+    return json.dumps(
+        data, cls=DjangoJSONEncoder, ensure_ascii=False, sort_keys=sort_keys, separators=(',', ':'),
+    ).encode('utf-8')
+
+
+class FastJsonResponse(HttpResponse):
+    """Замена JsonResponse с тем же вызовом: FastJsonResponse(data, status=...)."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def compress_body(content, accept_encoding):
+    """(encoding, compressed) для заголовка Accept-Encoding или (None, content), если сжимать нечем."""
+    if brotli is not None and _accepts_br.search(accept_encoding):
+        return 'br', brotli.compress(content, quality=settings.JSON_BROTLI_QUALITY)
+    if _accepts_gzip.search(accept_encoding):
+        return 'gzip', compress_string(content)
+    return None, content
+
+
+class JsonCompressionMiddleware:
+    """Сжатие JSON-ответов больше JSON_COMPRESS_MIN_BYTES (brotli, если установлен, иначе gzip).
+
+    HTML страниц не трогаем: в нем CSRF-токен, а сжатие страниц с секретами открывает BREACH.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.streaming or response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith('application/json')
+                or len(response.content) < settings.JSON_COMPRESS_MIN_BYTES):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding, compressed = compress_body(response.content, request.headers.get('Accept-Encoding', ''))
+        if encoding is None or len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            # Сжатое тело отличается побайтно, но семантически то же
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,88 @@
+# game/singleflight.py
+"""Single-flight: одно вычисление на ключ, остальные ждут и берут готовый результат.
+
+Внутри процесса ожидающие потоки ждут события от потока-лидера. Между воркерами
+лидер выбирается через cache.add, остальные опрашивают кэш, пока не появится
+результат; это работает только с общим кэшем (Redis, REDIS_URL) - с LocMem у
+каждого процесса свой лидер. Если лидер не успел за SINGLE_FLIGHT_WAIT_SECONDS
+(упал или завис), ожидающий считает значение сам - без single-flight, но и без отказа.
+"""
+
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+_MISSING = object()
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def single_flight(key, build, ttl):
+    """Вернуть результат build() для `key`, вычисляя его не более одного раза на всех.
+
+    Результат хранится в кэше default `ttl` секунд, поэтому ключ должен включать
+    версию данных (например, комнату и ее версию), иначе устаревшее значение
+    проживет до конца ttl.
+    """
+    result_key = f'singleflight:{key}'
+    cached = cache.get(result_key, _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        # Тот же ключ уже считается в этом процессе
+        if call.done.wait(settings.SINGLE_FLIGHT_WAIT_SECONDS):
+            if call.error is not None:
+                raise call.error
+            return call.result
+        return build()
+
+    try:
+        call.result = _build_shared(key, result_key, build, ttl)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+def _build_shared(key, result_key, build, ttl):
+    lock_key = f'singleflight-lock:{key}'
+    wait = settings.SINGLE_FLIGHT_WAIT_SECONDS
+    if not cache.add(lock_key, 1, timeout=max(1, int(wait) + 1)):
+        # Другой воркер уже строит значение - ждем его в кэше
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(settings.SINGLE_FLIGHT_POLL_SECONDS)
+            cached = cache.get(result_key, _MISSING)
+            if cached is not _MISSING:
+                return cached
+        return build()
+
+    try:
+        result = build()
+        cache.set(result_key, result, timeout=ttl)
+        return result
+    finally:
+        cache.delete(lock_key)
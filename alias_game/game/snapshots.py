@@ -0,0 +1,171 @@
+# game/snapshots.py
+
+import hashlib
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Room, Player
+from .responses import dumps
+from .singleflight import single_flight
+
+
+def room_version(room):
+    """Версия состояния комнаты: меняется при каждом сохранении Room."""
+    return room.last_activity.isoformat() if room.last_activity else ''
+
+
+def current_explainer_id(room):
+    """id текущего объясняющего из кэша состояния хода.
+
+    Значение привязано к индексам команды и объясняющего, поэтому смена хода
+    отсекает его сама, а слова и счет внутри хода кэш не сбрасывают. Изменения
+    составов сбрасывают кэш явно (invalidate_turn_state).
+    """
+    key = f'turn_state:{room.id}'
+    cached = cache.get(key)
+    if cached and cached[0] == (room.current_team_index, room.current_explainer_index_in_team):
+        return cached[1]
+    explainer = room.get_current_explainer()
+    explainer_id = explainer.id if explainer else None
+    # get_current_explainer может поправить индекс объясняющего - берем индексы после
+    turn = (room.current_team_index, room.current_explainer_index_in_team)
+    cache.set(key, (turn, explainer_id), timeout=settings.TURN_STATE_TTL)
+    return explainer_id
+
+
+def invalidate_turn_state(room_ids):
+    cache.delete_many([f'turn_state:{room_id}' for room_id in room_ids])
+
+
+def load_rosters(room, limit=None):
+    """Составы команд одним запросом: {team_id: [Player, ...]}.
+
+    С `limit` из каждой команды берутся только первые `limit` игроков (оконная функция),
+    поэтому объем данных не растет с размером комнаты.
+    """
+    players = Player.objects.filter(room=room, team__isnull=False).only('id', 'team_id', 'telegram_username')
+    if limit is not None:
+        players = players.annotate(
+            roster_position=Window(RowNumber(), partition_by=[F('team_id')], order_by=F('id').asc())
+        ).filter(roster_position__lte=limit)
+
+    rosters = {}
+    for player in players.order_by('team_id', 'id'):
+        rosters.setdefault(player.team_id, []).append(player)
+    return rosters
+
+
+def _round_clock(room):
+    """(round_ends_at, time_remaining) для текущего момента."""
+    if room.status == 'playing' and room.round_start_time:
+        ends_at = room.round_start_time + timedelta(seconds=settings.ROUND_DURATION_SECONDS)
+        return ends_at.isoformat(), max(0, int((ends_at - timezone.now()).total_seconds()))
+    return None, 0
+
+
+def build_room_snapshot(room):
+    """Общее для всех зрителей состояние комнаты, без данных конкретного игрока.
+
+    Стоимость не зависит от числа игроков в большой комнате: команды приходят с
+    количеством игроков, а составы сокращаются до ROSTER_PREVIEW_SIZE.
+    """
+    teams = list(room.team_set.order_by('index'))
+    limit = settings.ROSTER_PREVIEW_SIZE if room.is_large_room else None
+    rosters = load_rosters(room, limit=limit)
+
+    current_team = None
+    current_explainer = None
+    if 0 <= room.current_team_index < len(teams):
+        current_team = teams[room.current_team_index]
+        roster = rosters.get(current_team.id, [])
+        index = room.current_explainer_index_in_team
+        if 0 <= index < len(roster):
+            current_explainer = roster[index]
+        elif roster and len(roster) == current_team.player_count:
+            current_explainer = roster[0]
+        elif roster:
+            # Объясняющий за пределами сокращенного состава - берем его одним запросом по позиции
+            current_explainer = room.get_current_explainer()
+
+    round_ends_at, time_remaining = _round_clock(room)
+    winning_team = next((t for t in teams if t.score >= room.winning_score), None)
+
+    return {
+        'status': room.status,
+        'version': room_version(room),
+        'game_finished': room.status == 'finished' or winning_team is not None,
+        'winning_team_name': winning_team.name if winning_team else None,
+        'room_id': str(room.id),
+        'creator_username': room.creator_telegram_username,
+        'difficulty': room.get_difficulty_display(),
+        'num_teams': room.num_teams,
+        'winning_score': room.winning_score,
+        'penalty_for_skip': room.penalty_for_skip,
+        'current_round': room.current_round,
+        'current_team_name': current_team.name if current_team else 'N/A',
+        'current_explainer_id': current_explainer.id if current_explainer else None,
+        'current_explainer_username': current_explainer.telegram_username if current_explainer else 'N/A',
+        'time_remaining': time_remaining,
+        'round_ends_at': round_ends_at,
+        'is_large_room': room.is_large_room,
+        'teams': [
+            {
+                'id': str(team.id),
+                'name': team.name,
+                'score': team.score,
+                'player_count': team.player_count,
+                'players': [{'id': p.id, 'telegram_username': p.telegram_username} for p in rosters.get(team.id, [])],
+                'players_truncated': len(rosters.get(team.id, [])) < team.player_count,
+            }
+            for team in teams
+        ],
+        'players_in_room_count': room.player_count,
+        'server_time': timezone.now().isoformat(),
+    }
+
+
+def get_room_snapshot(room):
+    """build_room_snapshot через single-flight по комнате и ее версии.
+
+    Когда ход меняется, все клиенты комнаты приходят за новым состоянием почти
+    одновременно; строит его один запрос, остальные берут готовый снимок.
+    Тикающие поля пересчитываются для каждого ответа.
+    """
+    snapshot = dict(single_flight(
+        f'room_snapshot:{room.id}:{room_version(room)}',
+        lambda: build_room_snapshot(room),
+        ttl=settings.ROOM_SNAPSHOT_TTL,
+    ))
+    snapshot['round_ends_at'], snapshot['time_remaining'] = _round_clock(room)
+    snapshot['server_time'] = timezone.now().isoformat()
+    return snapshot
+
+
+def get_spectator_snapshot(room_id):
+    """Сериализованный снимок комнаты для зрителей: (etag, body) или None.
+
+    Байты ответа строятся один раз на комнату и живут в кэше SPECTATOR_SNAPSHOT_TTL секунд,
+    поэтому каждый следующий зритель стоит одно чтение кэша и ни одного запроса к БД.
+    """
+    return single_flight(
+        f'spectator_snapshot:{room_id}',
+        lambda: _build_spectator_snapshot(room_id),
+        ttl=settings.SPECTATOR_SNAPSHOT_TTL,
+    )
+
+
+def _build_spectator_snapshot(room_id):
+    room = Room.objects.filter(id=room_id).first()
+    if not room:
+        return None
+
+    snapshot = build_room_snapshot(room)
+    # ETag не зависит от тикающих полей: таймер клиент считает сам по round_ends_at
+    stable = {k: v for k, v in snapshot.items() if k not in ('server_time', 'time_remaining')}
+    etag = '"%s"' % hashlib.md5(dumps(stable, sort_keys=True), usedforsecurity=False).hexdigest()
+    body = dumps(snapshot)
+    return etag, body
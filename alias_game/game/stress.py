@@ -0,0 +1,271 @@
+# game/stress.py
+"""Нагрузочные сценарии гонок хода и счета (manage.py stress_game и StressTests).
+
+Каждый сценарий создает свои комнаты, одновременно (через Barrier) отправляет из
+нескольких потоков запросы к view через тестовый клиент - с middleware, блокировками
+и транзакциями, как в бою, - и проверяет инварианты:
+
+- timer_end: одно истечение таймера продвигает ход ровно один раз, даже если
+  завершение пришло из нескольких вкладок, а угадывания, попавшие после смены
+  хода, не начисляются следующей команде;
+- scoring: ни одно успешное угадывание или пропуск не теряется, счет не уходит ниже 0,
+  а когда слова кончаются, ход передается ровно один раз;
+- reset: после сброса, выигравшего гонку у угадываний, счет всех команд 0.
+
+Каждый поток работает со своим соединением с БД и закрывает его в конце.
+"""
+
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Room, Team, Player
+from .wordpacks import pick_unused_word
+
+
+def make_room(teams=2, players_per_team=1, winning_score=10_000, penalty_for_skip=False):
+    """Комната в игре с идущим раундом; создатель - первый объясняющий ('p0-0')."""
+    room = Room.objects.create(creator_telegram_id='p0-0', status='playing', current_round=1,
+                               winning_score=winning_score, penalty_for_skip=penalty_for_skip)
+    for team_index in range(teams):
+        team = Team.objects.create(room=room, name=f'Team {team_index}', index=team_index)
+        for player_index in range(players_per_team):
+            Player.objects.create(room=room, team=team, telegram_id=f'p{team_index}-{player_index}',
+                                  telegram_username=f'player{team_index}{player_index}')
+    start_round(room)
+    return room
+
+
+def start_round(room, expired=False):
+    """Слово и время начала раунда; expired=True - таймер уже истек."""
+    room = Room.objects.get(id=room.id)
+    started = timezone.now()
+    if expired:
+        started -= timedelta(seconds=settings.ROUND_DURATION_SECONDS)
+    room.current_word = pick_unused_word(room)
+    room.round_start_time = started
+    room.save()
+    return room
+
+
+def explainer_telegram_id(room):
+    room = Room.objects.get(id=room.id)
+    return room.get_current_explainer().telegram_id
+
+
+def next_turn(room):
+    """Ход после одного продвижения (повторяет advance_turn)."""
+    teams = list(room.team_set.order_by('index'))
+    team = teams[room.current_team_index]
+    explainer_index = (room.current_explainer_index_in_team + 1) % team.player_count if team.player_count else 0
+    if explainer_index == 0:
+        return (room.current_round + 1, (room.current_team_index + 1) % len(teams), 0)
+    return (room.current_round, room.current_team_index, explainer_index)
+
+
+def post(url_name, room, telegram_id):
+    """POST к view игры от имени игрока; (код ответа, JSON)."""
+    response = Client().post(reverse(url_name, kwargs={'room_id': room.id}), HTTP_X_TELEGRAM_USER_ID=telegram_id)
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+    return response.status_code, data
+
+
+def hammer(calls, threads):
+    """Выполнить calls (функции без аргументов) в threads потоках, стартующих одновременно.
+
+    Возвращает (результаты в порядке calls, секунды).
+    """
+    results = [None] * len(calls)
+    barrier = threading.Barrier(threads)
+    next_call = iter(range(len(calls)))
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            barrier.wait()
+            while True:
+                with lock:
+                    index = next(next_call, None)
+                if index is None:
+                    return
+                try:
+                    results[index] = calls[index]()
+                except Exception as e:  # Исключение - тоже результат, инварианты проверяет сценарий
+                    results[index] = e
+        finally:
+            connection.close()  # Соединение этого потока
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+class ScenarioResult:
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.seconds = 0.0
+        self.statuses = {}
+        self.violations = []
+
+    def record(self, results, seconds):
+        self.requests += len(results)
+        self.seconds += seconds
+        for result in results:
+            key = type(result).__name__ if isinstance(result, Exception) else result[0]
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def check(self, condition, message):
+        if not condition:
+            self.violations.append(message)
+
+    @property
+    def throughput(self):
+        return self.requests / self.seconds if self.seconds else 0.0
+
+
+def ok(result):
+    return not isinstance(result, Exception) and result[0] == 200
+
+
+def timer_end_scenario(rooms=4, rounds=3, threads=8):
+    """Одновременные завершения по таймеру и угадывания на каждом истечении таймера."""
+    result = ScenarioResult('timer_end')
+    room_list = [make_room(players_per_team=2) for _ in range(rooms)]
+    for round_number in range(rounds):
+        before = {}
+        calls = []
+        for room in room_list:
+            room = start_round(room, expired=True)
+            before[room.id] = (room.turn, next_turn(room), room.current_team_index,
+                               {team.index: team.score for team in room.team_set.all()})
+            explainer = explainer_telegram_id(room)
+            for i in range(threads):
+                url_name = 'end_round_timer' if i % 2 == 0 else 'guess_word'
+                calls.append((room, url_name, lambda r=room, u=url_name, e=explainer: post(u, r, e)))
+        results, seconds = hammer([call for _, _, call in calls], threads)
+        result.record(results, seconds)
+
+        for room in room_list:
+            room = Room.objects.get(id=room.id)
+            turn, expected, team_index, scores = before[room.id]
+            mine = [(url_name, res) for (r, url_name, _), res in zip(calls, results) if r.id == room.id]
+            ends = sum(1 for url_name, res in mine if url_name == 'end_round_timer' and ok(res))
+            guesses = sum(1 for url_name, res in mine if url_name == 'guess_word' and ok(res)
+                          and 'word' in res[1])
+            result.check(room.turn == expected,
+                         f'{room.id} раунд {round_number}: ход {turn} -> {room.turn}, ожидался {expected}')
+            result.check(ends == 1, f'{room.id} раунд {round_number}: успешных завершений {ends}, ожидалось 1')
+            for team in room.team_set.all():
+                gained = team.score - scores[team.index]
+                allowed = guesses if team.index == team_index else 0
+                result.check(gained == allowed,
+                             f'{room.id} раунд {round_number}: команда {team.index} получила {gained}, '
+                             f'успешных угадываний за нее {allowed}')
+    return result
+
+
+def scoring_scenario(rooms=4, actions=40, threads=8):
+    """Одновременные угадывания и пропуски объясняющего и прямые вызовы Team.update_score."""
+    result = ScenarioResult('scoring')
+    room_list = [make_room(penalty_for_skip=True) for _ in range(rooms)]
+    base = actions  # Запас, чтобы пропуски не упирались в 0 и итог не зависел от порядка
+    calls = []
+    before = {}
+    for room in room_list:
+        Team.objects.filter(room=room).update(score=base)
+        before[room.id] = (next_turn(room), room.current_team_index)
+        explainer = explainer_telegram_id(room)
+        for i in range(actions):
+            url_name = 'guess_word' if i % 3 else 'skip_word'
+            calls.append((room, url_name, lambda r=room, u=url_name, e=explainer: post(u, r, e)))
+    results, seconds = hammer([call for _, _, call in calls], threads)
+    result.record(results, seconds)
+
+    for room in room_list:
+        room = Room.objects.get(id=room.id)
+        mine = [(url_name, res) for (r, url_name, _), res in zip(calls, results) if r.id == room.id]
+        guessed = sum(1 for url_name, res in mine if url_name == 'guess_word' and ok(res))
+        skipped = sum(1 for url_name, res in mine if url_name == 'skip_word' and ok(res))
+        # Если действий больше, чем слов, последнее слово передает ход следующей команде
+        turns_passed = sum(1 for _, res in mine if ok(res) and res[1].get('next_turn'))
+        expected_turn, team_index = before[room.id]
+        team = room.team_set.get(index=team_index)
+        result.check(team.score == base + guessed - skipped,
+                     f'{room.id}: счет {team.score}, ожидался {base} + {guessed} - {skipped}')
+        result.check(turns_passed <= 1, f'{room.id}: ход передан {turns_passed} раз, ожидалось не больше 1')
+        if turns_passed:
+            # Счетчики слов уже сброшены для нового хода
+            result.check(room.turn == expected_turn and room.current_word is None,
+                         f'{room.id}: после конца слов ход {room.turn}, слово {room.current_word!r}')
+        else:
+            result.check(room.words_guessed_count == guessed and room.words_skipped_count == skipped,
+                         f'{room.id}: отмечено слов {room.words_guessed_count}/{room.words_skipped_count}, '
+                         f'успешных ответов {guessed}/{skipped}')
+
+    # Team.update_score: прибавления не теряются, вычитания не уводят счет ниже нуля
+    teams = [team for room in room_list for team in Team.objects.filter(room=room)]
+    Team.objects.filter(id__in=[team.id for team in teams]).update(score=0)
+    for delta in (1, -1):
+        calls = [(team.id, lambda t=team, d=delta: (200, {'score': Team.objects.get(id=t.id).update_score(d)}))
+                 for team in teams for _ in range(actions)]
+        before = dict(Team.objects.filter(id__in=[team.id for team in teams]).values_list('id', 'score'))
+        results, seconds = hammer([call for _, call in calls], threads)
+        result.record(results, seconds)
+        for team in Team.objects.filter(id__in=[team.id for team in teams]):
+            applied = sum(1 for (team_id, _), res in zip(calls, results) if team_id == team.id and ok(res))
+            expected = max(0, before[team.id] + delta * applied)  # Все вычитания после прибавлений: порядок не важен
+            result.check(team.score == expected,
+                         f'update_score({delta:+d}): счет команды {team.id} {team.score}, '
+                         f'ожидался {expected} ({applied} успешных вызовов)')
+        result.check(all(res[1]['score'] >= 0 for res in results if ok(res)),
+                     f'update_score({delta:+d}): отрицательный счет')
+    return result
+
+
+def reset_scenario(rooms=4, rounds=3, threads=8):
+    """Сброс игры создателем одновременно с угадываниями и пропусками."""
+    result = ScenarioResult('reset')
+    room_list = [make_room(penalty_for_skip=True) for _ in range(rooms)]
+    for round_number in range(rounds):
+        calls = []
+        for room in room_list:
+            Room.objects.filter(id=room.id).update(status='playing')
+            start_round(room)
+            explainer = explainer_telegram_id(room)
+            for i in range(threads):
+                url_name = 'reset_game' if i == threads // 2 else ('guess_word' if i % 2 else 'skip_word')
+                calls.append((room, url_name, lambda r=room, u=url_name, e=explainer: post(u, r, e)))
+        results, seconds = hammer([call for _, _, call in calls], threads)
+        result.record(results, seconds)
+
+        for room in room_list:
+            mine = [(url_name, res) for (r, url_name, _), res in zip(calls, results) if r.id == room.id]
+            if not any(url_name == 'reset_game' and ok(res) for url_name, res in mine):
+                continue  # Сброс не прошел (ошибка БД) - проверять нечего, код ответа попал в статусы
+            room = Room.objects.get(id=room.id)
+            scores = list(room.team_set.values_list('score', flat=True))
+            result.check(room.status == 'waiting' and room.current_word is None,
+                         f'{room.id} раунд {round_number}: после сброса статус {room.status}, '
+                         f'слово {room.current_word!r}')
+            result.check(not any(scores), f'{room.id} раунд {round_number}: счет после сброса {scores}')
+    return result
+
+
+SCENARIOS = {
+    'timer_end': timer_end_scenario,
+    'scoring': scoring_scenario,
+    'reset': reset_scenario,
+}
@@ -0,0 +1,30 @@
+# game/tasks.py
+"""Фоновые задачи игры. Ставятся в очередь через .delay() / .defer() (см. game.background)."""
+
+from django.conf import settings
+from django.utils import timezone
+
+from .background import task
+from .models import Room
+
+
+@task(name='game.finish_room')
+def finish_room(room_id):
+    """Зафиксировать победу в комнате, которую get_game_state увидел завершенной."""
+    Room.objects.filter(id=room_id, status='playing').update(status='finished', last_activity=timezone.now())
+
+
+@task(name='game.sweep_presence', max_retries=0)
+def sweep_presence():
+    from .presence import sweep
+    return sweep(
+        timeout_minutes=settings.PRESENCE_TIMEOUT_MINUTES,
+        inactive_room_hours=settings.INACTIVE_ROOM_PLAYERS_HOURS,
+    )
+
+
+@task(name='game.archive_finished_rooms', max_retries=0)
+def archive_finished_rooms(older_than_minutes=30):
+    from datetime import timedelta
+    from .archive import archive_finished_rooms as archive
+    return archive(older_than=timezone.now() - timedelta(minutes=older_than_minutes))
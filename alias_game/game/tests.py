@@ -1,14 +1,59 @@
-from django.test import TestCase
-from .models import Room
-from .views import fetch_room_by_str
+import io
+import json
+import logging
+import os
+import re
+import glob
+import gzip
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.utils import ConnectionHandler
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .models import Room, Team, Player, ArchivedGame, BackgroundTask, PeriodicTask
+from .background import ensure_periodic, run_pending, schedule_periodic, start_periodic_scheduler, task
+from .admin import estimate_table_rows
+from .counters import recount_players
+from .dbpool import ConnectionPool, close_pool, describe_pool
+from .archive import archive_finished_rooms, archive_room, get_archived_game
+from .presence import reap_disconnected_players, reap_inactive_room_players
+from .profiling import ProfilingMiddleware
+from .traffic import close_capture_writer, read_capture
+from .management.commands.replay_traffic import Command as ReplayCommand
+from .queryplans import check_hot_queries, full_scans
+from .stress import make_room, next_turn, start_round
+from .log_queue import AsyncRotatingFileHandler
+from .management.commands.profile_startup import Command as ProfileStartupCommand, parse_importtime
+from . import words
+from .middleware import take_token
+from .singleflight import single_flight
+from .responses import dumps
+from .tokens import issue_player_token
+from .wordpacks import compiled_packs, create_word_pack, mark_played, normalize_words, pick_unused_word, WordPackError
+from .views import fetch_room_by_str, compute_next_poll_ms
+from .urls import urlpatterns
 import uuid
 
 
 class RoomIdTests(TestCase):
-    def test_numeric_id_lookup(self):
+    def test_generated_id_lookup(self):
         r = Room.objects.create(creator_telegram_id='123')
-        self.assertEqual(len(r.id), 6)
-        self.assertTrue(r.id.isdigit())
+        self.assertTrue(re.fullmatch(r'[A-Z0-9]{8}', r.id))
         found = fetch_room_by_str(r.id)
         self.assertIsNotNone(found)
         self.assertEqual(found.id, r.id)
@@ -25,3 +70,1244 @@ class RoomIdTests(TestCase):
 
     def test_non_numeric_is_none(self):
         self.assertIsNone(fetch_room_by_str('abc123'))
+
+
+
+class PollIntervalTests(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(creator_telegram_id='1')
+        self.intervals = settings.POLL_INTERVALS_MS
+
+    def test_finished_room_polls_rarely(self):
+        self.room.status = 'finished'
+        self.assertEqual(compute_next_poll_ms(self.room, 0), self.intervals['finished'])
+
+    def test_idle_lobby_backs_off(self):
+        self.assertEqual(compute_next_poll_ms(self.room, 0), self.intervals['lobby_active'])
+        self.room.last_activity = timezone.now() - timedelta(seconds=settings.POLL_IDLE_AFTER_SECONDS + 1)
+        self.assertEqual(compute_next_poll_ms(self.room, 0), self.intervals['lobby_idle'])
+
+    def test_team_selection_wakes_idle_lobby(self):
+        team = Team.objects.create(room=self.room, name='Alpha', index=0)
+        Player.objects.create(room=self.room, telegram_id='1', telegram_username='alice')
+        Room.objects.filter(id=self.room.id).update(
+            last_activity=timezone.now() - timedelta(seconds=settings.POLL_IDLE_AFTER_SECONDS + 1))
+        self.client.post(f'/room/{self.room.id}/select_team/', {'tg_user_id': '1', 'team_id': team.id})
+        self.room.refresh_from_db()
+        self.assertEqual(compute_next_poll_ms(self.room, 0), self.intervals['lobby_active'])
+
+    def test_active_round_is_responsive(self):
+        self.room.status = 'playing'
+        self.room.round_start_time = timezone.now()
+        self.assertEqual(compute_next_poll_ms(self.room, 40), self.intervals['round_active'])
+        self.assertEqual(compute_next_poll_ms(self.room, 3), self.intervals['round_ending'])
+        self.assertEqual(compute_next_poll_ms(self.room, 0), self.intervals['round_ending'])
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bucket_refills_over_time(self):
+        self.assertEqual(take_token('bucket', 2, 1, now=100), (True, 0))
+        self.assertEqual(take_token('bucket', 2, 1, now=100), (True, 0))
+        allowed, retry_after = take_token('bucket', 2, 1, now=100)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 1)
+        self.assertEqual(take_token('bucket', 2, 1, now=101), (True, 0))
+
+    @override_settings(RATE_LIMITS={'get_game_state': {'capacity': 1, 'refill_per_second': 0.1}})
+    def test_throttled_request_skips_database(self):
+        url = '/room/ABC/state/?tg_user_id=42'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        # Другой пользователь в той же комнате не затронут
+        self.assertNotEqual(self.client.get('/room/ABC/state/?tg_user_id=43').status_code, 429)
+
+
+class ArchiveTests(TestCase):
+    def test_finished_room_moves_to_archive(self):
+        room = Room.objects.create(creator_telegram_id='1', status='finished', winning_score=10)
+        team = Team.objects.create(room=room, name='Alpha', index=0, score=12)
+        Team.objects.create(room=room, name='Beta', index=1, score=3)
+        Player.objects.create(room=room, team=team, telegram_id='1', telegram_username='alice')
+        Room.objects.create(creator_telegram_id='2', status='playing')
+
+        self.assertEqual(archive_finished_rooms(), 1)
+
+        self.assertFalse(Room.objects.filter(id=room.id).exists())
+        self.assertFalse(Player.objects.filter(telegram_id='1').exists())
+        self.assertEqual(Room.objects.count(), 1)
+        game = get_archived_game(room.id)
+        self.assertEqual(game['winning_team_name'], 'Alpha')
+        self.assertEqual(game['teams'][0]['players'][0]['telegram_username'], 'alice')
+        self.assertEqual(ArchivedGame.objects.count(), 1)
+
+        response = self.client.get(f'/room/{room.id}/archive/')
+        self.assertEqual(response.json()['game']['teams'][1]['score'], 3)
+        # Архив открыт всем: идентификаторы, которыми игроки представляются в запросах, не отдаются
+        self.assertNotIn(b'telegram_id', response.content)
+
+    def test_cleanup_keeps_recently_finished_rooms(self):
+        room = Room.objects.create(creator_telegram_id='1', status='finished')
+        old = Room.objects.create(creator_telegram_id='2', status='waiting')
+        Room.objects.filter(id__in=[room.id, old.id]).update(created_at=timezone.now() - timedelta(days=2))
+        call_command('cleanup_rooms', stdout=io.StringIO())
+        # Завершенная, но недавно активная комната ждет архивации, а не удаляется
+        self.assertTrue(Room.objects.filter(id=room.id).exists())
+        self.assertFalse(Room.objects.filter(id=old.id).exists())
+
+    def test_room_reset_after_read_is_not_archived(self):
+        room = Room.objects.create(creator_telegram_id='1', status='finished')
+        stale = Room.objects.prefetch_related('team_set__player_set', 'player_set').get(id=room.id)
+        Room.objects.get(id=room.id).reset_game()
+        self.assertIsNone(archive_room(stale))
+        self.assertEqual(Room.objects.get(id=room.id).status, 'waiting')
+        self.assertFalse(ArchivedGame.objects.exists())
+
+
+class SpectatorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create(creator_telegram_id='1')
+        team = Team.objects.create(room=self.room, name='Alpha', index=0)
+        Player.objects.create(room=self.room, team=team, telegram_id='1', telegram_username='alice')
+
+    def test_spectators_share_one_snapshot(self):
+        url = f'/room/{self.room.id}/spectate/state/'
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['teams'][0]['players'][0]['telegram_username'], 'alice')
+        self.assertNotIn('current_word', first.json())
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_unknown_room(self):
+        self.assertEqual(self.client.get('/room/NOPE/spectate/state/').status_code, 404)
+
+
+class LargeRoomTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _make_room(self, size, num_teams=4):
+        room = Room.objects.create(creator_telegram_id='p0', num_teams=num_teams, is_large_room=True, status='playing')
+        teams = Team.objects.bulk_create([Team(room=room, name=f'T{i}', index=i) for i in range(num_teams)])
+        Player.objects.bulk_create([
+            Player(room=room, team=teams[i % num_teams], telegram_id=f'p{i}', telegram_username=f'user{i}')
+            for i in range(size)
+        ])
+        recount_players([room.id])
+        return room
+
+    def _state(self, room):
+        return self.client.get(f'/room/{room.id}/state/', {'tg_user_id': 'p0'})
+
+    def test_large_room_rosters_are_summarized(self):
+        room = self._make_room(100)
+        state = self._state(room).json()
+        team = state['teams'][0]
+        self.assertEqual(team['player_count'], 25)
+        self.assertEqual(len(team['players']), settings.ROSTER_PREVIEW_SIZE)
+        self.assertTrue(team['players_truncated'])
+        self.assertTrue(state['is_current_explainer'])
+
+    def test_state_query_count_is_flat(self):
+        small, large = self._make_room(20), self._make_room(200)
+        with CaptureQueriesContext(connection) as small_queries:
+            self._state(small)
+        with CaptureQueriesContext(connection) as large_queries:
+            self._state(large)
+        self.assertEqual(len(small_queries), len(large_queries))
+
+    def test_join_limit_follows_room_mode(self):
+        room = self._make_room(settings.MAX_PLAYERS_PER_ROOM)
+        room.status = 'waiting'
+        room.save()
+        response = self.client.post('/join/post/', {'room_id': room.id, 'tg_user_id': 'new'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_full_room_rejects_new_players_but_not_members(self):
+        room = self._make_room(settings.MAX_PLAYERS_PER_ROOM)
+        Room.objects.filter(id=room.id).update(status='waiting', is_large_room=False)
+        response = self.client.post('/join/post/', {'room_id': room.id, 'tg_user_id': 'new'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/join/post/', {'room_id': room.id, 'tg_user_id': 'p1'})
+        self.assertEqual(response.status_code, 200)
+        room.refresh_from_db()
+        self.assertEqual(room.player_count, settings.MAX_PLAYERS_PER_ROOM)
+
+
+class PresenceReaperTests(TestCase):
+    def _make_room(self, creator, explainer_index):
+        room = Room.objects.create(creator_telegram_id=creator, status='playing',
+                                   current_explainer_index_in_team=explainer_index)
+        team = Team.objects.create(room=room, name='A', index=0)
+        Team.objects.create(room=room, name='B', index=1)
+        players = [Player.objects.create(room=room, team=team, telegram_id=f'{creator}-{i}') for i in range(4)]
+        return room, players
+
+    def _expire(self, *players):
+        Player.objects.filter(id__in=[p.id for p in players]).update(
+            last_seen=timezone.now() - timedelta(minutes=10))
+
+    def test_sweeps_all_rooms_and_keeps_explainer(self):
+        # Ушел игрок перед объясняющим - индекс сдвигается, объясняющий тот же
+        room1, players1 = self._make_room('a', explainer_index=2)
+        self._expire(players1[0])
+        # Ушел сам объясняющий (последний в составе) - ход переходит к первому
+        room2, players2 = self._make_room('b', explainer_index=3)
+        self._expire(players2[3])
+
+        # Число запросов не зависит от количества игроков и комнат (кроме UPDATE на каждое новое значение индекса
+        # и двух UPDATE счетчиков игроков)
+        with self.assertNumQueries(12):
+            self.assertEqual(reap_disconnected_players(timeout_minutes=5), 2)
+
+        room1.refresh_from_db()
+        room2.refresh_from_db()
+        self.assertEqual(room1.get_current_explainer(), players1[2])
+        self.assertEqual(room2.get_current_explainer(), players2[0])
+
+    def test_inactive_room_players_are_removed(self):
+        idle, idle_players = self._make_room('d', explainer_index=0)
+        active, _ = self._make_room('e', explainer_index=0)
+        Room.objects.filter(id=idle.id).update(last_activity=timezone.now() - timedelta(hours=3))
+        self.assertEqual(reap_inactive_room_players(hours=2), len(idle_players))
+        idle.refresh_from_db()
+        self.assertEqual((idle.player_count, idle.player_set.count()), (0, 0))
+        self.assertEqual(active.player_set.count(), 4)
+
+    def test_finished_room_keeps_roster_for_archive(self):
+        room, players = self._make_room('f', explainer_index=0)
+        Room.objects.filter(id=room.id).update(status='finished', last_activity=timezone.now() - timedelta(hours=3))
+        self._expire(*players)
+
+        self.assertEqual(reap_disconnected_players(timeout_minutes=5), 0)
+        self.assertEqual(reap_inactive_room_players(hours=2), 0)
+        self.assertEqual(archive_finished_rooms(), 1)
+        roster = get_archived_game(room.id)['teams'][0]['players']
+        self.assertEqual(len(roster), len(players))
+
+    def test_state_poll_does_not_reap(self):
+        room, players = self._make_room('c', explainer_index=0)
+        self._expire(players[1])
+        self.client.get(f'/room/{room.id}/state/', {'tg_user_id': 'c-0'})
+        self.assertEqual(room.player_set.count(), 4)
+
+
+_flaky_calls = []
+
+
+@task(name='tests.flaky', max_retries=1, retry_delay=0)
+def flaky(value):
+    _flaky_calls.append(value)
+    if len(_flaky_calls) == 1:
+        raise RuntimeError('first attempt fails')
+
+
+class BackgroundTaskTests(TestCase):
+    def setUp(self):
+        _flaky_calls.clear()
+
+    @override_settings(BACKGROUND_TASKS_BACKEND='database')
+    def test_database_queue_retries_then_succeeds(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            flaky.defer(7)
+        self.assertEqual(BackgroundTask.objects.get().args, [7])
+
+        self.assertEqual(run_pending(), 1)
+        queued = BackgroundTask.objects.get()
+        self.assertEqual((queued.status, queued.attempts), ('pending', 1))
+        self.assertIn('first attempt fails', queued.last_error)
+
+        self.assertEqual(run_pending(), 1)
+        self.assertFalse(BackgroundTask.objects.exists())
+        self.assertEqual(_flaky_calls, [7, 7])
+
+    @override_settings(BACKGROUND_TASKS_BACKEND='database', BACKGROUND_TASK_LEASE_SECONDS=60)
+    def test_expired_lease_is_reclaimed(self):
+        stale = timezone.now() - timedelta(minutes=5)
+        BackgroundTask.objects.create(name='tests.flaky', args=[1], status='running', claimed_at=stale,
+                                      attempts=1, max_attempts=3)
+        BackgroundTask.objects.create(name='tests.flaky', args=[2], status='running', claimed_at=stale,
+                                      attempts=3, max_attempts=3)
+        BackgroundTask.objects.create(name='tests.flaky', args=[3], status='running', claimed_at=timezone.now())
+
+        self.assertEqual(run_pending(), 1)  # Упала (первая попытка в этом тесте) и вернулась в очередь
+        self.assertEqual(_flaky_calls, [1])
+        self.assertEqual(
+            sorted(BackgroundTask.objects.values_list('args', 'status', 'attempts')),
+            [([1], 'pending', 2), ([2], 'failed', 3), ([3], 'running', 0)],
+        )
+
+    @override_settings(BACKGROUND_TASKS_BACKEND='database')
+    def test_periodic_task_is_scheduled_once_across_workers(self):
+        periodic = {'tests.flaky': 60}
+        ensure_periodic(periodic)
+        ensure_periodic(periodic)  # Второй воркер стартовал позже - срок не сбрасывается
+        self.assertEqual(schedule_periodic(periodic), ['tests.flaky'])
+        self.assertEqual(schedule_periodic(periodic), [])
+        self.assertEqual(BackgroundTask.objects.count(), 1)
+
+        PeriodicTask.objects.update(next_run_at=timezone.now())
+        self.assertEqual(schedule_periodic(periodic), ['tests.flaky'])
+
+    def test_in_process_scheduler_starts_once_when_enabled(self):
+        started = []
+        with mock.patch('game.background.threading.Thread') as thread, \
+                mock.patch('game.background._scheduler_started', False):
+            thread.return_value.start.side_effect = lambda: started.append(1)
+            with override_settings(BACKGROUND_PERIODIC_IN_PROCESS=False):
+                self.assertFalse(start_periodic_scheduler())
+            with override_settings(BACKGROUND_PERIODIC_IN_PROCESS=True):
+                self.assertTrue(start_periodic_scheduler())
+                self.assertFalse(start_periodic_scheduler())
+        self.assertEqual(started, [1])
+
+    @override_settings(BACKGROUND_TASKS_BACKEND='database')
+    def test_state_polls_enqueue_one_finish_task(self):
+        cache.clear()
+        room = Room.objects.create(creator_telegram_id='1', status='playing', winning_score=10)
+        team = Team.objects.create(room=room, name='A', index=0, score=10)
+        Player.objects.create(room=room, team=team, telegram_id='1')
+        Player.objects.create(room=room, team=team, telegram_id='2')
+        for user_id in ('1', '2', '1'):
+            self.assertTrue(self.client.get(f'/room/{room.id}/state/', {'tg_user_id': user_id}).json()['game_finished'])
+        self.assertEqual(list(BackgroundTask.objects.values_list('name', 'args')), [('game.finish_room', [room.id])])
+
+    @override_settings(BACKGROUND_TASKS_BACKEND='immediate')
+    def test_state_poll_defers_finishing_the_game(self):
+        cache.clear()
+        room = Room.objects.create(creator_telegram_id='1', status='playing', winning_score=10)
+        team = Team.objects.create(room=room, name='A', index=0, score=10)
+        Player.objects.create(room=room, team=team, telegram_id='1')
+        state = self.client.get(f'/room/{room.id}/state/', {'tg_user_id': '1'}).json()
+        self.assertTrue(state['game_finished'])
+        self.assertEqual(state['winning_team_name'], 'A')
+        room.refresh_from_db()
+        self.assertEqual(room.status, 'finished')
+
+
+class QueuedLoggingTests(TestCase):
+    def _record(self, level, msg, *args):
+        return logging.LogRecord('game', level, __file__, 1, msg, args, None)
+
+    def test_writes_json_lines_and_drops_under_backpressure(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'game.log')
+            handler = AsyncRotatingFileHandler(path, queue_size=2, sample_every=1000)
+            handler.listener.stop()  # Имитируем медленный диск: очередь не разбирается
+
+            handler.emit(self._record(logging.WARNING, 'room %s', 'A'))
+            handler.emit(self._record(logging.WARNING, 'room %s', 'B'))
+            handler.emit(self._record(logging.WARNING, 'lost'))  # очередь полна
+            handler.emit(self._record(logging.INFO, 'sampled out'))  # давление - прореживаем
+
+            handler.listener.start()
+            handler.listener.stop()
+            handler.emit(self._record(logging.ERROR, 'after'))
+            handler.listener.start()
+            handler.close()
+
+            with open(path, encoding='utf-8') as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual([line['message'] for line in lines], ['room A', 'room B', 'after'])
+        self.assertEqual(lines[-1]['dropped'], 2)
+
+    def test_game_logger_reaches_console(self):
+        # Логи собирают со stdout/stderr и в проде, поэтому консоль не зависит от DEBUG
+        self.assertTrue(settings.LOGGING['handlers']['file']['console'])
+
+    def test_traceback_goes_to_exc_field_and_console_via_listener(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'game.log')
+            with mock.patch('sys.stderr', io.StringIO()) as stderr:
+                handler = AsyncRotatingFileHandler(path, console=True)
+            try:
+                raise ValueError('boom')
+            except ValueError:
+                record = self._record(logging.ERROR, 'failed %s', 'A')
+                record.exc_info = sys.exc_info()
+            handler.emit(record)
+            handler.close()
+
+            with open(path, encoding='utf-8') as f:
+                line = json.loads(f.readline())
+        self.assertEqual(line['message'], 'failed A')
+        self.assertIn('ValueError: boom', line['exc'])
+        self.assertIn('[ERROR] game: failed A', stderr.getvalue())
+
+
+class StartupTests(TestCase):
+    def test_parse_importtime(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   game.words\n"
+            "import time:      3000 |       3120 | game.views\n"
+        )
+        self.assertEqual(parse_importtime(stderr), [('game.words', 120, 120, 1), ('game.views', 3000, 3120, 0)])
+
+    def test_failed_startup_reports_traceback(self):
+        with self.assertRaises(CommandError) as raised:
+            ProfileStartupCommand()._run('import json; raise RuntimeError("broken settings")')
+        self.assertIn('RuntimeError: broken settings', str(raised.exception))
+        self.assertNotIn('import time:', str(raised.exception))
+
+    def test_words_are_loaded_on_demand(self):
+        self.assertIn('apple', words.get_words('easy'))
+        self.assertEqual(words.WORDS['hard'], words.get_words('hard'))
+
+
+class WordPackTests(TestCase):
+    WORDS = 'кот, Кот; собака\nслон\tжираф\nлиса\nволк\nзаяц\nежик\nбобр\nлось\n  белка  '
+
+    def setUp(self):
+        compiled_packs.clear()
+
+    def test_normalize_dedupes_case_insensitively(self):
+        self.assertEqual(normalize_words('кот, Кот;  морской   конек\n\n'), ['кот', 'морской конек'])
+
+    def test_identical_packs_are_stored_once(self):
+        pack, created = create_word_pack('Звери', '1', self.WORDS)
+        again, created_again = create_word_pack('Другое имя', '2', self.WORDS.upper().lower())
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(pack.id, again.id)
+        self.assertEqual(pack.word_count, 11)
+        self.assertEqual(pack.unpack()[:3], ['кот', 'собака', 'слон'])
+
+    def test_too_few_words(self):
+        with self.assertRaises(WordPackError):
+            create_word_pack('Мало', '1', 'один, два')
+
+    def test_compiled_pack_is_cached(self):
+        pack, _ = create_word_pack('Звери', '1', self.WORDS)
+        compiled_packs.get(pack.id)
+        with self.assertNumQueries(0):
+            self.assertIn('белка', compiled_packs.get(pack.id).index)
+
+    @override_settings(WORD_PACK_CACHE_SIZE=1)
+    def test_compiled_pack_cache_is_bounded(self):
+        first, _ = create_word_pack('Звери', '1', self.WORDS)
+        second, _ = create_word_pack('Птицы', '1', self.WORDS + '\nворон')
+        compiled_packs.get(first.id)
+        compiled_packs.get(second.id)
+        self.assertEqual(list(compiled_packs._packs), [second.id])
+
+    def test_round_draws_from_room_pack(self):
+        upload = self.client.post('/word_packs/upload/', {'tg_user_id': '1', 'name': 'Звери', 'words': self.WORDS})
+        self.assertEqual(upload.status_code, 200)
+        room = Room.objects.create(creator_telegram_id='1', status='playing', word_pack_id=upload.json()['word_pack_id'])
+        team = Team.objects.create(room=room, name='Alpha', index=0)
+        Player.objects.create(room=room, team=team, telegram_id='1', telegram_username='alice')
+
+        response = self.client.post(f'/room/{room.id}/start_round/', {'tg_user_id': '1'})
+        self.assertEqual(response.status_code, 200)
+        room.refresh_from_db()
+        self.assertIn(room.current_word, normalize_words(self.WORDS))
+
+
+class WordUsageTests(TestCase):
+    def test_played_words_are_not_dealt_again(self):
+        room = Room(creator_telegram_id='c', difficulty='easy')
+        pack = words.get_words('easy')
+        for word in pack[:-1]:
+            mark_played(room, word, guessed=True)
+        self.assertEqual(room.words_guessed_count, len(pack) - 1)
+        self.assertEqual(len(room.words_used), (len(pack) + 7) // 8)
+        self.assertEqual(pick_unused_word(room), pack[-1])
+
+        mark_played(room, pack[-1], guessed=False)
+        self.assertIsNone(pick_unused_word(room))
+        room.reset_word_usage()
+        self.assertEqual(room.words_used, b'')
+        self.assertIn(pick_unused_word(room), pack)
+
+
+class WordActionBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create(
+            creator_telegram_id='1', status='playing', difficulty='easy',
+            current_word='apple', round_start_time=timezone.now(),
+        )
+        self.team = Team.objects.create(room=self.room, name='Alpha', index=0)
+        Player.objects.create(room=self.room, team=self.team, telegram_id='1', telegram_username='alice')
+
+    def _send(self, actions):
+        return self.client.post(f'/room/{self.room.id}/actions/', {'tg_user_id': '1', 'actions': json.dumps(actions)})
+
+    def test_batch_is_applied_once(self):
+        batch = [{'seq': 1, 'action': 'guessed'}, {'seq': 2, 'action': 'guessed'}, {'seq': 3, 'action': 'skip'}]
+        data = self._send(batch).json()
+        self.assertEqual(data['applied'], [1, 2, 3])
+        self.assertEqual(data['last_action_seq'], 3)
+
+        retry = self._send(batch).json()  # повторная отправка после обрыва связи
+        self.assertEqual(retry['applied'], [])
+        self.team.refresh_from_db()
+        self.room.refresh_from_db()
+        self.assertEqual(self.team.score, 1)
+        self.assertEqual(self.room.words_guessed_count, 2)
+        self.assertEqual(self.room.words_skipped_count, 1)
+
+    def test_double_tap_on_same_word_is_stale(self):
+        data = self._send([
+            {'seq': 1, 'action': 'guessed', 'word': 'apple'},
+            {'seq': 2, 'action': 'guessed', 'word': 'apple'},
+        ]).json()
+        self.assertEqual(data['applied'], [1])
+        self.assertEqual(data['stale'], [2])
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.score, 1)
+
+    def test_batch_to_finished_room_is_acknowledged(self):
+        Room.objects.filter(id=self.room.id).update(status='finished')
+        data = self._send([{'seq': 1, 'action': 'guessed'}, {'seq': 2, 'action': 'skip'}]).json()
+        self.assertEqual((data['applied'], data['dropped'], data['last_action_seq']), ([], [1, 2], 2))
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_action_seq, 2)
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.score, 0)
+
+    def test_only_explainer_can_send(self):
+        Player.objects.create(room=self.room, team=self.team, telegram_id='2', telegram_username='bob')
+        response = self.client.post(f'/room/{self.room.id}/actions/', {
+            'tg_user_id': '2', 'actions': json.dumps([{'seq': 1, 'action': 'guessed'}]),
+        })
+        self.assertEqual(response.status_code, 403)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches[settings.IDEMPOTENCY_CACHE].clear()
+        self.room = Room.objects.create(
+            creator_telegram_id='1', status='playing', difficulty='easy',
+            current_word='apple', round_start_time=timezone.now(),
+        )
+        self.team = Team.objects.create(room=self.room, name='Alpha', index=0)
+        Player.objects.create(room=self.room, team=self.team, telegram_id='1', telegram_username='alice')
+
+    def _guess(self, key):
+        return self.client.post(f'/room/{self.room.id}/guessed/', {'tg_user_id': '1'}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_duplicate_returns_stored_response_without_queries(self):
+        first = self._guess('tap-1')
+        with self.assertNumQueries(0):
+            second = self._guess('tap-1')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.score, 1)
+
+        self._guess('tap-2')
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.score, 2)
+
+    def test_replay_requires_csrf(self):
+        self._guess('tap-1')
+        forged = Client(enforce_csrf_checks=True).post(
+            f'/room/{self.room.id}/guessed/', {'tg_user_id': '1'}, HTTP_IDEMPOTENCY_KEY='tap-1')
+        self.assertEqual(forged.status_code, 403)
+        self.assertNotIn('Idempotent-Replayed', forged)
+
+    def test_key_is_scoped_to_client(self):
+        Player.objects.create(room=self.room, team=self.team, telegram_id='2', telegram_username='bob')
+        self._guess('same')
+        other = self.client.post(f'/room/{self.room.id}/guessed/', {'tg_user_id': '2'}, HTTP_IDEMPOTENCY_KEY='same')
+        self.assertEqual(other.status_code, 403)
+
+    def test_batch_retry_while_first_send_runs_gets_409_then_replay(self):
+        from . import views
+        actions = json.dumps([{'seq': 1, 'action': 'guessed', 'word': 'apple'}])
+
+        def send():
+            return self.client.post(f'/room/{self.room.id}/actions/', {'tg_user_id': '1', 'actions': actions},
+                                    HTTP_IDEMPOTENCY_KEY='batch-1')
+
+        retries = []
+        original = views.apply_word_action
+
+        def apply_with_retry(*args):
+            # Клиент не дождался ответа и повторил пакет с тем же ключом, пока первый еще выполняется
+            retries.append(send())
+            return original(*args)
+
+        with mock.patch.object(views, 'apply_word_action', side_effect=apply_with_retry):
+            first = send()
+        self.assertEqual(first.json()['applied'], [1])
+        # room.html обрабатывает 409 как 429/5xx: очередь и ключ сохраняются, повтор после Retry-After
+        self.assertEqual(retries[0].status_code, 409)
+        self.assertEqual(retries[0]['Retry-After'], '1')
+
+        replay = send()
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.content, first.content)
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.score, 1)
+
+    def test_error_response_is_not_stored(self):
+        Room.objects.filter(id=self.room.id).update(current_word=None)
+        self.assertEqual(self._guess('tap-1').status_code, 400)
+        Room.objects.filter(id=self.room.id).update(current_word='apple')
+        cache.clear()
+
+        retry = self._guess('tap-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', retry)
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.score, 1)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_callers_share_one_build(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.05)
+            return {'turn': 2}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight('room:1:v2', build, ttl=5)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'turn': 2}] * 8)
+
+    def test_waits_for_other_worker(self):
+        # Ключ уже занят другим воркером: ждем его результат в кэше, а не строим сами
+        cache.add('singleflight-lock:room:1:v3', 1)
+        threading.Timer(0.05, lambda: cache.set('singleflight:room:1:v3', 'built elsewhere')).start()
+        self.assertEqual(single_flight('room:1:v3', lambda: 'built here', ttl=5), 'built elsewhere')
+
+    def test_state_reuses_snapshot_for_same_version(self):
+        room = Room.objects.create(creator_telegram_id='1')
+        team = Team.objects.create(room=room, name='Alpha', index=0)
+        Player.objects.create(room=room, team=team, telegram_id='1', telegram_username='alice')
+        Player.objects.create(room=room, team=team, telegram_id='2', telegram_username='bob')
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(f'/room/{room.id}/state/', {'tg_user_id': '1'})
+        with CaptureQueriesContext(connection) as second:
+            state = self.client.get(f'/room/{room.id}/state/', {'tg_user_id': '2'}).json()
+        self.assertLess(len(second), len(first))
+        self.assertEqual(len(state['teams'][0]['players']), 2)
+
+
+class JsonResponseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_dumps_handles_django_types(self):
+        data = json.loads(dumps({'when': timezone.now(), 'price': Decimal('1.50'), 'name': 'Команда'}))
+        self.assertEqual(data['price'], '1.50')
+        self.assertEqual(data['name'], 'Команда')
+
+    def test_large_state_is_compressed(self):
+        room = Room.objects.create(creator_telegram_id='p0', num_teams=4, is_large_room=True)
+        teams = Team.objects.bulk_create([Team(room=room, name=f'T{i}', index=i) for i in range(4)])
+        Player.objects.bulk_create([
+            Player(room=room, team=teams[i % 4], telegram_id=f'p{i}', telegram_username=f'user{i}') for i in range(40)
+        ])
+        recount_players([room.id])
+        url = f'/room/{room.id}/state/'
+        plain = self.client.get(url, {'tg_user_id': 'p0'})
+        compressed = self.client.get(url, {'tg_user_id': 'p0'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertLess(len(compressed.content), len(plain.content))
+        self.assertEqual(json.loads(gzip.decompress(compressed.content))['room_id'], room.id)
+
+    def test_small_errors_are_not_compressed(self):
+        response = self.client.get('/room/NOPE/state/', {'tg_user_id': '1'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class PlayerTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create(
+            creator_telegram_id='1', status='playing', difficulty='easy',
+            current_word='apple', round_start_time=timezone.now(),
+        )
+        team = Team.objects.create(room=self.room, name='Alpha', index=0)
+        self.player = Player.objects.create(room=self.room, team=team, telegram_id='1', telegram_username='alice')
+
+    def _guess(self, **headers):
+        return self.client.post(f'/room/{self.room.id}/guessed/', {'tg_user_id': '1'}, **headers)
+
+    def test_join_issues_token(self):
+        room = Room.objects.create(creator_telegram_id='9')
+        data = self.client.post('/join/post/', {'room_id': room.id, 'tg_user_id': '5'}).json()
+        self.assertTrue(data['player_token'])
+
+    def test_token_skips_membership_and_explainer_queries(self):
+        token = issue_player_token(self.player)
+        with CaptureQueriesContext(connection) as without_token:
+            self._guess()
+        self.room.refresh_from_db()
+        with CaptureQueriesContext(connection) as with_token:
+            self._guess(HTTP_X_PLAYER_TOKEN=token)
+        self.assertLessEqual(len(with_token), len(without_token) - 2)
+
+    def test_foreign_or_tampered_token_is_ignored(self):
+        other = Player.objects.create(room=self.room, telegram_id='2', telegram_username='bob')
+        response = self._guess(HTTP_X_PLAYER_TOKEN=issue_player_token(other))
+        self.assertEqual(response.status_code, 200)  # токен чужой - игрок найден по telegram_id
+        response = self._guess(HTTP_X_PLAYER_TOKEN=issue_player_token(self.player) + 'x')
+        self.assertEqual(response.status_code, 200)
+
+    def test_team_change_elsewhere_is_seen_with_old_token(self):
+        token = issue_player_token(self.player)
+        other = Team.objects.create(room=self.room, name='Beta', index=1)
+        player = Player.objects.get(id=self.player.id)
+        player.team = other  # Другая вкладка или админка - этот клиент нового токена не получал
+        player.save()
+        state = self.client.get(f'/room/{self.room.id}/state/', {'tg_user_id': '1'}, HTTP_X_PLAYER_TOKEN=token).json()
+        self.assertEqual((state['my_team_id'], state['player_team_name']), (str(other.id), 'Beta'))
+
+    def test_token_touches_last_seen_at_most_once_per_interval(self):
+        token = issue_player_token(self.player)
+        stale = timezone.now() - timedelta(minutes=1)
+        Player.objects.filter(id=self.player.id).update(last_seen=stale)
+        self._guess(HTTP_X_PLAYER_TOKEN=token)
+        touched = Player.objects.get(id=self.player.id).last_seen
+        self.assertGreater(touched, stale)
+        self._guess(HTTP_X_PLAYER_TOKEN=token)
+        self.assertEqual(Player.objects.get(id=self.player.id).last_seen, touched)
+
+    def test_removed_player_token_is_rejected(self):
+        token = issue_player_token(self.player)
+        self.player.delete()
+        self.assertEqual(self._guess(HTTP_X_PLAYER_TOKEN=token).status_code, 403)
+
+
+class DirtyFieldsTests(TestCase):
+    def test_save_writes_only_changed_columns(self):
+        Room.objects.create(id='DIRTY001', creator_telegram_id='c')
+        room = Room.objects.get(id='DIRTY001')
+        with self.assertNumQueries(0):
+            room.save()
+
+        room.mark_word_used(3)
+        with CaptureQueriesContext(connection) as queries:
+            room.save()
+        sql = queries[0]['sql']
+        self.assertIn('words_used', sql)
+        self.assertIn('last_activity', sql)
+        self.assertNotIn('words_skipped_count', sql)
+        self.assertNotIn('creator_telegram_id', sql)
+
+        with self.assertNumQueries(0):
+            room.save()
+        self.assertTrue(Room.objects.get(id='DIRTY001').is_word_used(3))
+
+    def test_reset_game_uses_one_team_update(self):
+        room = Room.objects.create(creator_telegram_id='c', status='playing', current_round=3)
+        for i in range(4):
+            Team.objects.create(room=room, name=f'T{i}', index=i, score=i)
+        room = Room.objects.get(id=room.id)
+        with self.assertNumQueries(2):
+            room.reset_game()
+        self.assertEqual(Room.objects.get(id=room.id).status, 'waiting')
+        self.assertFalse(Team.objects.filter(room=room).exclude(score=0).exists())
+
+
+class PlayerCounterTests(TestCase):
+    def _counts(self, room, *teams):
+        room.refresh_from_db()
+        return [room.player_count] + [Team.objects.get(id=t.id).player_count for t in teams]
+
+    def test_counters_follow_join_team_change_and_leave(self):
+        room = Room.objects.create(creator_telegram_id='c')
+        a = Team.objects.create(room=room, name='A', index=0)
+        b = Team.objects.create(room=room, name='B', index=1)
+        p1 = Player.objects.create(room=room, team=a, telegram_id='1')
+        Player.objects.create(room=room, telegram_id='2')
+        self.assertEqual(self._counts(room, a, b), [2, 1, 0])
+
+        p1 = Player.objects.get(id=p1.id)
+        p1.team = b
+        p1.save(update_fields=['team'])
+        self.assertEqual(self._counts(room, a, b), [2, 0, 1])
+
+        p1.delete()
+        self.assertEqual(self._counts(room, a, b), [1, 0, 0])
+
+    def test_counters_follow_move_to_another_room(self):
+        room, other = Room.objects.create(creator_telegram_id='c'), Room.objects.create(creator_telegram_id='d')
+        a = Team.objects.create(room=room, name='A', index=0)
+        c = Team.objects.create(room=other, name='C', index=0)
+        player = Player.objects.create(room=room, team=a, telegram_id='1')
+
+        player = Player.objects.get(id=player.id)
+        player.room, player.team = other, c  # Так сохраняет форма админки
+        player.save()
+        self.assertEqual(self._counts(room, a) + self._counts(other, c), [0, 0, 1, 1])
+        self.assertEqual(recount_players(), {'rooms': 0, 'teams': 0})
+
+    def test_full_room_save_keeps_counter(self):
+        room = Room.objects.create(creator_telegram_id='c')
+        stale = Room.objects.get(id=room.id)
+        Player.objects.create(room=room, telegram_id='1')
+        stale.current_round = 2
+        stale.save()
+        self.assertEqual(self._counts(room), [1])
+
+    def test_recount_fixes_drift(self):
+        room = Room.objects.create(creator_telegram_id='c')
+        team = Team.objects.create(room=room, name='A', index=0)
+        Player.objects.bulk_create([Player(room=room, team=team, telegram_id=str(i)) for i in range(3)])
+        self.assertEqual(recount_players([room.id]), {'rooms': 1, 'teams': 1})
+        self.assertEqual(self._counts(room, team), [3, 3])
+        self.assertEqual(recount_players(), {'rooms': 0, 'teams': 0})
+
+
+class QueryPlanTests(TestCase):
+    def test_detects_full_scans(self):
+        self.assertEqual(full_scans('3 0 0 SCAN game_room', 'sqlite'), ['game_room'])
+        self.assertEqual(full_scans('2 0 0 SCAN TABLE game_player', 'sqlite'), ['game_player'])
+        self.assertEqual(full_scans('3 0 0 SCAN game_room USING COVERING INDEX idx', 'sqlite'), [])
+        self.assertEqual(full_scans('3 0 0 SEARCH game_room USING INDEX idx (created_at<?)', 'sqlite'), [])
+        self.assertEqual(full_scans('Seq Scan on game_player  (cost=0.00..1.01 rows=1 width=4)', 'postgresql'),
+                         ['game_player'])
+        mysql_plan = json.dumps({'query_block': {'nested_loop': [
+            {'table': {'table_name': 'game_room', 'access_type': 'range'}},
+            {'table': {'table_name': 'game_player', 'access_type': 'ALL'}},
+        ]}})
+        self.assertEqual(full_scans(mysql_plan, 'mysql'), ['game_player'])
+
+    def test_hot_queries_use_indexes(self):
+        for name, plan, scans in check_hot_queries():
+            with self.subTest(query=name):
+                self.assertEqual(scans, [], plan)
+
+
+class DbPoolTests(TestCase):
+    def _pool(self, **kwargs):
+        options = {'max_size': 2, 'timeout': 0.05, 'max_lifetime': 600, **kwargs}
+        return ConnectionPool(**options)
+
+    def test_reuses_connections_and_bounds_size(self):
+        pool = self._pool()
+        first = pool.checkout(lambda: sqlite3.connect(':memory:'))
+        second = pool.checkout(lambda: sqlite3.connect(':memory:'))
+        with self.assertRaises(TimeoutError):
+            pool.checkout(lambda: sqlite3.connect(':memory:'))
+        pool.checkin(first)
+        self.assertIs(pool.checkout(lambda: sqlite3.connect(':memory:')), first)
+        pool.checkin(second, discard=True)
+        stats = pool.stats()
+        self.assertEqual((stats['opened'], stats['closed'], stats['size'], stats['timeouts']), (2, 1, 1, 1))
+        self.assertEqual(stats['waits'], 0)  # Время ожидания до таймаута не считается ожиданием выдачи
+
+    def test_waiter_gets_returned_connection(self):
+        pool = self._pool(max_size=1, timeout=2)
+        conn = pool.checkout(lambda: sqlite3.connect(':memory:', check_same_thread=False))
+        threading.Timer(0.05, pool.checkin, args=(conn,)).start()
+        self.assertIs(pool.checkout(lambda: sqlite3.connect(':memory:')), conn)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_expired_connection_is_replaced(self):
+        pool = self._pool(max_lifetime=0)
+        conn = pool.checkout(lambda: sqlite3.connect(':memory:'))
+        pool.checkin(conn)
+        self.assertIsNot(pool.checkout(lambda: sqlite3.connect(':memory:')), conn)
+        self.assertEqual(pool.stats()['closed'], 1)
+
+    def test_sqlite_backend_returns_connection_to_pool(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            settings_dict = {
+                **connection.settings_dict,
+                'ENGINE': 'game.backends.sqlite3',
+                'NAME': os.path.join(tmp, 'pool.sqlite3'),
+                'CONN_MAX_AGE': 0,
+                'OPTIONS': {'pool': {'max_size': 2, 'timeout': 1, 'max_lifetime': 600}},
+            }
+            handler = ConnectionHandler({'default': connection.settings_dict, 'pool_test': settings_dict})
+            try:
+                db = handler['pool_test']
+                for _ in range(3):
+                    with db.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    db.close()
+                self.assertEqual(describe_pool(db.pool)['opened'], 1)
+                self.assertEqual(describe_pool(db.pool)['checkouts'], 3)
+            finally:
+                close_pool('pool_test')
+                handler.close_all()
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _settings(self, **kwargs):
+        return override_settings(PROFILING_ENABLED=True, PROFILING_DIR=self.tmp.name, PROFILING_TOKEN='secret',
+                                 PROFILING_SAMPLE_RATE=0, **kwargs)
+
+    def _profiles(self):
+        return sorted(name for name in os.listdir(self.tmp.name) if name.endswith(('.folded', '.prof')))
+
+    def test_disabled_middleware_is_removed(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: None)
+
+    def test_token_profiles_request_and_report_merges_stacks(self):
+        with self._settings(PROFILING_MODE='sampler', PROFILING_SAMPLER_INTERVAL_MS=1):
+            self.client.get('/create/', HTTP_X_PROFILE_TOKEN='wrong')
+            self.assertEqual(self._profiles(), [])
+            self.client.get('/create/', HTTP_X_PROFILE_TOKEN='secret')
+            self.client.get('/create/', HTTP_X_PROFILE_TOKEN='secret')
+            profiles = self._profiles()
+            self.assertEqual(len(profiles), 2)
+            self.assertTrue(all(name.startswith('create_room.') for name in profiles))
+
+            out = io.StringIO()
+            call_command('profile_report', dir=self.tmp.name, stdout=out)
+        self.assertIn('create_room: профилей 2', out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, 'report', 'create_room.folded')))
+
+    def test_cprofile_mode_and_rotation(self):
+        with self._settings(PROFILING_MODE='cprofile', PROFILING_MAX_FILES=2):
+            for _ in range(3):
+                self.client.get('/create/', HTTP_X_PROFILE_TOKEN='secret')
+                time.sleep(0.01)  # Разное время изменения файлов для ротации
+            self.assertEqual(len(self._profiles()), 2)
+            out = io.StringIO()
+            call_command('profile_report', dir=self.tmp.name, endpoint='create_room', stdout=out)
+        self.assertIn('cumulative', out.getvalue())
+
+
+class TrafficCaptureTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _record_session(self):
+        with override_settings(TRAFFIC_CAPTURE_ENABLED=True, TRAFFIC_CAPTURE_DIR=self.tmp.name,
+                               RATE_LIMIT_ENABLED=False):
+            try:
+                creator = {'tg_user_id': 'alice-42', 'tg_username': 'alice'}
+                room_id = self.client.post('/create/post/', {**creator, 'num_teams': 2}).json()['room_id']
+                self.client.post('/join/post/', {'room_id': room_id, 'tg_user_id': 'bob-7', 'tg_username': 'bob'})
+                teams = list(Team.objects.filter(room_id=room_id).order_by('index'))
+                self.client.post(f'/room/{room_id}/select_team/', {**creator, 'team_id': teams[0].id})
+                self.client.post(f'/room/{room_id}/select_team/', {'tg_user_id': 'bob-7', 'team_id': teams[1].id})
+                self.client.get(f'/room/{room_id}/state/', {'tg_user_id': 'bob-7'})
+            finally:
+                close_capture_writer()  # Дописать очередь на диск
+        return room_id
+
+    def test_capture_is_anonymized(self):
+        room_id = self._record_session()
+        raw = ''.join(open(path, encoding='utf-8').read() for path in glob.glob(os.path.join(self.tmp.name, '*.jsonl')))
+        for secret in (room_id, 'alice-42', 'bob-7', 'alice', 'player_token'):
+            self.assertNotIn(secret, raw)
+
+        entries = read_capture(glob.glob(os.path.join(self.tmp.name, '*.jsonl')))
+        self.assertEqual([e['e'] for e in entries],
+                         ['create_room_post', 'join_room_post', 'select_team', 'select_team', 'get_game_state'])
+        self.assertEqual(entries[0]['o']['room_id'], entries[1]['p']['room_id'])
+        self.assertEqual([e['p']['team_index'] for e in entries[2:4]], [0, 1])
+        self.assertEqual(entries[0]['p']['tg_username'], 'xxxxx')
+
+    def test_replay_recreates_rooms_and_teams(self):
+        self._record_session()
+        entries = read_capture(glob.glob(os.path.join(self.tmp.name, '*.jsonl')))
+        with override_settings(RATE_LIMIT_ENABLED=False):
+            results, _ = ReplayCommand()._replay(entries, lanes=1, speed=1000)
+        self.assertEqual([r['status'] for r in results], [200] * len(entries))
+        self.assertEqual(Room.objects.count(), 2)
+        replayed = Room.objects.order_by('-created_at').first()
+        self.assertEqual(sorted(Team.objects.filter(room=replayed).values_list('player_count', flat=True)), [1, 1])
+
+
+class StressTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_advance_turn_only_from_expected_turn(self):
+        room = make_room(players_per_team=2)
+        turn = room.turn
+        self.assertTrue(Room.objects.get(id=room.id).advance_turn(expected_turn=turn))
+        # Второе завершение того же хода (вторая вкладка, таймер) ничего не меняет
+        self.assertFalse(Room.objects.get(id=room.id).advance_turn(expected_turn=turn))
+        self.assertEqual(Room.objects.get(id=room.id).turn, next_turn(room))
+
+    def test_consecutive_timer_ends_each_advance(self):
+        room = make_room(teams=1)  # Один игрок объясняет каждый ход, проверка объясняющего не мешает
+        room = start_round(room, expired=True)
+        url = f'/room/{room.id}/end_round_timer/'
+        self.assertEqual(self.client.post(url, {'tg_user_id': 'p0-0'}).status_code, 200)
+        start_round(room, expired=True)
+        self.assertEqual(self.client.post(url, {'tg_user_id': 'p0-0'}).status_code, 200)
+        self.assertEqual(Room.objects.get(id=room.id).current_round, 3)
+
+    def test_concurrent_invariants(self):
+        # Потокам нужна файловая БД с ожиданием блокировок, поэтому - отдельным процессом
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'stress_game', '--threads', '4', '--rooms', '2',
+             '--rounds', '2', '--actions', '50'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=300,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('Инварианты соблюдены', result.stdout)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class AdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('ops', 'ops@example.com', 'secret'))
+
+    def _create_rooms(self, count, status='playing'):
+        rooms = []
+        for i in range(count):
+            room = Room.objects.create(creator_telegram_id=f'c{i}', status=status, current_round=3)
+            for index in range(2):
+                team = Team.objects.create(room=room, name=f'T{index}', index=index, score=5)
+                Player.objects.create(room=room, team=team, telegram_id=f'{room.id}-{index}', telegram_username='u')
+            rooms.append(room)
+        return rooms
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [q['sql'] for q in queries.captured_queries]
+
+    def test_changelists_do_not_query_per_row(self):
+        self._create_rooms(2)
+        for model in ('room', 'team', 'player'):
+            url = f'/admin/game/{model}/'
+            few = len(self._queries(url))
+            self._create_rooms(10)
+            with self.subTest(model=model):
+                self.assertEqual(len(self._queries(url)), few)
+
+    def test_large_table_count_is_estimated(self):
+        self._create_rooms(3)
+        self.assertIsNone(estimate_table_rows(Room))  # Без ANALYZE - точный COUNT
+        Room.objects.filter(id=Room.objects.order_by('id').values('id')[:1]).delete()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimate_table_rows(Room), 2)  # Удаленная комната не считается
+        with override_settings(ADMIN_EXACT_COUNT_THRESHOLD=2):
+            queries = self._queries('/admin/game/room/')
+            self.assertFalse([sql for sql in queries if 'COUNT(' in sql and 'game_room' in sql])
+            # С фильтром - точный подсчет, но с LIMIT
+            with override_settings(ADMIN_FILTERED_COUNT_LIMIT=2):
+                response = self.client.get('/admin/game/room/', {'status__exact': 'playing'})
+            self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_bulk_actions_are_set_based(self):
+        rooms = self._create_rooms(6)
+        url = '/admin/game/room/'
+
+        def run(action, selected):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(url, {'action': action, '_selected_action': [room.id for room in selected]})
+            return len(queries.captured_queries)
+
+        self.assertEqual(run('reset_rooms', rooms[:2]), run('reset_rooms', rooms))
+        self.assertFalse(Room.objects.exclude(status='waiting').exists())
+        self.assertFalse(Team.objects.exclude(score=0).exists())
+
+        self.assertEqual(run('finish_rooms', rooms[:2]), run('finish_rooms', rooms[2:]))
+        self.assertEqual(Room.objects.filter(status='finished').count(), 6)
+
+        run('purge_rooms', rooms[:4])
+        self.assertEqual(Room.objects.count(), 2)
+        self.assertEqual(Team.objects.count(), 4)
+        self.assertEqual(Player.objects.count(), 4)
+
+    def test_remove_players_keeps_counters(self):
+        room = self._create_rooms(1)[0]
+        player = Player.objects.filter(room=room).first()
+        self.client.post('/admin/game/player/', {'action': 'remove_players', '_selected_action': [player.id]})
+        self.assertEqual(Room.objects.get(id=room.id).player_count, 1)
+        self.assertEqual(recount_players(), {'rooms': 0, 'teams': 0})
+
+
+class QueryBudgetTests(TestCase):
+    """Бюджет запросов к БД для каждого URL из game/urls.py на комнатах разного размера.
+
+    Кэши перед каждым замером очищаются - считается холодный путь, как у первого
+    клиента после смены хода. Бюджет один для всех размеров: рост числа запросов
+    с размером комнаты - это N+1. Отчет пишется в файл из QUERY_BUDGET_REPORT.
+    """
+
+    ROOM_SIZES = [(2, 2), (4, 20)]  # (команд, игроков в команде)
+    # Внутри TestCase atomic() дает SAVEPOINT/RELEASE - они тоже входят в бюджет
+    QUERY_BUDGETS = {
+        'index': 0,
+        'create_room': 0,
+        'create_room_post': 7,
+        'upload_word_pack': 4,
+        'join_room': 0,
+        'join_room_post': 8,
+        'set_web_identity': 0,
+        'room_detail': 3,
+        'spectate_room': 0,
+        'get_game_state': 4,
+        'spectate_state': 3,
+        'team_players': 2,
+        'archived_game': 1,
+        'update_team_name': 5,
+        'select_team': 8,
+        'start_game': 8,
+        'start_round': 8,
+        'guess_word': 10,
+        'skip_word': 10,
+        'word_actions': 10,
+        'end_round_timer': 12,
+        'reset_game': 6,
+    }
+    # Время зависит от машины: проверяется только по QUERY_BUDGET_TIMINGS=1 и с большим запасом
+    TIME_BUDGETS_MS = {'advance_turn': 100, 'handle_word_action': 150}
+    WORDS = '\n'.join(f'слово{i}' for i in range(20))
+
+    report = []
+
+    @classmethod
+    def tearDownClass(cls):
+        path = os.environ.get('QUERY_BUDGET_REPORT')
+        if path and cls.report:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"{'endpoint':<20} {'room':>6} {'value':>8} {'budget':>8}\n")
+                for name, size, value, budget in cls.report:
+                    f.write(f'{name:<20} {size:>6} {value:>8} {budget:>8}\n')
+        super().tearDownClass()
+
+    def _make_room(self, num_teams, per_team, **fields):
+        fields.setdefault('status', 'playing')
+        room = Room.objects.create(
+            creator_telegram_id='p0_0', num_teams=num_teams,
+            is_large_room=num_teams * per_team > settings.MAX_PLAYERS_PER_ROOM, **fields,
+        )
+        teams = Team.objects.bulk_create([Team(room=room, name=f'T{t}', index=t) for t in range(num_teams)])
+        Player.objects.bulk_create([
+            Player(room=room, team=teams[t], telegram_id=f'p{t}_{i}', telegram_username=f'user{t}_{i}')
+            for t in range(num_teams) for i in range(per_team)
+        ])
+        recount_players([room.id])
+        self.explainer = Player.objects.get(room=room, telegram_id='p0_0')
+        return room
+
+    def _scenarios(self, num_teams, per_team):
+        """(url_name, setup, ожидаемый статус); setup готовит комнату и возвращает (method, path, data)."""
+        make = lambda **fields: self._make_room(num_teams, per_team, **fields)
+        me = {'tg_user_id': 'p0_0', 'tg_username': 'user0_0'}
+
+        def playing_round():
+            return make(current_word='слово', round_start_time=timezone.now())
+
+        def archived():
+            room = make(status='finished')
+            room_id = room.id
+            archive_room(room)
+            return room_id
+
+        def expired_round():
+            return make(current_word='слово', round_start_time=timezone.now() - timedelta(seconds=settings.ROUND_DURATION_SECONDS))
+
+        return [
+            ('index', lambda: ('get', '/', me), 200),
+            ('create_room', lambda: ('get', '/create/', me), 200),
+            ('create_room_post', lambda: ('post', '/create/post/', {**me, 'num_teams': num_teams}), 200),
+            ('upload_word_pack', lambda: ('post', '/word_packs/upload/', {**me, 'words': self.WORDS}), 200),
+            ('join_room', lambda: ('get', '/join/', me), 200),
+            ('join_room_post', lambda: ('post', '/join/post/', {'room_id': make(status='waiting').id, 'tg_user_id': 'new'}), 200),
+            ('set_web_identity', lambda: ('post', '/set_identity/', {'web_username': 'alice'}), 302),
+            ('room_detail', lambda: ('get', f'/room/{make().id}/', me), 200),
+            ('spectate_room', lambda: ('get', f'/room/{make().id}/spectate/', {}), 200),
+            ('get_game_state', lambda: ('get', f'/room/{playing_round().id}/state/', me), 200),
+            ('spectate_state', lambda: ('get', f'/room/{make().id}/spectate/state/', {}), 200),
+            ('team_players', lambda: ('get', f'/room/{make().id}/team/{self.explainer.team_id}/players/', {}), 200),
+            ('archived_game', lambda: ('get', f'/room/{archived()}/archive/', {}), 200),
+            ('update_team_name', lambda: ('post', f'/room/{make().id}/update_team_name/',
+                                          {**me, 'team_id': self.explainer.team_id, 'new_name': 'Новое имя'}), 200),
+            ('select_team', lambda: ('post', f'/room/{make(status="waiting").id}/select_team/',
+                                     {**me, 'team_id': self.explainer.team_id}), 200),
+            ('start_game', lambda: ('post', f'/room/{make(status="waiting").id}/start_game/', me), 200),
+            ('start_round', lambda: ('post', f'/room/{make().id}/start_round/', me), 200),
+            ('guess_word', lambda: ('post', f'/room/{playing_round().id}/guessed/', me), 200),
+            ('skip_word', lambda: ('post', f'/room/{playing_round().id}/skip/', me), 200),
+            ('word_actions', lambda: ('post', f'/room/{playing_round().id}/actions/', {**me, 'actions': json.dumps(
+                [{'seq': 1, 'action': 'guessed'}, {'seq': 2, 'action': 'skip'}, {'seq': 3, 'action': 'guessed'}]
+            )}), 200),
+            ('end_round_timer', lambda: ('post', f'/room/{expired_round().id}/end_round_timer/', me), 200),
+            ('reset_game', lambda: ('post', f'/room/{make().id}/reset_game/', me), 200),
+        ]
+
+    def test_every_endpoint_has_a_budget(self):
+        self.assertEqual(set(self.QUERY_BUDGETS), {pattern.name for pattern in urlpatterns})
+        self.assertEqual(set(self.QUERY_BUDGETS), {name for name, _, _ in self._scenarios(2, 2)})
+
+    def test_query_budgets(self):
+        for num_teams, per_team in self.ROOM_SIZES:
+            size = f'{num_teams}x{per_team}'
+            for url_name, setup, expected_status in self._scenarios(num_teams, per_team):
+                self.explainer = None
+                method, path, data = setup()
+                cache.clear()
+                caches[settings.IDEMPOTENCY_CACHE].clear()
+                headers = {'HTTP_X_PLAYER_TOKEN': issue_player_token(self.explainer)} if self.explainer else {}
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(self.client, method)(path, data, **headers)
+                budget = self.QUERY_BUDGETS[url_name]
+                self.report.append((url_name, size, len(queries), budget))
+                with self.subTest(endpoint=url_name, room=size):
+                    self.assertEqual(response.status_code, expected_status, response.content[:200])
+                    self.assertLessEqual(len(queries), budget, '\n'.join(q['sql'] for q in queries.captured_queries))
+
+    def _mean_ms(self, func, setup, iterations=20):
+        elapsed = 0
+        for _ in range(iterations):
+            setup()
+            started = time.perf_counter()
+            func()
+            elapsed += time.perf_counter() - started
+        return elapsed / iterations * 1000
+
+    @unittest.skipUnless(os.environ.get('QUERY_BUDGET_TIMINGS'), 'QUERY_BUDGET_TIMINGS не задан')
+    def test_time_budgets(self):
+        num_teams, per_team = self.ROOM_SIZES[-1]
+        room = self._make_room(num_teams, per_team, current_word='слово', round_start_time=timezone.now())
+        token = issue_player_token(self.explainer)
+
+        def reset_turn():
+            Room.objects.filter(id=room.id).update(current_team_index=0, current_explainer_index_in_team=0,
+                                                   is_ending_round=False, current_word='слово')
+            cache.clear()
+
+        timings = {
+            'advance_turn': self._mean_ms(lambda: Room.objects.get(id=room.id).advance_turn(), reset_turn),
+            'handle_word_action': self._mean_ms(
+                lambda: self.client.post(f'/room/{room.id}/guessed/', {'tg_user_id': 'p0_0'}, HTTP_X_PLAYER_TOKEN=token),
+                reset_turn,
+            ),
+        }
+        for name, mean_ms in timings.items():
+            budget = self.TIME_BUDGETS_MS[name]
+            self.report.append((f'{name} ms', f'{num_teams}x{per_team}', f'{mean_ms:.2f}', budget))
+            with self.subTest(operation=name):
+                self.assertLessEqual(mean_ms, budget)
@@ -0,0 +1,80 @@
+# game/tokens.py
+"""Подписанные токены игрока: комната и игрок без поиска игрока по telegram_id на каждый запрос.
+
+Команды в токене нет: ее меняют и без этого клиента (вторая вкладка, админка, повторный вход),
+поэтому она всегда читается из строки игрока.
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from .models import Player
+
+PLAYER_TOKEN_SALT = 'game.player-token'
+
+
+class PlayerIdentity:
+    """Игрок, от имени которого выполняется запрос (из токена или из БД)."""
+
+    __slots__ = ('room_id', 'player_id', 'telegram_id', 'team_id')
+
+    def __init__(self, room_id, player_id, telegram_id, team_id):
+        self.room_id = room_id
+        self.player_id = player_id
+        self.telegram_id = telegram_id
+        self.team_id = team_id
+
+    @classmethod
+    def from_player(cls, player):
+        return cls(player.room_id, player.id, player.telegram_id, player.team_id)
+
+
+def issue_player_token(player):
+    return signing.TimestampSigner(salt=PLAYER_TOKEN_SALT).sign_object({
+        'r': player.room_id,
+        'p': player.id,
+        'u': player.telegram_id,
+    })
+
+
+def read_player_token(token, room_id, telegram_id):
+    """PlayerIdentity из токена или None, если подпись неверна, срок истек или токен чужой."""
+    try:
+        data = signing.TimestampSigner(salt=PLAYER_TOKEN_SALT).unsign_object(
+            token, max_age=settings.PLAYER_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:  # включая SignatureExpired
+        return None
+    if data.get('r') != room_id or data.get('u') != telegram_id:
+        return None
+    return PlayerIdentity(data['r'], data['p'], data['u'], None)
+
+
+def resolve_player(request, room, telegram_id):
+    """Игрок комнаты для запроса и отметка его активности.
+
+    С действующим токеном (заголовок X-Player-Token или поле player_token) это чтение
+    команды по первичному ключу, которое заодно подтверждает, что игрока не удалили;
+    last_seen обновляется не чаще раза в PLAYER_TOUCH_INTERVAL_SECONDS. Без токена -
+    поиск по telegram_id, как раньше. Возвращает PlayerIdentity или None.
+    """
+    token = request.headers.get('X-Player-Token') or request.POST.get('player_token')
+    if token:
+        identity = read_player_token(token, room.id, telegram_id)
+        if identity is not None:
+            row = Player.objects.filter(id=identity.player_id, room_id=room.id).values_list('team_id', 'last_seen').first()
+            if row is None:
+                return None
+            identity.team_id, last_seen = row
+            now = timezone.now()
+            if last_seen < now - timedelta(seconds=settings.PLAYER_TOUCH_INTERVAL_SECONDS):
+                Player.objects.filter(id=identity.player_id).update(last_seen=now)
+            return identity
+
+    player = Player.objects.filter(room=room, telegram_id=telegram_id).first()
+    if player is None:
+        return None
+    player.touch()
+    return PlayerIdentity.from_player(player)
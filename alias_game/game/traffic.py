@@ -0,0 +1,191 @@
+# game/traffic.py
+"""Запись трафика игры для воспроизведения нагрузки (manage.py replay_traffic).
+
+TrafficCaptureMiddleware включается настройкой TRAFFIC_CAPTURE_ENABLED (иначе
+MiddlewareNotUsed) и пишет каждый запрос строкой JSON в TRAFFIC_CAPTURE_DIR:
+эндпоинт, время, длительность, статус и параметры. Идентификаторы (пользователь,
+комната, набор слов) заменяются псевдонимами HMAC - одинаковыми в пределах
+захвата, но необратимыми без TRAFFIC_CAPTURE_SALT; имена и тексты заменяются
+строками той же длины, токены и ключи идемпотентности не пишутся. Команда
+указывается номером (index), а не id - id в новой БД будут другими.
+
+Строки пишет отдельный поток (log_queue.AsyncRotatingFileHandler), у каждого
+процесса свой файл capture-<pid>.jsonl.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .log_queue import AsyncRotatingFileHandler
+from .middleware import get_client_key
+from .models import Team
+from .responses import dumps
+
+ID_FIELDS = ('room_id', 'word_pack_id')
+TEXT_FIELDS = ('tg_username', 'new_name', 'name', 'web_username')
+DROP_FIELDS = ('tg_user_id', 'player_token', 'idempotency_key', 'initData', 'csrfmiddlewaretoken',
+               'next', 'redirect_to')
+RESPONSE_ID_ENDPOINTS = ('create_room_post', 'upload_word_pack')
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def pseudonym(value):
+    key = (settings.TRAFFIC_CAPTURE_SALT or settings.SECRET_KEY).encode('utf-8')
+    return hmac.new(key, str(value).encode('utf-8'), hashlib.sha256).hexdigest()[:12]
+
+
+def room_sampled(room_pseudonym):
+    """Комнаты попадают в захват целиком: решение зависит только от псевдонима комнаты."""
+    return int(room_pseudonym[:8], 16) / 0xFFFFFFFF < settings.TRAFFIC_CAPTURE_ROOM_RATE
+
+
+def _team_index(team_id):
+    try:
+        return Team.objects.filter(id=int(team_id)).values_list('index', flat=True).first()
+    except (TypeError, ValueError):
+        return None
+
+
+def anonymize_params(params):
+    """Параметры запроса без персональных данных; team_id заменяется номером команды."""
+    result = {}
+    for key, value in params.items():
+        if key in DROP_FIELDS:
+            continue
+        if key in ID_FIELDS:
+            result[key] = pseudonym(value) if value else value
+        elif key in TEXT_FIELDS:
+            result[key] = 'x' * len(value)
+        elif key == 'team_id':
+            result['team_index'] = _team_index(value)
+        elif key == 'words':
+            result['words'] = len([line for line in value.splitlines() if line.strip()])
+        elif key == 'actions':
+            try:
+                actions = json.loads(value)
+                result['actions'] = [{'seq': a.get('seq'), 'action': a.get('action')} for a in actions]
+            except (ValueError, TypeError, AttributeError):
+                result['actions'] = []
+        else:
+            result[key] = value
+    return result
+
+
+def get_capture_writer():
+    """Логгер захвата процесса с собственным файлом и потоком записи."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            directory = Path(settings.TRAFFIC_CAPTURE_DIR)
+            handler = AsyncRotatingFileHandler(
+                str(directory / f'capture-{os.getpid()}.jsonl'),
+                maxBytes=settings.TRAFFIC_CAPTURE_MAX_BYTES,
+                backupCount=settings.TRAFFIC_CAPTURE_BACKUP_COUNT,
+            )
+            for target in handler.listener.handlers:
+                target.setFormatter(logging.Formatter('%(message)s'))  # Строка уже в JSON
+            _writer = logging.getLogger('game.traffic.capture')
+            _writer.handlers = [handler]
+            _writer.setLevel(logging.INFO)
+            _writer.propagate = False
+        return _writer
+
+
+def close_capture_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            for handler in _writer.handlers:
+                handler.close()
+            _writer.handlers = []
+            _writer = None
+
+
+def build_entry(request, response, started, duration_ms):
+    """Запись о запросе или None, если запрос не из захватываемой комнаты."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    kwargs = {key: value for key, value in match.kwargs.items() if key in ('room_id', 'team_id')}
+    params = request.POST if request.method == 'POST' else {}
+    entry = {
+        'ts': round(started * 1000, 1),
+        'm': request.method,
+        'e': match.url_name,
+        'u': pseudonym(get_client_key(request)),
+        's': response.status_code,
+        'd': round(duration_ms, 1),
+    }
+    if 'room_id' in kwargs:
+        entry['kw'] = {'room_id': pseudonym(kwargs['room_id'])}
+    if 'team_id' in kwargs:
+        entry.setdefault('kw', {})['team_index'] = _team_index(kwargs['team_id'])
+    query = anonymize_params(request.GET.dict())
+    if query:
+        entry['q'] = query
+    body = anonymize_params(params.dict()) if params else {}
+    if body:
+        entry['p'] = body
+    if request.headers.get('Idempotency-Key') or params.get('idempotency_key'):
+        entry['k'] = 1
+
+    if match.url_name in RESPONSE_ID_ENDPOINTS and response.get('Content-Type', '').startswith('application/json'):
+        try:
+            data = json.loads(response.content)
+        except ValueError:
+            data = {}
+        created = {key: pseudonym(data[key]) for key in ID_FIELDS if data.get(key)}
+        if created:
+            entry['o'] = created
+
+    room = (entry.get('kw') or {}).get('room_id') or body.get('room_id') or (entry.get('o') or {}).get('room_id')
+    if room and not room_sampled(room):
+        return None
+    return entry
+
+
+class TrafficCaptureMiddleware:
+    """Пишет запросы к игре в JSONL. Стоит после сжатия ответов, чтобы видеть JSON как есть."""
+
+    def __init__(self, get_response):
+        if not settings.TRAFFIC_CAPTURE_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.writer = get_capture_writer()
+
+    def __call__(self, request):
+        started = time.time()
+        clock = time.perf_counter()
+        response = self.get_response(request)
+        duration_ms = (time.perf_counter() - clock) * 1000
+        try:
+            entry = build_entry(request, response, started, duration_ms)
+        except Exception as e:  # Запись трафика не должна ломать запрос
+            logging.getLogger(__name__).warning("Traffic capture failed: %s", e)
+            entry = None
+        if entry is not None:
+            self.writer.info(dumps(entry).decode('utf-8'))
+        return response
+
+
+def read_capture(paths):
+    """Записи из файлов захвата (в том числе ротированных), по времени."""
+    entries = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry['ts'])
+    return entries
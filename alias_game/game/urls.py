@@ -7,19 +7,25 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('create/', views.create_room, name='create_room'),
     path('create/post/', views.create_room_post, name='create_room_post'),
+    path('word_packs/upload/', views.upload_word_pack, name='upload_word_pack'),
     path('join/', views.join_room, name='join_room'),
     path('join/post/', views.join_room_post, name='join_room_post'),
     path('set_identity/', views.set_web_identity, name='set_web_identity'),
     path('room/<str:room_id>/', views.room_detail, name='room_detail'),
+    path('room/<str:room_id>/spectate/', views.spectate_room, name='spectate_room'),
     
     # AJAX API для игры
     path('room/<str:room_id>/state/', views.get_game_state, name='get_game_state'),
+    path('room/<str:room_id>/spectate/state/', views.spectate_state, name='spectate_state'),
+    path('room/<str:room_id>/team/<int:team_id>/players/', views.team_players, name='team_players'),
+    path('room/<str:room_id>/archive/', views.archived_game, name='archived_game'),
     path('room/<str:room_id>/update_team_name/', views.update_team_name, name='update_team_name'),
     path('room/<str:room_id>/select_team/', views.select_team, name='select_team'),
     path('room/<str:room_id>/start_game/', views.start_game, name='start_game'),
     path('room/<str:room_id>/start_round/', views.start_round, name='start_round'),
     path('room/<str:room_id>/guessed/', views.handle_word_action, {'action': 'guessed'}, name='guess_word'),
     path('room/<str:room_id>/skip/', views.handle_word_action, {'action': 'skip'}, name='skip_word'),
+    path('room/<str:room_id>/actions/', views.word_actions_batch, name='word_actions'),
     path('room/<str:room_id>/end_round_timer/', views.end_round_timer, name='end_round_timer'),
     path('room/<str:room_id>/reset_game/', views.reset_game, name='reset_game'),
 ]
\ No newline at end of file
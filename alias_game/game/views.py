@@ -5,20 +5,26 @@ import uuid
 import re
 import urllib.parse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified
 from django.views.decorators.http import require_POST, require_GET
 from django.utils import timezone
 from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction, DatabaseError
 from django.views.decorators.csrf import csrf_exempt
-import random
 import logging
-from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
 
-from .models import Room, Team, Player
-from .words import WORDS
+from .models import Room, Team, Player, WordPack
+from .responses import FastJsonResponse
+from .wordpacks import create_word_pack, mark_played, pick_unused_word, WordPackError
+from .archive import get_archived_game
+from .snapshots import current_explainer_id, get_room_snapshot, get_spectator_snapshot, invalidate_turn_state
+from .tokens import issue_player_token, resolve_player
+from .tasks import finish_room
+
+FINISH_ROOM_DEDUP_SECONDS = 60  # Если задача не записала победу, через минуту ее поставят снова
 
 # --- Helper function for getting Telegram User Info ---
 def get_telegram_user_info(request):
@@ -48,7 +54,7 @@ def get_telegram_user_info(request):
                 username = urllib.parse.unquote(cookie_username)
             except Exception:
                 username = cookie_username
-                logger.warning(f"Failed to decode cookie username: {cookie_username}")
+                logger.warning("Failed to decode cookie username: %s", cookie_username)
 
     # 3) JSON body
     if (not user_id or not username) and request.content_type and 'application/json' in request.content_type:
@@ -64,7 +70,7 @@ def get_telegram_user_info(request):
                     user_id = user_id or data.get('tg_user_id') or data.get('user_id')
                     username = username or data.get('tg_username') or data.get('username') or data.get('first_name')
         except Exception as e:
-            logger.error(f"Error parsing JSON body: {e}")
+            logger.error("Error parsing JSON body: %s", e)
 
     # 4) initData string
     if (not user_id or not username) and (request.POST.get('initData') or request.GET.get('initData')):
@@ -76,7 +82,7 @@ def get_telegram_user_info(request):
                 user_id = user_id or user_data.get('id')
                 username = username or user_data.get('username') or user_data.get('first_name')
         except Exception as e:
-            logger.error(f"Error parsing initData: {e}")
+            logger.error("Error parsing initData: %s", e)
 
     # Normalize types
     if user_id is not None:
@@ -84,7 +90,7 @@ def get_telegram_user_info(request):
             user_id = str(user_id)
         except Exception:
             user_id = None
-            logger.error(f"Failed to convert user_id to string: {user_id}")
+            logger.error("Failed to convert user_id to string: %s", user_id)
 
     if username is None and user_id is not None:
         username = f"Игрок_{user_id[-4:]}" if len(user_id) >= 4 else f"Игрок_{user_id}"
@@ -106,6 +112,30 @@ def fetch_room_by_str(room_id_str):
         return None
 
 
+def compute_next_poll_ms(room, time_remaining):
+    """Подсказка клиенту, через сколько миллисекунд снова запросить состояние комнаты."""
+    intervals = settings.POLL_INTERVALS_MS
+    idle_seconds = 0
+    if room.last_activity:
+        idle_seconds = (timezone.now() - room.last_activity).total_seconds()
+    is_idle = idle_seconds > settings.POLL_IDLE_AFTER_SECONDS
+
+    if room.status == 'finished':
+        return intervals['finished']
+    if room.status == 'playing':
+        if room.round_start_time and time_remaining > 0:
+            if time_remaining <= settings.POLL_ROUND_ENDING_SECONDS:
+                return intervals['round_ending']
+            # Не спим дольше, чем осталось до фазы завершения раунда
+            until_ending_ms = (time_remaining - settings.POLL_ROUND_ENDING_SECONDS) * 1000
+            return max(intervals['round_ending'], min(intervals['round_active'], until_ending_ms))
+        if room.round_start_time:
+            # Время вышло, ждем завершения раунда
+            return intervals['round_ending']
+        return intervals['lobby_idle'] if is_idle else intervals['turn_waiting']
+    return intervals['lobby_idle'] if is_idle else intervals['lobby_active']
+
+
 # --- Основные страницы ---
 
 @require_GET
@@ -117,27 +147,38 @@ def index(request):
 @require_GET
 def create_room(request):
     telegram_user_info = get_telegram_user_info(request)
-    return render(request, 'game/create_room.html', {'telegram_user_info': telegram_user_info})
+    return render(request, 'game/create_room.html', {
+        'telegram_user_info': telegram_user_info,
+        'MAX_TEAMS_PER_ROOM': settings.MAX_TEAMS_PER_ROOM,
+        'LARGE_ROOM_MAX_TEAMS': settings.LARGE_ROOM_MAX_TEAMS,
+        'LARGE_ROOM_MAX_PLAYERS': settings.LARGE_ROOM_MAX_PLAYERS,
+    })
 
 
 @require_POST
 def create_room_post(request):
     telegram_user_info = get_telegram_user_info(request)
     if not telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
 
     try:
         num_teams = int(request.POST.get('num_teams', 2))
         winning_score = int(request.POST.get('winning_score', 50))
         difficulty = request.POST.get('difficulty', 'medium')
         penalty_for_skip = request.POST.get('penalty_for_skip') == 'on'
+        is_large_room = request.POST.get('large_room') == 'on'
 
-        if not (2 <= num_teams <= 4):
-            return JsonResponse({'status': 'error', 'message': 'Количество команд должно быть от 2 до 4.'}, status=400)
+        max_teams = settings.LARGE_ROOM_MAX_TEAMS if is_large_room else settings.MAX_TEAMS_PER_ROOM
+        if not (2 <= num_teams <= max_teams):
+            return FastJsonResponse({'status': 'error', 'message': f'Количество команд должно быть от 2 до {max_teams}.'}, status=400)
         if winning_score < 10 or winning_score > 1000:
-            return JsonResponse({'status': 'error', 'message': 'Очки для победы должны быть от 10 до 1000.'}, status=400)
+            return FastJsonResponse({'status': 'error', 'message': 'Очки для победы должны быть от 10 до 1000.'}, status=400)
         if difficulty not in dict(Room.DIFFICULTY_CHOICES):
-            return JsonResponse({'status': 'error', 'message': 'Недопустимый уровень сложности.'}, status=400)
+            return FastJsonResponse({'status': 'error', 'message': 'Недопустимый уровень сложности.'}, status=400)
+
+        word_pack_id = request.POST.get('word_pack_id') or None
+        if word_pack_id and not WordPack.objects.filter(id=word_pack_id).exists():
+            return FastJsonResponse({'status': 'error', 'message': 'Набор слов не найден.'}, status=400)
 
         with transaction.atomic():
             room = Room.objects.create(
@@ -147,11 +188,12 @@ def create_room_post(request):
                 winning_score=winning_score,
                 difficulty=difficulty,
                 penalty_for_skip=penalty_for_skip,
+                is_large_room=is_large_room,
+                word_pack_id=word_pack_id,
                 status='waiting'
             )
 
-            for i in range(num_teams):
-                Team.objects.create(room=room, name=f"Команда {i+1}", index=i)
+            Team.objects.bulk_create([Team(room=room, name=f"Команда {i+1}", index=i) for i in range(num_teams)])
             
             # Создатель комнаты автоматически присоединяется
             player = Player.objects.create(
@@ -160,16 +202,51 @@ def create_room_post(request):
                 telegram_username=telegram_user_info['username']
             )
             
-            logger.info(f"Room {room.id} created by {telegram_user_info['username']}")
+            logger.info("Room %s created by %s", room.id, telegram_user_info['username'])
 
-        return JsonResponse({'status': 'success', 'room_id': str(room.id)})
+        return FastJsonResponse({'status': 'success', 'room_id': str(room.id), 'player_token': issue_player_token(player)})
     
     except DatabaseError as e:
-        logger.error(f"Database error creating room: {e}")
-        return JsonResponse({'status': 'error', 'message': 'Ошибка базы данных при создании комнаты.'}, status=500)
+        logger.error("Database error creating room: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': 'Ошибка базы данных при создании комнаты.'}, status=500)
     except Exception as e:
-        logger.error(f"Error creating room: {e}")
-        return JsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+        logger.error("Error creating room: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+
+
+@require_POST
+def upload_word_pack(request):
+    """Загрузка своего набора слов: файл `file` или поле `words`, слова через перевод строки или запятую."""
+    telegram_user_info = get_telegram_user_info(request)
+    if not telegram_user_info['id']:
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+
+    name = request.POST.get('name', '').strip()[:100] or 'Свой набор'
+    upload = request.FILES.get('file')
+    try:
+        if upload:
+            if upload.size > settings.WORD_PACK_MAX_BYTES:
+                return FastJsonResponse({'status': 'error', 'message': 'Файл со словами слишком большой.'}, status=400)
+            raw_text = upload.read().decode('utf-8-sig')
+        else:
+            raw_text = request.POST.get('words', '')
+        pack, created = create_word_pack(name, telegram_user_info['id'], raw_text)
+    except UnicodeDecodeError:
+        return FastJsonResponse({'status': 'error', 'message': 'Файл должен быть в кодировке UTF-8.'}, status=400)
+    except WordPackError as e:
+        return FastJsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except DatabaseError as e:
+        logger.error("Database error uploading word pack: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': 'Ошибка базы данных при сохранении набора слов.'}, status=500)
+
+    logger.info("Word pack %s uploaded by %s (%s words, new=%s)", pack.id, telegram_user_info['username'], pack.word_count, created)
+    return FastJsonResponse({
+        'status': 'success',
+        'word_pack_id': pack.id,
+        'name': pack.name,
+        'word_count': pack.word_count,
+        'reused': not created,
+    })
 
 
 @require_GET
@@ -182,51 +259,50 @@ def join_room(request):
 def join_room_post(request):
     telegram_user_info = get_telegram_user_info(request)
     if not telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
 
     room_id = request.POST.get('room_id')
     if not room_id:
-        return JsonResponse({'status': 'error', 'message': 'Не указан ID комнаты.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Не указан ID комнаты.'}, status=400)
 
     room = fetch_room_by_str(room_id)
     if not room:
-        return JsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
     
     if room.status == 'finished':
-        return JsonResponse({'status': 'error', 'message': 'Игра в этой комнате уже завершена.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Игра в этой комнате уже завершена.'}, status=400)
     
-    if room.player_set.count() >= 20:  # Максимум 20 игроков в комнате
-        return JsonResponse({'status': 'error', 'message': 'В комнате достигнут лимит игроков.'}, status=400)
-
     try:
         with transaction.atomic():
-            player, created = Player.objects.get_or_create(
-                room=room,
-                telegram_id=telegram_user_info['id'],
-                defaults={
-                    'telegram_username': telegram_user_info['username']
-                }
-            )
-            
-            if not created:
+            # Лимит проверяется под блокировкой комнаты: параллельные входы не проходят его вдвоем
+            room = Room.objects.select_for_update().get(id=room.id)
+            player = Player.objects.filter(room=room, telegram_id=telegram_user_info['id']).first()
+            if player is None:
+                if room.player_count >= room.max_players:
+                    return FastJsonResponse({'status': 'error', 'message': 'В комнате достигнут лимит игроков.'}, status=400)
+                player = Player.objects.create(
+                    room=room,
+                    telegram_id=telegram_user_info['id'],
+                    telegram_username=telegram_user_info['username'],
+                )
+            else:
                 # Обновляем имя и активность существующего игрока
                 player.telegram_username = telegram_user_info['username']
-                player.touch()
-                player.save()
+                player.save()  # Пишет только last_seen и имя, если оно сменилось
             
             # Обновляем активность комнаты
             room.last_activity = timezone.now()
             room.save(update_fields=['last_activity'])
             
-            logger.info(f"Player {telegram_user_info['username']} joined room {room.id}")
+            logger.info("Player %s joined room %s", telegram_user_info['username'], room.id)
 
-        return JsonResponse({'status': 'success', 'room_id': str(room.id)})
+        return FastJsonResponse({'status': 'success', 'room_id': str(room.id), 'player_token': issue_player_token(player)})
     except DatabaseError as e:
-        logger.error(f"Database error joining room: {e}")
-        return JsonResponse({'status': 'error', 'message': 'Ошибка базы данных при присоединении к комнате.'}, status=500)
+        logger.error("Database error joining room: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': 'Ошибка базы данных при присоединении к комнате.'}, status=500)
     except Exception as e:
-        logger.error(f"Error joining room: {e}")
-        return JsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+        logger.error("Error joining room: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
 
 
 @require_GET
@@ -237,7 +313,10 @@ def room_detail(request, room_id):
 
     room = fetch_room_by_str(room_id)
     if not room:
-        return render(request, 'game/room_not_found.html', {'room_id': room_id})
+        return render(request, 'game/room_not_found.html', {
+            'room_id': room_id,
+            'archived_game': get_archived_game(room_id),
+        })
     
     # Проверяем, что игрок находится в комнате
     try:
@@ -253,6 +332,7 @@ def room_detail(request, room_id):
         'room': room,
         'player': player,
         'is_creator': is_creator,
+        'player_token': issue_player_token(player),
         'telegram_user_info': telegram_user_info,
         'ROUND_DURATION_SECONDS': settings.ROUND_DURATION_SECONDS
     }
@@ -265,126 +345,128 @@ def room_detail(request, room_id):
 def get_game_state(request, room_id):
     telegram_user_info = get_telegram_user_info(request)
     if not telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
     
-    # Кэшируем состояние на 1 секунду
-    cache_key = f'room_state_{room_id}_{telegram_user_info["id"]}'
-    cached_state = cache.get(cache_key)
+    room = fetch_room_by_str(room_id)
+    if not room:
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+    
+    player = resolve_player(request, room, telegram_user_info['id'])  # Заодно обновляет активность игрока
+    if player is None:
+        return FastJsonResponse({'status': 'error', 'message': 'Вы не находитесь в этой комнате.'}, status=403)
+
+    # Общая для всех часть состояния: составы, счет, текущий ход (один расчет на версию комнаты)
+    snapshot = get_room_snapshot(room)
+
+    if room.status == 'playing' and snapshot['winning_team_name']:
+        # Победа уже видна по счету - ответ не ждет записи статуса в БД. До ее записи комнату
+        # опрашивают все игроки, а в очередь ставится одна задача (на процесс без общего кэша)
+        if cache.add(f'finish_room:{room.id}', True, FINISH_ROOM_DEDUP_SECONDS):
+            finish_room.delay(room.id)
+        room.status = 'finished'
+        snapshot['status'] = room.status
+
+    my_team_id = str(player.team_id) if player.team_id else None
+    response_data = dict(snapshot)
+    response_data.update({
+        'is_current_explainer': snapshot['current_explainer_id'] == player.player_id,
+        'current_word': room.current_word,
+        'action_seq': room.last_action_seq,
+        'my_player_id': player.player_id,
+        'my_team_id': my_team_id,
+        'player_has_team': my_team_id is not None,  # True если у игрока есть команда
+        'player_team_name': next((t['name'] for t in snapshot['teams'] if t['id'] == my_team_id), None),
+        'next_poll_ms': compute_next_poll_ms(room, snapshot['time_remaining']),
+    })
     
-    if cached_state and not request.GET.get('force', False):
-        # Проверяем, не изменилось ли состояние
-        room = fetch_room_by_str(room_id)
-        if room and room.last_activity and cached_state.get('last_activity'):
-            if room.last_activity.isoformat() == cached_state['last_activity']:
-                return JsonResponse(cached_state)
+    return FastJsonResponse(response_data)
+
 
+@require_GET
+def spectate_room(request, room_id):
+    """Страница зрителя: только просмотр, без входа в комнату."""
+    return render(request, 'game/spectate.html', {
+        'room_id': room_id,
+        'ROUND_DURATION_SECONDS': settings.ROUND_DURATION_SECONDS,
+    })
+
+
+@require_GET
+def spectate_state(request, room_id):
+    """Состояние комнаты для зрителей: одинаковые байты для всех, без игрока и запросов на зрителя."""
+    snapshot = get_spectator_snapshot(str(room_id).strip())
+    if snapshot is None:
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+
+    etag, body = snapshot
+    # После сжатия ETag становится слабым (W/"...") - сравниваем без префикса
+    if request.headers.get('If-None-Match', '').removeprefix('W/') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={settings.SPECTATOR_SNAPSHOT_TTL}'
+    return response
+
+
+@require_GET
+def team_players(request, room_id, team_id):
+    """Постраничный состав команды (для больших комнат, где в состоянии только начало списка)."""
     room = fetch_room_by_str(room_id)
     if not room:
-        return JsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
-    
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+
     try:
-        player = Player.objects.get(room=room, telegram_id=telegram_user_info['id'])
-        player.touch()  # Обновляем активность игрока
-    except Player.DoesNotExist:
-        return JsonResponse({'status': 'error', 'message': 'Вы не находитесь в этой комнате.'}, status=403)
-
-    # Очищаем неактивных игроков (старше 2 часов)
-    room.cleanup_inactive_players(hours=2)
-
-    teams_data = []
-    for team in room.team_set.all().order_by('index'):
-        players_in_team = [{'id': p.id, 'telegram_username': p.telegram_username} 
-                          for p in team.player_set.all().order_by('id')]
-        teams_data.append({
-            'id': str(team.id),
-            'name': team.name,
-            'score': team.score,
-            'players': players_in_team
-        })
-    
-    current_team = room.get_current_team()
-    current_explainer = room.get_current_explainer()
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    page_size = settings.ROSTER_PAGE_SIZE
+    offset = (page - 1) * page_size
+
+    players = list(
+        Player.objects.filter(room=room, team_id=team_id)
+        .order_by('id')
+        .values('id', 'telegram_username')[offset:offset + page_size + 1]
+    )
+    return FastJsonResponse({
+        'status': 'success',
+        'page': page,
+        'players': players[:page_size],
+        'has_next': len(players) > page_size,
+    })
 
-    is_current_explainer = (current_explainer and current_explainer.id == player.id)
-    
-    time_remaining = 0
-    if room.status == 'playing' and room.round_start_time:
-        elapsed_time = (timezone.now() - room.round_start_time).total_seconds()
-        time_remaining = max(0, settings.ROUND_DURATION_SECONDS - int(elapsed_time))
-        # Отладочная информация
-        logger.debug(f"Room {room.id}: elapsed={elapsed_time:.1f}s, remaining={time_remaining}s")
 
-    game_finished = False
-    winning_team_name = None
-    if room.status == 'playing':
-        for team in room.team_set.all():
-            if team.score >= room.winning_score:
-                with transaction.atomic():
-                    room = Room.objects.select_for_update().get(id=room.id)
-                    room.status = 'finished'
-                    room.save()
-                game_finished = True
-                winning_team_name = team.name
-                break
-    elif room.status == 'finished':
-        game_finished = True
-        winning_team = room.team_set.filter(score__gte=room.winning_score).first()
-        if winning_team:
-            winning_team_name = winning_team.name
-
-    response_data = {
-        'status': room.status,
-        'game_finished': game_finished,
-        'winning_team_name': winning_team_name,
-        'room_id': str(room.id),
-        'creator_username': room.creator_telegram_username,
-        'difficulty': room.get_difficulty_display(),
-        'num_teams': room.num_teams,
-        'winning_score': room.winning_score,
-        'penalty_for_skip': room.penalty_for_skip,
-        'current_round': room.current_round,
-        'current_team_name': current_team.name if current_team else 'N/A',
-        'current_explainer_username': current_explainer.telegram_username if current_explainer else 'N/A',
-        'is_current_explainer': is_current_explainer,
-        'current_word': room.current_word,
-        'time_remaining': time_remaining,
-        'teams': teams_data,
-        'my_player_id': player.id,
-        'my_team_id': str(player.team.id) if player.team else None,
-        'players_in_room_count': room.player_set.count(),
-        'server_time': timezone.now().isoformat(),# Для синхронизации времени
-        'player_has_team': bool(player.team),  # True если у игрока есть команда
-        'player_team_name': player.team.name if player.team else None
-    }
-    
-    # Кэшируем результат
-    cache.set(cache_key, response_data, timeout=1)
-    
-    return JsonResponse(response_data)
+@require_GET
+def archived_game(request, room_id):
+    """Итоги завершенной игры из архива."""
+    payload = get_archived_game(room_id)
+    if payload is None:
+        return FastJsonResponse({'status': 'error', 'message': 'Архив игры не найден.'}, status=404)
+    return FastJsonResponse({'status': 'success', 'game': payload})
 
 
 @require_POST
 def update_team_name(request, room_id):
     telegram_user_info = get_telegram_user_info(request)
     if not telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
     
     room = fetch_room_by_str(room_id)
     if not room:
-        return JsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
     
     # Только создатель комнаты может менять названия команд
     if room.creator_telegram_id != telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Только создатель комнаты может изменять названия команд.'}, status=403)
+        return FastJsonResponse({'status': 'error', 'message': 'Только создатель комнаты может изменять названия команд.'}, status=403)
 
     team_id = request.POST.get('team_id')
     new_name = request.POST.get('new_name', '').strip()
 
     if not team_id:
-        return JsonResponse({'status': 'error', 'message': 'Не указан ID команды.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Не указан ID команды.'}, status=400)
     
     if not new_name or len(new_name) < 2 or len(new_name) > 50:
-        return JsonResponse({'status': 'error', 'message': 'Название команды должно быть от 2 до 50 символов.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Название команды должно быть от 2 до 50 символов.'}, status=400)
 
     try:
         with transaction.atomic():
@@ -392,59 +474,65 @@ def update_team_name(request, room_id):
             team.name = new_name
             team.save()
             
-            logger.info(f"Team {team_id} renamed to '{new_name}' in room {room.id}")
+            logger.info("Team %s renamed to '%s' in room %s", team_id, new_name, room.id)
             
-        return JsonResponse({'status': 'success', 'new_name': new_name})
+        return FastJsonResponse({'status': 'success', 'new_name': new_name})
     except Team.DoesNotExist:
-        return JsonResponse({'status': 'error', 'message': 'Команда не найдена.'}, status=404)
+        return FastJsonResponse({'status': 'error', 'message': 'Команда не найдена.'}, status=404)
     except DatabaseError as e:
-        logger.error(f"Database error updating team name: {e}")
-        return JsonResponse({'status': 'error', 'message': 'Ошибка базы данных при обновлении названия команды.'}, status=500)
+        logger.error("Database error updating team name: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': 'Ошибка базы данных при обновлении названия команды.'}, status=500)
     except Exception as e:
-        logger.error(f"Error updating team name: {e}")
-        return JsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+        logger.error("Error updating team name: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
 
 
 @require_POST
 def select_team(request, room_id):
     telegram_user_info = get_telegram_user_info(request)
     if not telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
 
     room = fetch_room_by_str(room_id)
     if not room:
-        return JsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
     
-    try:
-        player = Player.objects.get(room=room, telegram_id=telegram_user_info['id'])
-    except Player.DoesNotExist:
-        return JsonResponse({'status': 'error', 'message': 'Вы не находитесь в этой комнате.'}, status=403)
+    player = resolve_player(request, room, telegram_user_info['id'])
+    if player is None:
+        return FastJsonResponse({'status': 'error', 'message': 'Вы не находитесь в этой комнате.'}, status=403)
 
     if room.status != 'waiting':
-        return JsonResponse({'status': 'error', 'message': 'Нельзя менять команду после начала игры.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Нельзя менять команду после начала игры.'}, status=400)
 
     team_id = request.POST.get('team_id')
     if not team_id:
-        return JsonResponse({'status': 'error', 'message': 'Не указан ID команды.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Не указан ID команды.'}, status=400)
 
     try:
         with transaction.atomic():
             team = get_object_or_404(Team, room=room, id=team_id)
+            player = Player.objects.get(id=player.player_id)
             player.team = team
-            player.touch()
-            player.save()
-            
-            logger.info(f"Player {telegram_user_info['username']} joined team '{team.name}' in room {room.id}")
+            player.save(update_fields=['team'])
+
+            # Выбор команд - активность лобби: остальные опрашивают чаще (compute_next_poll_ms)
+            room.last_activity = timezone.now()
+            room.save(update_fields=['last_activity'])
             
-        return JsonResponse({'status': 'success', 'team_name': team.name})
+            logger.info("Player %s joined team '%s' in room %s", telegram_user_info['username'], team.name, room.id)
+
+        # Состав команды изменился без сохранения комнаты
+        invalidate_turn_state([room.id])
+        # Команда зашита в токен - выдаем новый
+        return FastJsonResponse({'status': 'success', 'team_name': team.name, 'player_token': issue_player_token(player)})
     except Team.DoesNotExist:
-        return JsonResponse({'status': 'error', 'message': 'Команда не найдена.'}, status=404)
+        return FastJsonResponse({'status': 'error', 'message': 'Команда не найдена.'}, status=404)
     except DatabaseError as e:
-        logger.error(f"Database error selecting team: {e}")
-        return JsonResponse({'status': 'error', 'message': 'Ошибка базы данных при выборе команды.'}, status=500)
+        logger.error("Database error selecting team: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': 'Ошибка базы данных при выборе команды.'}, status=500)
     except Exception as e:
-        logger.error(f"Error selecting team: {e}")
-        return JsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+        logger.error("Error selecting team: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
 
 
 @require_POST
@@ -454,10 +542,10 @@ def set_web_identity(request):
     next_url = request.POST.get('next') or request.POST.get('redirect_to') or request.META.get('HTTP_REFERER') or '/'
 
     if not username:
-        return JsonResponse({'status': 'error', 'message': 'Имя пользователя не может быть пустым.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Имя пользователя не может быть пустым.'}, status=400)
     
     if len(username) < 2 or len(username) > 50:
-        return JsonResponse({'status': 'error', 'message': 'Имя пользователя должно быть от 2 до 50 символов.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Имя пользователя должно быть от 2 до 50 символов.'}, status=400)
 
     new_id = str(uuid.uuid4())
     response = redirect(next_url)
@@ -473,7 +561,7 @@ def set_web_identity(request):
     
     response.set_cookie('alias_web_username', cookie_username, max_age=max_age, samesite='Lax')
     
-    logger.info(f"Web identity set: {username} ({new_id})")
+    logger.info("Web identity set: %s (%s)", username, new_id)
     return response
 
 
@@ -481,33 +569,32 @@ def set_web_identity(request):
 def start_game(request, room_id):
     telegram_user_info = get_telegram_user_info(request)
     if not telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
 
     room = fetch_room_by_str(room_id)
     if not room:
-        return JsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
     
     # Только создатель может начать игру
     if room.creator_telegram_id != telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Только создатель комнаты может начать игру.'}, status=403)
+        return FastJsonResponse({'status': 'error', 'message': 'Только создатель комнаты может начать игру.'}, status=403)
     
     if room.status != 'waiting':
-        return JsonResponse({'status': 'error', 'message': 'Игра уже началась или завершена.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Игра уже началась или завершена.'}, status=400)
     
     # Проверка, что во всех командах есть хотя бы 1 игрок
-    teams_with_players = sum(1 for team in room.team_set.all() if team.player_set.count() > 0)
+    teams_with_players = room.team_set.filter(player_count__gt=0).count()
     if teams_with_players < room.num_teams:
-        return JsonResponse({'status': 'error', 'message': 'Во всех командах должен быть хотя бы один игрок.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Во всех командах должен быть хотя бы один игрок.'}, status=400)
     
     # Проверка минимального количества игроков
-    total_players = room.player_set.count()
+    total_players = room.player_count
     if total_players < 2:
-        return JsonResponse({'status': 'error', 'message': 'Для начала игры нужно минимум 2 игрока.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Для начала игры нужно минимум 2 игрока.'}, status=400)
     
-    players_without_team = room.player_set.filter(team__isnull=True)
-    if players_without_team.exists():
-        player_names = [p.telegram_username for p in players_without_team]
-        return JsonResponse({
+    player_names = list(room.player_set.filter(team__isnull=True).values_list('telegram_username', flat=True))
+    if player_names:
+        return FastJsonResponse({
             'status': 'error', 
             'message': f'Некоторые игроки не выбрали команду: {", ".join(player_names)}'
         }, status=400)
@@ -519,7 +606,7 @@ def start_game(request, room_id):
             errors.append(error)
 
     if errors:
-        return JsonResponse({
+        return FastJsonResponse({
             'status': 'error', 
             'message': 'Нельзя начать игру пока все игроки не выберут команду:\n' + '\n'.join(errors)
         }, status=400)
@@ -533,182 +620,280 @@ def start_game(request, room_id):
             room.current_explainer_index_in_team = 0
             room.save()
             
-            logger.info(f"Game started in room {room.id}")
+            logger.info("Game started in room %s", room.id)
             
-        return JsonResponse({'status': 'success'})
+        return FastJsonResponse({'status': 'success'})
     except DatabaseError as e:
-        logger.error(f"Database error starting game: {e}")
-        return JsonResponse({'status': 'error', 'message': 'Ошибка базы данных при начале игры.'}, status=500)
+        logger.error("Database error starting game: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': 'Ошибка базы данных при начале игры.'}, status=500)
     except Exception as e:
-        logger.error(f"Error starting game: {e}")
-        return JsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+        logger.error("Error starting game: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
 
 
 @require_POST
 def start_round(request, room_id):
     telegram_user_info = get_telegram_user_info(request)
     if not telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
 
     room = fetch_room_by_str(room_id)
     if not room:
-        return JsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
     
-    try:
-        player = Player.objects.get(room=room, telegram_id=telegram_user_info['id'])
-        player.touch()
-    except Player.DoesNotExist:
-        return JsonResponse({'status': 'error', 'message': 'Вы не находитесь в этой комнате.'}, status=403)
+    player = resolve_player(request, room, telegram_user_info['id'])
+    if player is None:
+        return FastJsonResponse({'status': 'error', 'message': 'Вы не находитесь в этой комнате.'}, status=403)
 
-    current_explainer = room.get_current_explainer()
-    if not current_explainer or current_explainer.id != player.id:
-        return JsonResponse({'status': 'error', 'message': 'Сейчас не ваш ход объяснять.'}, status=403)
+    if current_explainer_id(room) != player.player_id:
+        return FastJsonResponse({'status': 'error', 'message': 'Сейчас не ваш ход объяснять.'}, status=403)
 
     if room.status != 'playing':
-        return JsonResponse({'status': 'error', 'message': 'Игра не в активном состоянии.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Игра не в активном состоянии.'}, status=400)
 
     # Если слово уже есть, значит раунд уже стартовал
     if room.current_word and room.round_start_time:
-         return JsonResponse({'status': 'error', 'message': 'Раунд уже начался.'}, status=400)
+         return FastJsonResponse({'status': 'error', 'message': 'Раунд уже начался.'}, status=400)
 
     try:
         with transaction.atomic():
             room = Room.objects.select_for_update().get(id=room.id)
             
             # Выбираем случайное слово
-            available_words = [w for w in WORDS[room.difficulty] 
-                             if w not in room.words_in_round_guessed + room.words_in_round_skipped]
+            new_word = pick_unused_word(room)
             
-            if not available_words:
-                # Если слова закончились, очищаем списки и берем из общего
-                room.words_in_round_guessed = []
-                room.words_in_round_skipped = []
-                available_words = WORDS[room.difficulty]
+            if new_word is None:
+                # Если слова закончились, очищаем отметки и берем из общего
+                room.reset_word_usage()
+                new_word = pick_unused_word(room)
             
-            if not available_words:
-                return JsonResponse({'status': 'error', 'message': 'Нет доступных слов для игры.'}, status=500)
+            if new_word is None:
+                return FastJsonResponse({'status': 'error', 'message': 'Нет доступных слов для игры.'}, status=500)
             
-            new_word = random.choice(available_words)
             room.current_word = new_word
             room.round_start_time = timezone.now()
             room.last_activity = timezone.now()
             room.save()
             
-            logger.info(f"Round started in room {room.id}, word: {new_word}")
+            logger.info("Round started in room %s, word: %s", room.id, new_word)
             
-        return JsonResponse({'status': 'success', 'word': new_word})
+        return FastJsonResponse({'status': 'success', 'word': new_word})
     except DatabaseError as e:
-        logger.error(f"Database error starting round: {e}")
-        return JsonResponse({'status': 'error', 'message': 'Ошибка базы данных при начале раунда.'}, status=500)
+        logger.error("Database error starting round: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': 'Ошибка базы данных при начале раунда.'}, status=500)
     except Exception as e:
-        logger.error(f"Error starting round: {e}")
-        return JsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+        logger.error("Error starting round: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+
+
+WORD_ACTIONS = ('guessed', 'skip')
+
+
+def apply_word_action(room, team, action):
+    """Применить действие к заблокированным комнате и команде в памяти (сохраняет вызывающий).
+
+    Возвращает 'game_over', 'next_turn' (слова закончились) или None, если выдано новое слово.
+    """
+    if action == 'guessed':
+        team.score += 1
+        mark_played(room, room.current_word, guessed=True)
+        logger.info("Word guessed: %s in room %s", room.current_word, room.id)
+    else:
+        if room.penalty_for_skip:
+            team.score = max(0, team.score - 1)
+        mark_played(room, room.current_word, guessed=False)
+        logger.info("Word skipped: %s in room %s", room.current_word, room.id)
+
+    room.current_word = None
+    room.last_activity = timezone.now()
+
+    # Проверка на победу
+    if team.score >= room.winning_score:
+        room.status = 'finished'
+        return 'game_over'
+
+    # Выбираем новое слово
+    room.current_word = pick_unused_word(room)
+    return None if room.current_word else 'next_turn'
 
 
 @require_POST
 def handle_word_action(request, room_id, action):
     telegram_user_info = get_telegram_user_info(request)
     if not telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
 
     room = fetch_room_by_str(room_id)
     if not room:
-        return JsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
     
-    try:
-        player = Player.objects.get(room=room, telegram_id=telegram_user_info['id'])
-        player.touch()
-    except Player.DoesNotExist:
-        return JsonResponse({'status': 'error', 'message': 'Вы не находитесь в этой комнате.'}, status=403)
+    player = resolve_player(request, room, telegram_user_info['id'])
+    if player is None:
+        return FastJsonResponse({'status': 'error', 'message': 'Вы не находитесь в этой комнате.'}, status=403)
 
-    current_explainer = room.get_current_explainer()
-    if not current_explainer or current_explainer.id != player.id:
-        return JsonResponse({'status': 'error', 'message': 'Сейчас не ваш ход объяснять.'}, status=403)
+    if current_explainer_id(room) != player.player_id:
+        return FastJsonResponse({'status': 'error', 'message': 'Сейчас не ваш ход объяснять.'}, status=403)
     
     if room.status != 'playing' or not room.current_word:
-        return JsonResponse({'status': 'error', 'message': 'Нет активного слова для обработки.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Нет активного слова для обработки.'}, status=400)
     
+    if action not in WORD_ACTIONS:
+        return FastJsonResponse({'status': 'error', 'message': 'Неизвестное действие.'}, status=400)
+
+    turn = room.turn
     try:
         with transaction.atomic():
             room = Room.objects.select_for_update().get(id=room.id)
-            current_team = room.get_current_team()
+
+            # Повторная проверка под блокировкой: пока ждали, ход могли сменить, а игру сбросить
+            if room.turn != turn:
+                return FastJsonResponse({'status': 'error', 'message': 'Сейчас не ваш ход объяснять.'}, status=403)
+            if room.status != 'playing' or not room.current_word:
+                return FastJsonResponse({'status': 'error', 'message': 'Нет активного слова для обработки.'}, status=400)
+
+            current_team = room.get_current_team(lock=True)
             
             if not current_team:
-                return JsonResponse({'status': 'error', 'message': 'Текущая команда не найдена.'}, status=500)
+                return FastJsonResponse({'status': 'error', 'message': 'Текущая команда не найдена.'}, status=500)
             
-            if action == 'guessed':
-                current_team.update_score(1)
-                room.words_in_round_guessed.append(room.current_word)
-                logger.info(f"Word guessed: {room.current_word} in room {room.id}")
-            elif action == 'skip':
-                if room.penalty_for_skip:
-                    current_team.update_score(-1)
-                room.words_in_round_skipped.append(room.current_word)
-                logger.info(f"Word skipped: {room.current_word} in room {room.id}")
-            else:
-                return JsonResponse({'status': 'error', 'message': 'Неизвестное действие.'}, status=400)
-            
-            room.current_word = None
-            room.last_activity = timezone.now()
+            outcome = apply_word_action(room, current_team, action)
+            current_team.save(update_fields=['score'])
             room.save()
-            
-            # Проверка на победу
-            if current_team.score >= room.winning_score:
-                room.status = 'finished'
-                room.save()
-                return JsonResponse({
-                    'status': 'success', 
-                    'game_over': True, 
-                    'winning_team': current_team.name,
-                    'winning_score': current_team.score
-                })
-            
-            # Выбираем новое слово
-            available_words = [w for w in WORDS[room.difficulty] 
-                             if w not in room.words_in_round_guessed + room.words_in_round_skipped]
-            
-            if not available_words:
-                # Если слова закончились, переходим к следующему ходу
-                room.advance_turn()
-                return JsonResponse({'status': 'success', 'next_turn': True})
-            
-            new_word = random.choice(available_words)
-            room.current_word = new_word
+
+        if outcome == 'game_over':
+            return FastJsonResponse({
+                'status': 'success', 
+                'game_over': True, 
+                'winning_team': current_team.name,
+                'winning_score': current_team.score
+            })
+        if outcome == 'next_turn':
+            # Если слова закончились, переходим к следующему ходу (если его не сменил таймер)
+            room.advance_turn(expected_turn=room.turn)
+            return FastJsonResponse({'status': 'success', 'next_turn': True})
+        return FastJsonResponse({'status': 'success', 'word': room.current_word})
+    except DatabaseError as e:
+        logger.error("Database error handling word action: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': 'Ошибка базы данных при обработке слова.'}, status=500)
+    except Exception as e:
+        logger.error("Error handling word action: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+
+
+@require_POST
+def word_actions_batch(request, room_id):
+    """Пакет действий объясняющего: actions = JSON-список [{"seq": 5, "action": "guessed", "word": "..."}, ...].
+
+    Действия применяются по порядку в одной транзакции. Номера seq не больше уже примененного
+    пропускаются, поэтому повторная отправка того же пакета безопасна. Действие с полем word,
+    не совпадающим с текущим словом, считается устаревшим (двойное нажатие) и не применяется.
+    Если ход уже закончился, оставшиеся действия возвращаются в dropped и больше не ждут повтора.
+    """
+    telegram_user_info = get_telegram_user_info(request)
+    if not telegram_user_info['id']:
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+
+    try:
+        actions = json.loads(request.POST.get('actions', ''))
+        actions = sorted(
+            ({'seq': int(a['seq']), 'action': a['action'], 'word': a.get('word')} for a in actions),
+            key=lambda a: a['seq'],
+        )
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return FastJsonResponse({'status': 'error', 'message': 'Некорректный список действий.'}, status=400)
+    if not actions or len(actions) > settings.MAX_BATCH_ACTIONS:
+        return FastJsonResponse({'status': 'error', 'message': 'Некорректный список действий.'}, status=400)
+    if any(a['action'] not in WORD_ACTIONS for a in actions):
+        return FastJsonResponse({'status': 'error', 'message': 'Неизвестное действие.'}, status=400)
+
+    room = fetch_room_by_str(room_id)
+    if not room:
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+
+    player = resolve_player(request, room, telegram_user_info['id'])
+    if player is None:
+        return FastJsonResponse({'status': 'error', 'message': 'Вы не находитесь в этой комнате.'}, status=403)
+
+    if current_explainer_id(room) != player.player_id:
+        return FastJsonResponse({'status': 'error', 'message': 'Сейчас не ваш ход объяснять.'}, status=403)
+
+    applied, stale, dropped = [], [], []
+    outcome = None
+    turn = room.turn
+    try:
+        with transaction.atomic():
+            room = Room.objects.select_for_update().get(id=room.id)
+            if room.turn != turn:
+                return FastJsonResponse({'status': 'error', 'message': 'Сейчас не ваш ход объяснять.'}, status=403)
+            current_team = room.get_current_team(lock=True)
+            if not current_team:
+                return FastJsonResponse({'status': 'error', 'message': 'Текущая команда не найдена.'}, status=500)
+
+            for item in actions:
+                if item['seq'] <= room.last_action_seq:
+                    continue  # Уже применено в предыдущей отправке
+                if room.status != 'playing' or not room.current_word:
+                    # Ход закончился: остальные действия не применяем, но отмечаем полученными,
+                    # иначе клиент будет отправлять их снова
+                    dropped = [a['seq'] for a in actions if a['seq'] > room.last_action_seq]
+                    room.last_action_seq = actions[-1]['seq']
+                    break
+                room.last_action_seq = item['seq']
+                if item['word'] is not None and item['word'] != room.current_word:
+                    stale.append(item['seq'])
+                    continue
+                outcome = apply_word_action(room, current_team, item['action'])
+                applied.append(item['seq'])
+                if outcome:
+                    break
+
+            if applied:
+                current_team.save(update_fields=['score'])
             room.save()
-            
-        return JsonResponse({'status': 'success', 'word': new_word})
+
+        if outcome == 'next_turn':
+            room.advance_turn(expected_turn=room.turn)
+        logger.info("Applied %d of %d batched actions in room %s", len(applied), len(actions), room.id)
+        return FastJsonResponse({
+            'status': 'success',
+            'applied': applied,
+            'stale': stale,
+            'dropped': dropped,
+            'last_action_seq': room.last_action_seq,
+            'word': room.current_word if not outcome else None,
+            'game_over': outcome == 'game_over',
+            'next_turn': outcome == 'next_turn',
+            'team_score': current_team.score,
+        })
     except DatabaseError as e:
-        logger.error(f"Database error handling word action: {e}")
-        return JsonResponse({'status': 'error', 'message': 'Ошибка базы данных при обработке слова.'}, status=500)
+        logger.error("Database error handling batched word actions: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': 'Ошибка базы данных при обработке слов.'}, status=500)
     except Exception as e:
-        logger.error(f"Error handling word action: {e}")
-        return JsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+        logger.error("Error handling batched word actions: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
 
 
 @require_POST
 def end_round_timer(request, room_id):
     telegram_user_info = get_telegram_user_info(request)
     if not telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
 
     room = fetch_room_by_str(room_id)
     if not room:
-        return JsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
     
     # Проверяем, что игрок в комнате
-    try:
-        player = Player.objects.get(room=room, telegram_id=telegram_user_info['id'])
-        player.touch()
-    except Player.DoesNotExist:
-        return JsonResponse({'status': 'error', 'message': 'Вы не находитесь в этой комнате.'}, status=403)
+    player = resolve_player(request, room, telegram_user_info['id'])
+    if player is None:
+        return FastJsonResponse({'status': 'error', 'message': 'Вы не находитесь в этой комнате.'}, status=403)
 
     if room.status != 'playing':
-        return JsonResponse({'status': 'error', 'message': 'Игра не в активном состоянии.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Игра не в активном состоянии.'}, status=400)
 
     # Проверяем, что это текущий объясняющий
-    current_explainer = room.get_current_explainer()
-    if not current_explainer or current_explainer.id != player.id:
-        return JsonResponse({
+    if current_explainer_id(room) != player.player_id:
+        return FastJsonResponse({
             'status': 'error', 
             'message': 'Только текущий объясняющий может завершить раунд.'
         }, status=403)
@@ -718,11 +903,12 @@ def end_round_timer(request, room_id):
         elapsed_time = (timezone.now() - room.round_start_time).total_seconds()
         # Разрешаем завершить если осталось меньше 5 секунд или уже истекло
         if elapsed_time < settings.ROUND_DURATION_SECONDS - 5:
-            return JsonResponse({
+            return FastJsonResponse({
                 'status': 'error', 
                 'message': f'Таймер еще не истек. Осталось: {int(settings.ROUND_DURATION_SECONDS - elapsed_time)}с'
             }, status=400)
     
+    turn = room.turn  # Ход, таймер которого проверили выше
     try:
         with transaction.atomic():
             # Блокируем комнату для атомарной операции
@@ -730,74 +916,61 @@ def end_round_timer(request, room_id):
             
             # Дополнительная проверка на случай race condition
             if room.status != 'playing':
-                return JsonResponse({'status': 'error', 'message': 'Игра уже завершена.'}, status=400)
+                return FastJsonResponse({'status': 'error', 'message': 'Игра уже завершена.'}, status=400)
+            # Этот ход уже завершил другой запрос (вторая вкладка, последнее слово)
+            if room.turn != turn:
+                return FastJsonResponse({'status': 'error', 'message': 'Раунд уже завершен.'}, status=400)
                 
-            # Завершаем раунд
+            # Завершаем раунд (advance_turn сам сохраняет комнату и время активности)
             room.advance_turn()
-            room.last_activity = timezone.now()
-            room.save()
             
-            logger.info(f"Round ended by timer in room {room.id} by {telegram_user_info['username']}")
+            logger.info("Round ended by timer in room %s by %s", room.id, telegram_user_info['username'])
             
-        return JsonResponse({'status': 'success', 'message': 'Раунд завершен по таймеру.'})
+        return FastJsonResponse({'status': 'success', 'message': 'Раунд завершен по таймеру.'})
     except DatabaseError as e:
-        logger.error(f"Database error ending round: {e}")
-        return JsonResponse({
+        logger.error("Database error ending round: %s", e)
+        return FastJsonResponse({
             'status': 'error', 
             'message': 'Ошибка базы данных. Попробуйте еще раз.'
         }, status=500)
     except Exception as e:
-        logger.error(f"Error ending round: {e}")
-        return JsonResponse({'status': 'error', 'message': f'Внутренняя ошибка: {str(e)}'}, status=500)
+        logger.error("Error ending round: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': f'Внутренняя ошибка: {str(e)}'}, status=500)
 
 
 @require_POST
 def reset_game(request, room_id):
     telegram_user_info = get_telegram_user_info(request)
     if not telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
+        return FastJsonResponse({'status': 'error', 'message': 'Необходимо указать идентификатор пользователя.'}, status=400)
 
     room = fetch_room_by_str(room_id)
     if not room:
-        return JsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
+        return FastJsonResponse({'status': 'error', 'message': 'Комната не найдена.'}, status=404)
     
     # Только создатель комнаты может сбросить игру
     if room.creator_telegram_id != telegram_user_info['id']:
-        return JsonResponse({'status': 'error', 'message': 'Только создатель комнаты может сбросить игру.'}, status=403)
+        return FastJsonResponse({'status': 'error', 'message': 'Только создатель комнаты может сбросить игру.'}, status=403)
     
     try:
         with transaction.atomic():
             room = Room.objects.select_for_update().get(id=room.id)
             
-            # Сброс состояния комнаты
-            room.status = 'waiting'
-            room.current_round = 0
-            room.current_team_index = 0
-            room.current_explainer_index_in_team = 0
-            room.current_word = None
-            room.round_start_time = None
-            room.words_in_round_guessed = []
-            room.words_in_round_skipped = []
-            room.last_activity = timezone.now()
-            room.save()
-            
-            # Сброс очков команд
-            for team in room.team_set.all():
-                team.score = 0
-                team.save()
+            # Сброс состояния комнаты и очков команд
+            room.reset_game()
             
-            logger.info(f"Game reset in room {room.id}")
+            logger.info("Game reset in room %s", room.id)
             
-        return JsonResponse({'status': 'success', 'message': 'Игра успешно сброшена.'})
+        return FastJsonResponse({'status': 'success', 'message': 'Игра успешно сброшена.'})
     except DatabaseError as e:
-        logger.error(f"Database error resetting game: {e}")
-        return JsonResponse({'status': 'error', 'message': 'Ошибка базы данных при сбросе игры.'}, status=500)
+        logger.error("Database error resetting game: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': 'Ошибка базы данных при сбросе игры.'}, status=500)
     except Exception as e:
-        logger.error(f"Error resetting game: {e}")
-        return JsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+        logger.error("Error resetting game: %s", e)
+        return FastJsonResponse({'status': 'error', 'message': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
     
 def validate_player_has_team(room, player):
     """Проверяет, что у игрока есть команда, и возвращает сообщение об ошибке если нет."""
-    if not player.team:
+    if player.team_id is None:
         return f"Игрок {player.telegram_username} не выбрал команду"
     return None
\ No newline at end of file
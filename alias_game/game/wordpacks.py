@@ -0,0 +1,151 @@
+# game/wordpacks.py
+
+import hashlib
+import random
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from django.conf import settings
+
+from .models import WordPack
+from .words import get_words
+
+WORD_MAX_LENGTH = 100  # Room.current_word
+_SEPARATORS = re.compile(r'[\n\r;,\t]+')
+_SPACES = re.compile(r'\s+')
+
+
+class WordPackError(ValueError):
+    pass
+
+
+def normalize_words(raw_text):
+    """Разбить текст на слова, нормализовать и убрать повторы (без учета регистра), сохранив порядок."""
+    seen = set()
+    words = []
+    for chunk in _SEPARATORS.split(raw_text):
+        word = _SPACES.sub(' ', unicodedata.normalize('NFC', chunk)).strip()
+        if not word or len(word) > WORD_MAX_LENGTH:
+            continue
+        key = word.casefold()
+        if key in seen:
+            continue
+        seen.add(key)
+        words.append(word)
+    return words
+
+
+def create_word_pack(name, creator_telegram_id, raw_text):
+    """Сохранить набор слов. Возвращает (pack, created); одинаковый набор переиспользуется."""
+    if len(raw_text.encode('utf-8')) > settings.WORD_PACK_MAX_BYTES:
+        raise WordPackError('Файл со словами слишком большой.')
+    words = normalize_words(raw_text)
+    if len(words) < settings.WORD_PACK_MIN_WORDS:
+        raise WordPackError(f'В наборе должно быть не меньше {settings.WORD_PACK_MIN_WORDS} разных слов.')
+    if len(words) > settings.WORD_PACK_MAX_WORDS:
+        raise WordPackError(f'В наборе должно быть не больше {settings.WORD_PACK_MAX_WORDS} слов.')
+
+    content_hash = hashlib.sha256('\n'.join(words).encode('utf-8')).hexdigest()
+    return WordPack.objects.get_or_create(
+        content_hash=content_hash,
+        defaults={
+            'name': name,
+            'creator_telegram_id': creator_telegram_id,
+            'word_count': len(words),
+            'data': WordPack.pack(words),
+        },
+    )
+
+
+class CompiledPack:
+    """Набор слов в памяти: кортеж для случайного выбора и индекс слово -> номер."""
+
+    __slots__ = ('words', 'index')
+
+    def __init__(self, words):
+        self.words = tuple(words)
+        self.index = {word: i for i, word in enumerate(self.words)}
+
+
+class _CompiledPackCache:
+    """LRU-кэш скомпилированных наборов по id, общий для всех комнат процесса.
+
+    Одинаковые наборы хранятся одной строкой (content_hash уникален), поэтому id
+    однозначно задает содержимое, а неизменяемый набор не нужно перечитывать.
+    """
+
+    def __init__(self):
+        self._packs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, pack_id):
+        with self._lock:
+            compiled = self._packs.get(pack_id)
+            if compiled is not None:
+                self._packs.move_to_end(pack_id)
+                return compiled
+
+        compiled = CompiledPack(WordPack.objects.get(id=pack_id).unpack())
+        with self._lock:
+            self._packs[pack_id] = compiled
+            self._packs.move_to_end(pack_id)
+            while len(self._packs) > settings.WORD_PACK_CACHE_SIZE:
+                self._packs.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._packs.clear()
+
+
+compiled_packs = _CompiledPackCache()
+
+
+@lru_cache(maxsize=None)
+def _builtin_pack(difficulty):
+    return CompiledPack(get_words(difficulty))
+
+
+def get_room_pack(room):
+    """Скомпилированный набор, из которого раздаются карточки в комнате."""
+    if room.word_pack_id:
+        try:
+            return compiled_packs.get(room.word_pack_id)
+        except WordPack.DoesNotExist:
+            pass
+    return _builtin_pack(room.difficulty)
+
+
+def get_room_words(room):
+    """Слова, из которых раздаются карточки в комнате."""
+    return get_room_pack(room).words
+
+
+def mark_played(room, word, guessed):
+    """Отметить слово сыгранным в текущем ходе (бит в Room.words_used и счетчик)."""
+    index = get_room_pack(room).index.get(word)
+    if index is not None:  # Слова нет в наборе, если набор поменялся посреди хода
+        room.mark_word_used(index)
+    if guessed:
+        room.words_guessed_count += 1
+    else:
+        room.words_skipped_count += 1
+
+
+def pick_unused_word(room, attempts=8):
+    """Случайное слово, еще не сыгранное в этом ходе, или None, если такие кончились.
+
+    Сначала несколько случайных номеров с проверкой бита - обычно хватает одной попытки;
+    перебор всех слов нужен, только когда почти весь набор уже сыгран.
+    """
+    words = get_room_pack(room).words
+    if not words:
+        return None
+    for _ in range(attempts):
+        index = random.randrange(len(words))
+        if not room.is_word_used(index):
+            return words[index]
+    unused = [i for i in range(len(words)) if not room.is_word_used(i)]
+    return words[random.choice(unused)] if unused else None
@@ -1,22 +1,25 @@
 # game/words.py
 
-WORDS = {
-    'easy': [
-        'apple', 'house', 'cat', 'sun', 'tree', 'book', 'car', 'ball', 'cup', 'shoe',
-        'dog', 'milk', 'bed', 'chair', 'moon', 'star', 'door', 'fish', 'hand', 'nose',
-        'ear', 'mouth', 'eye', 'leg', 'arm', 'foot', 'water', 'fire', 'sky', 'grass',
-        'hat', 'coat', 'sock', 'glove', 'key', 'clock', 'table', 'lamp', 'phone', 'bag'
-    ],
-    'medium': [
-        'computer', 'elephant', 'bicycle', 'guitar', 'flower', 'mountain', 'rainbow', 'umbrella', 'sandwich', 'window',
-        'glasses', 'pencil', 'camera', 'keyboard', 'telephone', 'sweater', 'diamond', 'octopus', 'pyramid', 'rocket',
-        'island', 'desert', 'forest', 'ocean', 'river', 'bridge', 'castle', 'robot', 'dragon', 'unicorn',
-        'butterfly', 'spider', 'penguin', 'giraffe', 'zebra', 'dolphin', 'whale', 'parrot', 'ostrich', 'kangaroo'
-    ],
-    'hard': [
-        'ephemeral', 'ubiquitous', 'serendipity', 'cacophony', 'eloquence', 'paradox', 'melancholy', 'quixotic', 'luminous', 'nebulous',
-        'plethora', 'benevolent', 'malevolent', 'chrysanthemum', 'onomatopoeia', 'photosynthesis', 'metamorphosis', 'extravaganza', 'philanthropy', 'chameleon',
-        'labyrinth', 'renaissance', 'silhouette', 'constellation', 'magnanimous', 'egregious', 'idiosyncrasy', 'juxtaposition', 'sophisticated', 'vicarious',
-        'xenophobia', 'zeitgeist', 'esoteric', 'capricious', 'facetious', 'gregarious', 'harbinger', 'impeccable', 'jovial', 'kudos'
-    ]
-}
+import json
+from functools import lru_cache
+from pathlib import Path
+
+WORDS_FILE = Path(__file__).resolve().parent / 'words.json'
+
+
+@lru_cache(maxsize=None)
+def load_words():
+    """Встроенные наборы слов по сложности. Файл читается при первой раздаче слова, а не при старте."""
+    with open(WORDS_FILE, encoding='utf-8') as f:
+        return {difficulty: tuple(words) for difficulty, words in json.load(f).items()}
+
+
+def get_words(difficulty):
+    return load_words()[difficulty]
+
+
+def __getattr__(name):
+    # Совместимость со старым `from game.words import WORDS`
+    if name == 'WORDS':
+        return load_words()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")